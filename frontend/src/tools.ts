@@ -9,17 +9,52 @@ if (Array.isArray(turboTas[1])) {
   turboTas[1].push(0);
 }
 
+// Default ranges, for tilesets tiled without value statistics
 const colormaps = {
-  "dju": Colormap.fromColormapDescription(turboTas , { min: 0, max: 600 }),
-  "tas": Colormap.fromColormapDescription(ColormapDescriptionLibrary.turbo , { min: -10, max: 30 }),
-  "tasmin0": Colormap.fromColormapDescription(ColormapDescriptionLibrary.turbo , { min: 0, max: 30 }),
-  "tasmax30": Colormap.fromColormapDescription(ColormapDescriptionLibrary.turbo , { min: 0, max: 30 }),
-  "rsds": Colormap.fromColormapDescription(ColormapDescriptionLibrary.turbo , { min: 0, max: 300 }),
-  "ws": Colormap.fromColormapDescription(ColormapDescriptionLibrary.turbo , { min: 0, max: 8 }),
+  "dju": { description: turboTas, range: { min: 0, max: 600 } },
+  "tas": { description: ColormapDescriptionLibrary.turbo, range: { min: -10, max: 30 } },
+  "tasmin0": { description: ColormapDescriptionLibrary.turbo, range: { min: 0, max: 30 } },
+  "tasmax30": { description: ColormapDescriptionLibrary.turbo, range: { min: 0, max: 30 } },
+  "rsds": { description: ColormapDescriptionLibrary.turbo, range: { min: 0, max: 300 } },
+  "ws": { description: ColormapDescriptionLibrary.turbo, range: { min: 0, max: 8 } },
 }
 
 let eventSub: Subscription | undefined = undefined;
 
+type ValueRange = [number, number] | null;
+
+type TilesetCatalog = {
+  version: number;
+  model: string;
+  indicators: Record<string, { months: string[]; levels: number[]; tilesets: string[]; valueRange?: ValueRange }>;
+  tilesets: Record<string, { url: string; valueRange?: ValueRange; index: MultiChannelSeriesTiledLayerSpecification }>;
+};
+
+// One catalog request per model: every tileset index of the model is in it
+const catalogs: Record<string, Promise<TilesetCatalog | null>> = {};
+
+function getCatalog(model: string): Promise<TilesetCatalog | null> {
+  if (!(model in catalogs)) {
+    catalogs[model] = fetch(`/tilesets/${model}/catalog.json`)
+      .then((response) => (response.ok ? (response.json() as Promise<TilesetCatalog>) : null))
+      .catch(() => null);
+  }
+  return catalogs[model];
+}
+
+async function getSeriesInfo(model: string, tileset: string): Promise<{ seriesInfo: MultiChannelSeriesTiledLayerSpecification, tileUrlPrefix: string }> {
+  const catalog = await getCatalog(model);
+  const entry = catalog?.tilesets[tileset];
+  if (entry) {
+    return { seriesInfo: entry.index, tileUrlPrefix: `/tilesets/${model}/${entry.url}` };
+  }
+  // Tilesets written before the catalog
+  const tileUrlPrefix = `/tilesets/${model}/${tileset}/`;
+  const seriesInfoResponse = await fetch(`${tileUrlPrefix}index.json`);
+  const seriesInfo = (await seriesInfoResponse.json()) as MultiChannelSeriesTiledLayerSpecification;
+  return { seriesInfo, tileUrlPrefix };
+}
+
 export async function addLayer() {
   // model: string, indicator: string, month:string, 
   const store = getDefaultStore();
@@ -35,11 +70,15 @@ export async function addLayer() {
     console.log(e);
   }
   
-  const tileUrlPrefix = `/tilesets/${model.toUpperCase()}/${indicator}_${month}/`;
-  const seriesInfoUrl = `${tileUrlPrefix}index.json`;  
-  const seriesInfoResponse = await fetch(seriesInfoUrl);
-  const seriesInfo = (await seriesInfoResponse.json()) as MultiChannelSeriesTiledLayerSpecification;
-  const colormap = colormaps[indicator as keyof typeof colormaps];  
+  const { seriesInfo, tileUrlPrefix } = await getSeriesInfo(model.toUpperCase(), `${indicator}_${month}`);
+  // Range of the indicator over all its months and TRACC levels, counted when tiling:
+  // the colour scale stays the same while the sliders move
+  const valueRange = (await getCatalog(model.toUpperCase()))?.indicators[indicator]?.valueRange;
+  const { description, range } = colormaps[indicator as keyof typeof colormaps];
+  const colormap = Colormap.fromColormapDescription(
+    description,
+    valueRange ? { min: valueRange[0], max: valueRange[1] } : range,
+  );
 
   colormap.createImageObjectURL()
   .then((url) => {
@@ -0,0 +1,605 @@
+"""Benchmark suite for the toolkit hot paths.
+
+Usage (from the toolkit folder):
+
+    python -m benchmarks.run                      # run everything, compare with the last run
+    python -m benchmarks.run -filter indicator    # only the cases whose name contains 'indicator'
+    python -m benchmarks.run -threshold 0.1       # fail on a >10% median slowdown
+    python -m benchmarks.run -memory -accuracy    # also record peak memory and float32 vs float64 errors
+
+Results are written to `benchmarks/results/latest.json` and appended to
+`benchmarks/results/history.jsonl`. The process exits with status 1 when a case
+is slower than the baseline (the previous run, or `-baseline`) beyond the threshold,
+or when a CLI startup case exceeds its fixed budget.
+"""
+import gc
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from functools import partial
+from typing import Callable, Dict, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from benchmarks import synthetic  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Wall time allowed for a CLI command that does not compute anything (interpreter start included)
+CLI_STARTUP_BUDGET = 0.2
+
+# name -> factory(workdir, args) returning the callable to time, or None to skip
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+class Skip(Exception):
+    pass
+
+
+def benchmark(name: str):
+    def decorator(factory: Callable) -> Callable:
+        BENCHMARKS[name] = factory
+        return factory
+
+    return decorator
+
+
+def _benchmarked_indicators():
+    from mf_toolkit.climato import list_indicators
+
+    return [
+        spec
+        for spec in list_indicators()
+        if len(spec.variables) == 1 and spec.variables[0] in synthetic.VARIABLE_RANGES
+    ]
+
+
+def _register_indicator_benchmarks():
+    from mf_toolkit.climato import compute_indicator, compute_precision
+
+    for spec in _benchmarked_indicators():
+        for dtype in ["float32", "float64"]:
+
+            def factory(workdir, args, spec=spec, dtype=dtype):
+                dataset = synthetic.daily_dataset(spec.variables[0], years=args.years)
+
+                def run():
+                    with compute_precision(dtype):
+                        return compute_indicator(spec.func, dataset, spec.variables[0]).load()
+
+                return run
+
+            suffix = "" if dtype == "float32" else f".{dtype}"
+            benchmark(f"indicator.{spec.name}{suffix}")(factory)
+
+
+def check_accuracy(args) -> dict:
+    """
+    Compare each indicator computed in float32 with the float64 reference.
+    An indicator fails when its max absolute error exceeds half its tile encoding step,
+    ie. when the difference could change an encoded pixel value.
+    """
+    import numpy as np
+    from mf_toolkit.climato import compute_indicator, compute_precision
+
+    accuracy = {}
+    for spec in _benchmarked_indicators():
+        dataset = synthetic.daily_dataset(spec.variables[0], years=args.years)
+        results = {}
+        for dtype in ["float32", "float64"]:
+            with compute_precision(dtype):
+                results[dtype] = compute_indicator(spec.func, dataset, spec.variables[0])[spec.name]
+        error = np.abs(results["float32"].astype("float64") - results["float64"])
+        tolerance = spec.encoding["value_step"] / 2
+        max_error = float(error.max())
+        accuracy[spec.name] = {
+            "max_abs_error": max_error,
+            "tolerance": tolerance,
+            "dtype": str(results["float32"].dtype),
+            "ok": max_error <= tolerance and results["float32"].dtype == np.float32,
+        }
+        print(f"accuracy.{spec.name:<31} max error {max_error:.2e} (tolerance {tolerance:g})")
+    return accuracy
+
+
+@benchmark("subdaily.hourly_to_daily")
+def _hourly_to_daily(workdir, args):
+    from mf_toolkit.climato.subdaily import hourly_to_daily
+
+    hourly_path = os.path.join(workdir, "hourly.nc")
+    synthetic.hourly_dataset("tasAdjust").to_netcdf(hourly_path)
+    daily_path = os.path.join(workdir, "daily.nc")
+    # Low cap: also measures the per-block cost of reading and appending to the file
+    return lambda: hourly_to_daily(
+        hourly_path, daily_path, thresholds={"tasAdjust": [298.15]}, max_bytes=64 * 2**20
+    )
+
+
+def _compressed_input(workdir, args) -> str:
+    path = os.path.join(workdir, "compressed.nc")
+    if not os.path.isfile(path):
+        synthetic.daily_dataset("tasAdjust", years=args.years).to_netcdf(
+            path, encoding={"tasAdjust": {"zlib": True, "shuffle": True, "chunksizes": (30, 67, 72)}}
+        )
+    return path
+
+
+@benchmark("data.tasmean.compressed")
+def _tasmean_compressed(workdir, args):
+    import xarray as xr
+    from mf_toolkit.climato import compute_indicator, get_indicator
+
+    path = _compressed_input(workdir, args)
+    spec = get_indicator("tasmean")
+
+    def run():
+        with xr.open_dataset(path) as dataset:
+            return compute_indicator(spec.func, dataset, "tasAdjust").load()
+
+    return run
+
+
+@benchmark("data.tasmean.mmap_cache")
+def _tasmean_mmap_cache(workdir, args):
+    from mf_toolkit.climato import compute_indicator, get_indicator
+    from mf_toolkit.data.mmap_cache import open_cached_dataset
+
+    path = _compressed_input(workdir, args)
+    spec = get_indicator("tasmean")
+    cache_dir = os.path.join(workdir, "mmap")
+    # Same pass as 'data.tasmean.compressed', the entry being built by the warmup run
+    return lambda: compute_indicator(spec.func, open_cached_dataset(path, cache_dir), "tasAdjust").load()
+
+
+def _private_mb() -> float:
+    """Memory of this process not shared with others (MB): what each extra worker costs."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            kb = sum(int(line.split()[1]) for line in f if line.startswith(("Private_Clean:", "Private_Dirty:")))
+        return kb / 1024
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _dataplane_task(data) -> float:
+    if isinstance(data, dict):
+        from mf_toolkit.dataplane import attach_array
+
+        data = attach_array(data)
+    # Reads every page of the array, as an indicator would
+    float(data.sum())
+    return _private_mb()
+
+
+def _dataplane(workdir, args, workers: int, shared: bool):
+    import multiprocessing
+    from mf_toolkit.dataplane import DataPlane
+
+    # Started once, before the data exists (workers inherit none of it): the timed runs
+    # measure handing the array to every worker, not forking
+    pool = multiprocessing.Pool(workers)
+    # One year of daily values (~28 MB), whatever -years: 32 pickled copies must fit in memory
+    array = synthetic.daily_dataset("tasAdjust", years=1)["tasAdjust"].values
+    plane = DataPlane()
+    payload = plane.publish_array(array) if shared else array
+
+    def run():
+        run.worker_mb = max(pool.map(_dataplane_task, [payload] * workers, chunksize=1))
+
+    def close():
+        pool.terminate()
+        plane.close()
+
+    run.close = close
+    return run
+
+
+for _workers in (8, 32):
+    benchmark(f"dataplane.pickle.{_workers}")(partial(_dataplane, workers=_workers, shared=False))
+    benchmark(f"dataplane.shared.{_workers}")(partial(_dataplane, workers=_workers, shared=True))
+
+
+@benchmark("export.export_monthly_geotiff")
+def _export_monthly_geotiff(workdir, args):
+    from mf_toolkit.data import export_monthly_geotiff
+
+    dataset = synthetic.monthly_indicator("tasmean")
+    output_dir = os.path.join(workdir, "geotiff")
+    os.makedirs(output_dir, exist_ok=True)
+    return lambda: export_monthly_geotiff(dataset, output_dir, "tasmean")
+
+
+@benchmark("tiling.encode_tile")
+def _encode_tile(workdir, args):
+    import numpy as np
+
+    try:
+        from mf_toolkit.tiling.to_web_mercator import TILE_SIZE, encode_tile
+    except ImportError as e:
+        raise Skip(str(e))
+    data = np.random.default_rng(0).normal(10, 5, (TILE_SIZE, TILE_SIZE)).astype(np.float32)
+    data[:64, :64] = np.nan
+    return lambda: encode_tile(data.copy(), float("nan"), "rg", 0.01, -20)
+
+
+@benchmark("tiling.encode_tile_webp")
+def _encode_tile_webp(workdir, args):
+    import numpy as np
+
+    try:
+        from PIL import Image
+        from mf_toolkit.tiling.to_web_mercator import TILE_SIZE, encode_tile
+    except ImportError as e:
+        raise Skip(str(e))
+    data = np.random.default_rng(0).normal(10, 5, (TILE_SIZE, TILE_SIZE)).astype(np.float32)
+    rgba = encode_tile(data, float("nan"), "rg", 0.01, -20)
+    return lambda: Image.fromarray(rgba).save(io.BytesIO(), format="webp", lossless=True)
+
+
+def _register_raster_format_benchmarks():
+    """Encode time and size of one tile per lossless format (WebP effort levels, PNG)."""
+    options = {f"webp_m{method}": ("webp", {"lossless": True, "method": method}) for method in (0, 2, 4, 6)}
+    options["png"] = ("png", {"compress_level": 6})
+    # The 4 TRACC levels of a tile packed in one 2x2 atlas (see tiling.packed)
+    options["webp_atlas4"] = ("webp", {"lossless": True, "method": 4}, 4)
+    for case, (raster_format, save_options, *frames) in options.items():
+
+        def factory(workdir, args, raster_format=raster_format, save_options=save_options, frames=frames):
+            import numpy as np
+
+            try:
+                from PIL import Image
+                from mf_toolkit.tiling.to_web_mercator import TILE_SIZE, encode_tile
+                from mf_toolkit.tiling.packed import atlas_layout, pack_frames
+            except ImportError as e:
+                raise Skip(str(e))
+            # Smooth field with some noise and a masked sea, like a bilinear-resampled indicator tile
+            yy, xx = np.mgrid[0:TILE_SIZE, 0:TILE_SIZE] / TILE_SIZE
+            noise = np.random.default_rng(0).normal(0, 0.05, xx.shape)
+            encoded = []
+            for level in range(frames[0] if frames else 1):
+                data = (10 + level + 8 * np.sin(3 * xx) * np.cos(2 * yy) + noise).astype(np.float32)
+                data[:128, :96] = np.nan
+                encoded.append(encode_tile(data, float("nan"), "rg", 0.01, -20))
+            rgba = pack_frames(encoded, atlas_layout(len(encoded))) if frames else encoded[0]
+            image = Image.fromarray(rgba)
+
+            def run():
+                buffer = io.BytesIO()
+                image.save(buffer, format=raster_format, **save_options)
+                run.tile_bytes = buffer.tell()
+
+            run()
+            return run
+
+        benchmark(f"tiling.raster_format.{case}")(factory)
+
+
+def _register_tileset_benchmarks():
+    cases = [(z, "auto") for z in range(0, 7)] + [(6, "gtiff"), (6, "vrt")]
+    for z, warp_mode in cases:
+
+        def factory(workdir, args, z=z, warp_mode=warp_mode):
+            try:
+                from osgeo import gdal  # noqa: F401
+                from mf_toolkit.tiling.to_web_mercator import create_tileset
+            except ImportError as e:
+                raise Skip(str(e))
+            input_path = os.path.join(workdir, "input.tif")
+            if not os.path.isfile(input_path):
+                synthetic.write_geotiff(input_path)
+            output = os.path.join(workdir, f"tiles_{z}_{warp_mode}")
+
+            def run():
+                shutil.rmtree(output, ignore_errors=True)
+                create_tileset(
+                    input=input_path, output=output, identifier="bench", minzoom=z, maxzoom=z,
+                    lowest_value=-20, value_step=0.01, channels="rg", keep_raw_tiles=False,
+                    meta_name="bench", meta_description="", meta_attribution="",
+                    meta_pixel_unit="°C", meta_series_axis_name="TRACC °C",
+                    meta_series_axis_unit="°C", meta_series_axis_value=2.0, warp_mode=warp_mode,
+                )
+
+            return run
+
+        # Bounded-memory reprojection modes, compared with the in-memory default at z6
+        suffix = "" if warp_mode == "auto" else f".{warp_mode}"
+        benchmark(f"tiling.create_tileset.z{z}{suffix}")(factory)
+
+
+@benchmark("data.search")
+def _search(workdir, args):
+    from mf_toolkit.data.catalog import search
+
+    catalog_dir = os.path.join(workdir, "data", "catalogs")
+    os.makedirs(catalog_dir, exist_ok=True)
+    shutil.copy(os.path.join(REPO_ROOT, "data", "catalogs", "RCM.csv"), catalog_dir)
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            return search("RCM", variable=["tasAdjust", "sfcWindAdjust"], experiment="ssp370")
+        finally:
+            os.chdir(cwd)
+
+    return run
+
+
+@benchmark("data.list_files")
+def _list_files(workdir, args):
+    import pandas as pd
+    from mf_toolkit.data import list_files
+    from mf_toolkit.data.config import RCM_DIRECTORY_TEMPLATE
+
+    catalog = pd.read_csv(os.path.join(REPO_ROOT, "data", "catalogs", "RCM.csv"), encoding="utf-8-sig")
+    root_dir = os.path.join(workdir, "tree")
+    synthetic.write_catalog_tree(root_dir, catalog, RCM_DIRECTORY_TEMPLATE)
+    query = {
+        column: sorted(catalog[column].unique().tolist())
+        for column in ["project", "domain", "gcm", "member", "rcm", "experiment", "timestep", "variable"]
+    }
+    return lambda: list_files(type="RCM", root_dir=root_dir, **query)
+
+
+@benchmark("data.download_object")
+def _download_object(workdir, args):
+    from mf_toolkit.data.downloader import download_object
+
+    served = os.path.join(workdir, "served")
+    os.makedirs(served, exist_ok=True)
+    with open(os.path.join(served, "sample.nc"), "wb") as f:
+        f.write(os.urandom(32 * 1024 * 1024))
+    stub = synthetic.http_stub(served)
+    base_url = stub.__enter__()
+    output_path = os.path.join(workdir, "downloaded", "sample.nc")
+
+    def run():
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        download_object(f"{base_url}/sample.nc", output_path)
+
+    run.close = lambda: stub.__exit__(None, None, None)
+    return run
+
+
+@benchmark("data.open_remote_dataset")
+def _open_remote_dataset(workdir, args):
+    try:
+        import h5py  # noqa: F401
+    except ImportError as e:
+        raise Skip(str(e))
+    from mf_toolkit.data.remote import open_remote_dataset
+
+    served = os.path.join(workdir, "served_nc")
+    os.makedirs(served, exist_ok=True)
+    synthetic.daily_dataset("tasAdjust", years=args.years).to_netcdf(
+        os.path.join(served, "tasAdjust.nc"),
+        encoding={"tasAdjust": {"zlib": True, "shuffle": True, "chunksizes": (30, 67, 72)}},
+    )
+    stub = synthetic.http_stub(served)
+    base_url = stub.__enter__()
+    reference_dir = os.path.join(workdir, "references")
+
+    def run():
+        # Reference index cached after the warmup run, chunks always fetched: a 5 year window
+        dataset = open_remote_dataset(f"{base_url}/tasAdjust.nc", reference_dir, chunk_cache_dir=None)
+        return dataset.tasAdjust.isel(time=slice(0, 5 * 365)).values
+
+    run.close = lambda: stub.__exit__(None, None, None)
+    return run
+
+
+def _list_prefixes(workdir, args, max_workers):
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError as e:
+        raise Skip(str(e))
+    from minio import Minio
+    from mf_toolkit.data.catalog import search
+    from mf_toolkit.data.downloader import set_prefix
+    from mf_toolkit.data.inventory import list_prefixes
+
+    # Local S3 stand-in with one object per catalog record
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    client = Minio(f"{host}:{port}", access_key="bench", secret_key="bench", secure=False)
+    client.make_bucket("bench")
+    cwd = os.getcwd()
+    os.chdir(REPO_ROOT)
+    try:
+        prefixes = [set_prefix(type="RCM", **record) for record in search("RCM")]
+    finally:
+        os.chdir(cwd)
+    for prefix in prefixes:
+        client.put_object("bench", f"{prefix}/file.nc", io.BytesIO(b"x"), 1)
+    inventory_path = os.path.join(workdir, "inventory.json")
+
+    def run():
+        return list_prefixes(
+            prefixes, refresh=True, path=inventory_path, client=client, bucket="bench", max_workers=max_workers,
+            endpoint=f"{host}:{port}", secure=False,
+        )
+
+    run.close = server.stop
+    return run
+
+
+benchmark("data.list_prefixes")(lambda workdir, args: _list_prefixes(workdir, args, max_workers=8))
+
+
+def _register_cli_benchmarks():
+    src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    commands = {
+        "help": ["--help"],
+        "search": ["search", "--variable", "tasAdjust", "--experiment", "ssp370"],
+    }
+    for case, command in commands.items():
+
+        def factory(workdir, args, command=command):
+            env = dict(os.environ, PYTHONPATH=src_dir)
+
+            def run():
+                # Fresh interpreter each time: this measures import time, not the query
+                subprocess.run(
+                    [sys.executable, "-m", "mf_toolkit.cli", *command],
+                    cwd=REPO_ROOT, env=env, check=True, stdout=subprocess.DEVNULL,
+                )
+
+            run.budget = CLI_STARTUP_BUDGET
+            return run
+
+        benchmark(f"cli.startup.{case}")(factory)
+
+
+def time_case(func: Callable, repeat: int, warmup: int, memory: bool = False) -> dict:
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    result = {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "mean": statistics.fmean(timings),
+        "runs": repeat,
+    }
+    if memory:
+        # Separate untimed run: tracemalloc slows allocations down
+        tracemalloc.start()
+        func()
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result
+
+
+def load_baseline(path: Optional[str]) -> dict:
+    if path:
+        with open(path) as f:
+            return json.load(f)["results"]
+    history_path = os.path.join(RESULTS_DIR, "history.jsonl")
+    if not os.path.isfile(history_path):
+        return {}
+    with open(history_path) as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1])["results"] if lines else {}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference or "median" not in result or "median" not in reference:
+            continue
+        ratio = result["median"] / reference["median"]
+        result["baseline_median"] = reference["median"]
+        result["ratio"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Run the toolkit benchmark suite")
+    parser.add_argument("-filter", type=str, default="", help="Only run cases whose name contains this string")
+    parser.add_argument("-repeat", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("-warmup", type=int, default=1, help="Untimed runs per case")
+    parser.add_argument("-years", type=int, default=20, help="Length of the synthetic daily datasets")
+    parser.add_argument("-threshold", type=float, default=0.2, help="Allowed median slowdown (0.2 = 20%%)")
+    parser.add_argument("-baseline", type=str, default=None, help="Results JSON to compare with (default: last run)")
+    parser.add_argument("-no-history", action="store_true", help="Do not append this run to the history")
+    parser.add_argument("-memory", action="store_true", help="Record the peak traced memory of each case")
+    parser.add_argument("-accuracy", action="store_true", help="Check float32 indicators against float64")
+    return parser.parse_args(args)
+
+
+def main(args=None) -> int:
+    argz = parse_args(sys.argv[1:] if args is None else args)
+    _register_indicator_benchmarks()
+    _register_raster_format_benchmarks()
+    _register_tileset_benchmarks()
+    _register_cli_benchmarks()
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="mf_bench_")
+    try:
+        for name, factory in BENCHMARKS.items():
+            if argz.filter not in name:
+                continue
+            try:
+                func = factory(workdir, argz)
+            except Skip as e:
+                print(f"{name:<40} skipped ({e})")
+                results[name] = {"skipped": str(e)}
+                continue
+            results[name] = time_case(func, argz.repeat, argz.warmup, argz.memory)
+            if hasattr(func, "budget"):
+                results[name]["budget"] = func.budget
+            if hasattr(func, "tile_bytes"):
+                results[name]["tile_bytes"] = func.tile_bytes
+            if hasattr(func, "worker_mb"):
+                results[name]["worker_mb"] = func.worker_mb
+            if hasattr(func, "close"):
+                func.close()
+            # Freed before the next case forks its workers (see 'dataplane.*'); cases that
+            # set attributes on themselves are reference cycles
+            del func
+            gc.collect()
+            line = f"{name:<40} median {results[name]['median'] * 1000:10.2f} ms"
+            if "tile_bytes" in results[name]:
+                line += f"  {results[name]['tile_bytes'] / 1024:8.1f} KiB"
+            if "worker_mb" in results[name]:
+                line += f"  worker {results[name]['worker_mb']:8.1f} MB"
+            if "peak_mb" in results[name]:
+                line += f"  peak {results[name]['peak_mb']:8.1f} MB"
+            print(line)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    accuracy = check_accuracy(argz) if argz.accuracy else {}
+    regressions = compare(results, load_baseline(argz.baseline), argz.threshold)
+    payload = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "results": results,
+        "accuracy": accuracy,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, "latest.json"), "w") as f:
+        json.dump(payload, f, indent=2)
+    if not argz.no_history:
+        with open(os.path.join(RESULTS_DIR, "history.jsonl"), "a") as f:
+            f.write(json.dumps(payload) + "\n")
+
+    for name, ratio in regressions:
+        print(f"REGRESSION {name}: {ratio:.2f}x slower than baseline")
+    over_budget = [
+        name for name, result in results.items() if "budget" in result and result["median"] > result["budget"]
+    ]
+    for name in over_budget:
+        print(f"BUDGET {name}: {results[name]['median'] * 1000:.0f} ms above {results[name]['budget'] * 1000:.0f} ms")
+    inaccurate = [name for name, check in accuracy.items() if not check["ok"]]
+    for name in inaccurate:
+        print(f"ACCURACY {name}: float32 error {accuracy[name]['max_abs_error']:.2e} above tolerance")
+    return 1 if regressions or over_budget or inaccurate else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Synthetic inputs for the benchmark suite: EUR-12-shaped daily fields, GeoTIFFs and an HTTP stub."""
+import os
+import re
+import threading
+import contextlib
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# France subset of the EUR-12 grid (12 km, EPSG:27572)
+EUR12_SHAPE = (134, 143)
+EUR12_ORIGIN = (60000.0, 2680000.0)
+EUR12_RESOLUTION = 12000.0
+
+VARIABLE_RANGES = {
+    "tasAdjust": (263.0, 303.0),
+    "tasminAdjust": (258.0, 293.0),
+    "tasmaxAdjust": (268.0, 313.0),
+    "sfcWindAdjust": (0.0, 15.0),
+    "rsdsAdjust": (0.0, 350.0),
+}
+
+ATTRS = {
+    "input_driving_institution_id": "BENCH",
+    "tracc_level": "tracc20",
+}
+
+
+def grid_coords(shape=EUR12_SHAPE) -> dict:
+    ny, nx = shape
+    x = EUR12_ORIGIN[0] + EUR12_RESOLUTION * (np.arange(nx) + 0.5)
+    y = EUR12_ORIGIN[1] - EUR12_RESOLUTION * (np.arange(ny) + 0.5)
+    yy, xx = np.meshgrid(np.arange(ny), np.arange(nx), indexing="ij")
+    lon = -5.5 + xx * 0.155 + yy * 0.004
+    lat = 51.5 - yy * 0.108 + xx * 0.002
+    return {"y": y, "x": x, "lon": (("y", "x"), lon), "lat": (("y", "x"), lat)}
+
+
+def daily_dataset(variable: str, years: int = 20, shape=EUR12_SHAPE, seed: int = 0) -> xr.Dataset:
+    """Daily field with a seasonal cycle, noise and a NaN sea mask, shaped like a DRIAS EUR-12 file."""
+    rng = np.random.default_rng(seed)
+    time = pd.date_range("2000-01-01", f"{2000 + years - 1}-12-31", freq="D")
+    low, high = VARIABLE_RANGES[variable]
+    season = 0.5 - 0.5 * np.cos(2 * np.pi * (time.dayofyear.values - 15) / 365.25)
+    values = low + (high - low) * (
+        0.2 + 0.6 * season[:, None, None] + 0.2 * rng.random((time.size,) + shape, dtype=np.float32)
+    )
+    values[:, :10, :10] = np.nan
+    data = xr.Dataset(
+        {variable: (("time", "y", "x"), values.astype(np.float32))},
+        coords={"time": time, **grid_coords(shape)},
+        attrs=dict(ATTRS),
+    )
+    return data
+
+
+def hourly_dataset(variable: str = "tasAdjust", days: int = 60, shape=EUR12_SHAPE, seed: int = 0) -> xr.Dataset:
+    """Hourly field with a diurnal cycle, noise and a NaN sea mask, like a CPCRCM file."""
+    rng = np.random.default_rng(seed)
+    time = pd.date_range("2000-01-01", periods=days * 24, freq="h")
+    low, high = VARIABLE_RANGES[variable]
+    diurnal = 0.5 - 0.5 * np.cos(2 * np.pi * (time.hour.values - 3) / 24)
+    values = low + (high - low) * (
+        0.2 + 0.6 * diurnal[:, None, None] + 0.2 * rng.random((time.size,) + shape, dtype=np.float32)
+    )
+    values[:, :10, :10] = np.nan
+    return xr.Dataset(
+        {variable: (("time", "y", "x"), values.astype(np.float32))},
+        coords={"time": time, **grid_coords(shape)},
+        attrs=dict(ATTRS),
+    )
+
+
+def monthly_indicator(name: str = "tasmean", shape=EUR12_SHAPE, seed: int = 0) -> xr.Dataset:
+    """Monthly climatology as produced by an indicator, ready for `export_monthly_geotiff`."""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(10, 5, (12,) + shape).astype(np.float32)
+    values[:, :10, :10] = np.nan
+    return xr.Dataset(
+        {name: (("month", "y", "x"), values)},
+        coords={"month": np.arange(1, 13), **grid_coords(shape)},
+        attrs=dict(ATTRS),
+    )
+
+
+def write_geotiff(path: str, shape=EUR12_SHAPE, seed: int = 0) -> str:
+    """Single band float32 GeoTIFF in EPSG:27572 with NaN nodata."""
+    import rioxarray  # noqa: F401
+
+    data = monthly_indicator(shape=shape, seed=seed)["tasmean"].isel(month=0, drop=True)
+    data = data.drop_vars(["lon", "lat"]).rio.write_crs("EPSG:27572")
+    data.rio.write_nodata(np.nan, encoded=True, inplace=True)
+    data.rio.to_raster(path)
+    return path
+
+
+def write_catalog_tree(root_dir: str, catalog: pd.DataFrame, template: str) -> None:
+    """Empty files laid out like the object storage, one per catalog record."""
+    for record in catalog.to_dict(orient="records"):
+        directory = os.path.join(root_dir, template % record)
+        os.makedirs(directory, exist_ok=True)
+        filename = "%(variable)s_%(date_beg)s-%(date_end)s.nc" % record
+        open(os.path.join(directory, filename), "wb").close()
+
+
+@contextlib.contextmanager
+def http_stub(directory: str):
+    """Serve `directory` on a local HTTP port, yielding the base URL."""
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Static files, with single `Range: bytes=a-b` requests answered by 206 responses."""
+
+    def do_GET(self):
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if not match or not os.path.isfile(path):
+            return super().do_GET()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        stop = min(int(match.group(2)) + 1 if match.group(2) else size, size)
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read(stop - start)
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Range", f"bytes {start}-{stop - 1}/{size}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
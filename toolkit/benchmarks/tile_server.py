@@ -0,0 +1,127 @@
+"""Load test of the on-demand tile server (`mf_toolkit.tiling.server`).
+
+Usage (from the toolkit folder):
+
+    python -m benchmarks.tile_server                          # 2000 requests, 8 clients
+    python -m benchmarks.tile_server -requests 10000 -concurrency 32 -maxzoom 7
+
+A synthetic EUR-12 indicator is exported for every TRACC level, then clients request
+tiles over HTTP: first every tile once (cold, rendered), then random tiles with a
+skewed popularity (warm, mostly cache hits). p50/p99 latencies are printed and
+written to `benchmarks/results/tile_server.json`.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from benchmarks import synthetic  # noqa: E402
+from benchmarks.run import RESULTS_DIR  # noqa: E402
+
+
+def percentiles(timings: list) -> dict:
+    timings = sorted(timings)
+    quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "requests": len(timings),
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "max_ms": timings[-1] * 1000,
+    }
+
+
+def fetch_all(urls: list, concurrency: int) -> list:
+    def fetch(url):
+        start = time.perf_counter()
+        with urllib.request.urlopen(url) as response:
+            response.read()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(fetch, urls))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Load test the on-demand tile server")
+    parser.add_argument("-requests", type=int, default=2000, help="Warm requests")
+    parser.add_argument("-concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("-maxzoom", type=int, default=6)
+    parser.add_argument("-memory-cache-mb", type=int, default=64)
+    parser.add_argument("-disk-cache-mb", type=int, default=256)
+    return parser.parse_args(args)
+
+
+def main(args=None) -> int:
+    argz = parse_args(sys.argv[1:] if args is None else args)
+    try:
+        from osgeo import gdal  # noqa: F401
+        from mf_toolkit.pipeline import TRACC_AXIS_VALUES
+        from mf_toolkit.tiling.server import TileServer, make_server
+        from mf_toolkit.tiling.to_web_mercator import dataset_tile_range
+    except ImportError as e:
+        print(f"skipped ({e})")
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="mf_tile_server_")
+    try:
+        for level in TRACC_AXIS_VALUES:
+            level_dir = os.path.join(workdir, "output", "BENCH", "tasmean", level)
+            os.makedirs(level_dir)
+            synthetic.write_geotiff(os.path.join(level_dir, f"tasmean_BENCH_{level}_07.tif"))
+
+        tile_server = TileServer(
+            input_dir=os.path.join(workdir, "output"),
+            maxzoom=argz.maxzoom,
+            cache_dir=os.path.join(workdir, "tiles"),
+            max_memory_bytes=argz.memory_cache_mb * 2**20,
+            max_disk_bytes=argz.disk_cache_mb * 2**20,
+        )
+        httpd = make_server(tile_server, port=0)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{httpd.server_port}/tilesets/BENCH/tas_07"
+
+        index = json.loads(urllib.request.urlopen(f"{base_url}/index.json").read())
+        _, series = tile_server.series_files("BENCH", "tas_07")
+        dataset = tile_server.source(series[0][1]).dataset
+        tiles = []
+        for z in range(0, argz.maxzoom + 1):
+            x_min, x_max, y_min, y_max = dataset_tile_range(dataset, z)
+            tiles += [(z, x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+        urls = [
+            f"{base_url}/{entry['tileUrlPattern'].format(z=z, x=x, y=y)}"
+            for entry in index["series"]
+            for z, x, y in tiles
+        ]
+
+        results = {"cold": percentiles(fetch_all(urls, argz.concurrency))}
+        # Low zoom levels and the first series are requested far more often
+        weights = [1 / (rank + 1) for rank in range(len(urls))]
+        warm_urls = random.Random(0).choices(urls, weights=weights, k=argz.requests)
+        results["warm"] = percentiles(fetch_all(warm_urls, argz.concurrency))
+        results["cache"] = tile_server.cache.stats()
+        httpd.shutdown()
+        tile_server.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for phase in ("cold", "warm"):
+        r = results[phase]
+        print(f"{phase:<5} {r['requests']:6d} requests  p50 {r['p50_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, "tile_server.json"), "w") as f:
+        json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
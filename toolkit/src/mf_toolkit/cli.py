@@ -0,0 +1,314 @@
+"""
+Command line entry point (`mf-toolkit`).
+
+Only the standard library is imported at module level: xarray, GDAL, PIL and the
+indicator registry are imported by the subcommand that needs them, so `--help`
+and catalog queries start in well under a second.
+"""
+import os
+import sys
+import logging
+import argparse
+
+from . import instrumentation
+
+RCM_QUERY_DEFAULTS = dict(
+    type="RCM",
+    project="EURO-CORDEX",
+    domain="EUR-12",
+    gcm=["NorESM2-MM"],
+    member="r1i1p1f1",
+    rcm=["HCLIM43-ALADIN"],
+    experiment=["historical", "ssp370"],
+    timestep="day",
+    version="v1-r1",
+    version_hackathon="version-hackathon-102025",
+)
+
+# Les simulations CPCRCM sont horaires : agrégées en journalier avant le calcul des indicateurs
+CPCRCM_TIMESTEP = "1hr"
+
+
+def _add_query_arguments(parser: argparse.ArgumentParser, variable: bool = False) -> None:
+    parser.add_argument("--type", default=RCM_QUERY_DEFAULTS["type"])
+    parser.add_argument("--project", default=RCM_QUERY_DEFAULTS["project"])
+    parser.add_argument("--domain", default=RCM_QUERY_DEFAULTS["domain"])
+    parser.add_argument("--gcm", nargs="+", default=RCM_QUERY_DEFAULTS["gcm"])
+    parser.add_argument("--member", default=RCM_QUERY_DEFAULTS["member"])
+    parser.add_argument("--rcm", nargs="+", default=RCM_QUERY_DEFAULTS["rcm"])
+    parser.add_argument("--experiment", nargs="+", default=RCM_QUERY_DEFAULTS["experiment"])
+    parser.add_argument(
+        "--timestep", help=f"Default: '{RCM_QUERY_DEFAULTS['timestep']}', '{CPCRCM_TIMESTEP}' for CPCRCM"
+    )
+    parser.add_argument("--version", default=RCM_QUERY_DEFAULTS["version"])
+    parser.add_argument("--version-hackathon", default=RCM_QUERY_DEFAULTS["version_hackathon"])
+    if variable:
+        parser.add_argument("--variable", nargs="+", required=True, help="Variables (eg. 'tasAdjust')")
+
+
+def _query(argz) -> dict:
+    query = {key: getattr(argz, key) for key in RCM_QUERY_DEFAULTS}
+    if query["timestep"] is None:
+        query["timestep"] = CPCRCM_TIMESTEP if query["type"] == "CPCRCM" else RCM_QUERY_DEFAULTS["timestep"]
+    if getattr(argz, "variable", None):
+        query["variable"] = argz.variable
+    return query
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog="mf-toolkit", description="Calcul et tuilage des indicateurs climatiques")
+    parser.add_argument("--trace", help="Write a timing report to this JSON file (and a Chrome trace next to it)")
+    parser.add_argument("--profile-dir", help="Capture a cProfile file per stage in this folder (requires --trace)")
+    parser.add_argument(
+        "--mmap-cache",
+        action="store_true",
+        help="Read local inputs from decompressed memory-mapped copies (built on first use, see MF_TOOLKIT_MMAP_CACHE_GB)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="List registered indicators")
+
+    search_parser = subparsers.add_parser("search", help="Query the data catalog")
+    _add_query_arguments(search_parser)
+    search_parser.add_argument("--variable", nargs="+", help="Variables (eg. 'tasAdjust')")
+    search_parser.add_argument(
+        "--columns",
+        nargs="+",
+        default=["gcm", "rcm", "experiment", "variable", "date_beg", "date_end"],
+        help="Catalog columns to print",
+    )
+
+    download_parser = subparsers.add_parser("download", help="Download the files matching a catalog query")
+    download_parser.add_argument("--data-dir", default="data")
+    download_parser.add_argument("--dry-run", action="store_true", help="Print the planned downloads only")
+    download_parser.add_argument("--refresh", action="store_true", help="List the bucket again, ignoring the inventory")
+    _add_query_arguments(download_parser, variable=True)
+
+    rechunk_parser = subparsers.add_parser(
+        "rechunk", help="Write copies of the downloaded files chunked for time-series or map access"
+    )
+    rechunk_parser.add_argument("--layout", choices=["time", "space"], required=True)
+    rechunk_parser.add_argument("--data-dir", default="data")
+    rechunk_parser.add_argument("--memory-mb", type=int, default=1024, help="Memory budget of the copy")
+    _add_query_arguments(rechunk_parser, variable=True)
+
+    compute_parser = subparsers.add_parser("compute", help="Compute an indicator and export GeoTIFFs")
+    compute_parser.add_argument("indicator", help="Indicator name (eg. 'tasmean' or 'tas')")
+    compute_parser.add_argument("--data-dir", default="data")
+    compute_parser.add_argument("--download", action="store_true", help="Download input files first")
+    compute_parser.add_argument(
+        "--remote", action="store_true", help="Read input files from the bucket with range requests instead"
+    )
+    compute_parser.add_argument(
+        "--change",
+        choices=["delta", "ratio"],
+        help="Export TRACC levels as changes from each model's cached reference climatology",
+    )
+    compute_parser.add_argument(
+        "--windowed",
+        action="store_true",
+        help="Derive all TRACC levels from one pass of cached per-year monthly sums",
+    )
+    compute_parser.add_argument(
+        "--no-ledger", action="store_true", help="Do not record exports in the run ledger (stop at the first error)"
+    )
+    compute_parser.add_argument("--force", action="store_true", help="Recompute the exports the ledger marks as done")
+    compute_parser.add_argument(
+        "--retries", type=int, default=2, help="Retries of a TRACC level after an I/O error (with backoff)"
+    )
+    compute_parser.add_argument(
+        "--status", action="store_true", help="Print the done, failed and pending exports of the ledger, then exit"
+    )
+    _add_query_arguments(compute_parser)
+
+    ensemble_parser = subparsers.add_parser(
+        "ensemble", help="Compute multi-model ensemble statistics of an indicator and export GeoTIFFs"
+    )
+    ensemble_parser.add_argument("indicator", help="Indicator name (eg. 'tasmean' or 'tas')")
+    ensemble_parser.add_argument("--data-dir", default="data")
+    ensemble_parser.add_argument("--download", action="store_true", help="Download input files first")
+    ensemble_parser.add_argument(
+        "--remote", action="store_true", help="Read input files from the bucket with range requests instead"
+    )
+    ensemble_parser.add_argument(
+        "--layers", nargs="+", default=["mean", "median", "std", "agreement"], help="Statistics to export"
+    )
+    _add_query_arguments(ensemble_parser)
+
+    export_parser = subparsers.add_parser("export", help="Export the monthly GeoTIFFs of an indicator for one input file")
+    export_parser.add_argument("indicator", help="Indicator name (eg. 'tasmean' or 'tas')")
+    export_parser.add_argument("path", help="Input NetCDF file (historical: reference period, else TRACC levels)")
+    export_parser.add_argument("--output-dir", required=True)
+
+    tile_parser = subparsers.add_parser("tile", help="Tile the GeoTIFFs of an indicator")
+    tile_parser.add_argument("indicator", help="Indicator name (eg. 'tasmean' or 'tas')")
+    tile_parser.add_argument("--model", required=True, help="Model folder in data/output (eg. 'CMCC-CM2-SR5')")
+    tile_parser.add_argument("--output", default="../frontend/public/tilesets")
+    tile_parser.add_argument("--maxzoom", type=int, default=6)
+    tile_parser.add_argument("--change", choices=["delta", "ratio"], help="Tile the change layers instead")
+    tile_parser.add_argument(
+        "--auto-encoding", action="store_true", help="Choose the tile encoding offset and channels from the data"
+    )
+    tile_parser.add_argument(
+        "--precision", type=float, default=None, help="Encoding step with --auto-encoding (default: registry step)"
+    )
+    tile_parser.add_argument("--raster-format", choices=["webp", "png"], default="webp")
+    tile_parser.add_argument(
+        "--pack",
+        choices=["levels", "all"],
+        help="Pack the series in each tile: the TRACC levels of a month, or all months and levels",
+    )
+    tile_parser.add_argument(
+        "--workers", type=int, default=1, help="Tiling processes per tileset, sharing the warped raster"
+    )
+
+    catalog_parser = subparsers.add_parser("catalog", help="Rebuild the tileset catalog of a model")
+    catalog_parser.add_argument("--model", required=True, help="Model folder in the tilesets output")
+    catalog_parser.add_argument("--output", default="../frontend/public/tilesets")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve tiles rendered on request from the exported GeoTIFFs")
+    serve_parser.add_argument("--input", default="data/output", help="Folder with {model}/{indicator}/{level}/*.tif")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--maxzoom", type=int, default=6)
+    serve_parser.add_argument("--memory-cache-mb", type=int, default=256)
+    serve_parser.add_argument("--disk-cache-mb", type=int, default=2048)
+    serve_parser.add_argument("--cache-dir", default=None, help="On-disk tile cache (default: data/cache/tiles)")
+
+    return parser.parse_args(args)
+
+
+def run(argz) -> None:
+    if argz.command == "list":
+        from .climato.indicators import list_indicators
+
+        for spec in list_indicators():
+            print(
+                f"{spec.name:<10} {spec.short_name:<8} {','.join(spec.variables):<14} "
+                f"{spec.units:<10} cost={spec.cost}  {spec.description}"
+            )
+
+    elif argz.command == "search":
+        from .data.catalog import search
+
+        for record in search(**_query(argz)):
+            print("\t".join(record.get(column, "") for column in argz.columns))
+
+    elif argz.command == "download":
+        from .data import download
+
+        todo = download(root_dir=argz.data_dir, dry_run=argz.dry_run, refresh=argz.refresh, **_query(argz))
+        if argz.dry_run:
+            for obj, output_path in todo:
+                print(f"{obj['size']:>14,d}  {output_path}")
+
+    elif argz.command == "rechunk":
+        from .data import list_files
+        from .data.rechunk import rechunk
+
+        logging.basicConfig(level=logging.INFO)
+        for path in list_files(root_dir=argz.data_dir, **_query(argz)):
+            print(rechunk(path, argz.layout, max_bytes=argz.memory_mb * 2**20))
+
+    elif argz.command == "compute":
+        from .ledger import format_report
+        from .pipeline import compute_files, ledger_report
+
+        if argz.status:
+            report = ledger_report(
+                argz.indicator, _query(argz), data_dir=argz.data_dir, remote=argz.remote, change=argz.change
+            )
+            print(format_report(report))
+            return
+        report = compute_files(
+            argz.indicator,
+            _query(argz),
+            data_dir=argz.data_dir,
+            fetch=argz.download,
+            remote=argz.remote,
+            change=argz.change,
+            windowed=argz.windowed,
+            ledger=not argz.no_ledger,
+            force=argz.force,
+            retries=argz.retries,
+        )
+        if report is not None:
+            print(format_report(report))
+            if report["failed"]:
+                sys.exit(1)
+
+    elif argz.command == "ensemble":
+        from .pipeline import ensemble_files
+
+        ensemble_files(
+            argz.indicator,
+            _query(argz),
+            data_dir=argz.data_dir,
+            fetch=argz.download,
+            remote=argz.remote,
+            layers=argz.layers,
+        )
+
+    elif argz.command == "export":
+        from .climato.indicators import get_indicator
+        from .pipeline import indicator
+
+        indicator(get_indicator(argz.indicator).name, argz.path, argz.output_dir)
+
+    elif argz.command == "tile":
+        from .climato.indicators import get_indicator
+        from .pipeline import tile_indicator
+
+        spec = get_indicator(argz.indicator)
+        folder = f"{spec.name}_{argz.change}" if argz.change else spec.name
+        tile_indicator(
+            spec.name,
+            input_dir=f"data/output/{argz.model}/{folder}",
+            output_dir=os.path.join(argz.output, argz.model),
+            maxzoom=argz.maxzoom,
+            change=argz.change,
+            auto_encoding=argz.auto_encoding,
+            precision=argz.precision,
+            raster_format=argz.raster_format,
+            pack=argz.pack,
+            workers=argz.workers,
+        )
+
+    elif argz.command == "catalog":
+        from .tiling import write_catalog
+
+        catalog = write_catalog(os.path.join(argz.output, argz.model))
+        print(f"{len(catalog['tilesets'])} tilesets in the {catalog['model']} catalog")
+
+    elif argz.command == "serve":
+        from .tiling.server import TileServer, TILE_CACHE_DIR, serve
+
+        logging.basicConfig(level=logging.INFO)
+        tile_server = TileServer(
+            input_dir=argz.input,
+            maxzoom=argz.maxzoom,
+            cache_dir=argz.cache_dir or TILE_CACHE_DIR,
+            max_memory_bytes=argz.memory_cache_mb * 2**20,
+            max_disk_bytes=argz.disk_cache_mb * 2**20,
+        )
+        serve(tile_server, argz.host, argz.port)
+
+
+def main(args=None) -> None:
+    argz = parse_args(sys.argv[1:] if args is None else args)
+    if argz.trace:
+        instrumentation.enable(profile_dir=argz.profile_dir)
+    if argz.mmap_cache:
+        from .data.mmap_cache import enable_mmap_cache
+
+        enable_mmap_cache()
+    try:
+        run(argz)
+    finally:
+        if argz.trace:
+            instrumentation.write_report(argz.trace)
+            instrumentation.write_chrome_trace(os.path.splitext(argz.trace)[0] + ".trace.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,27 @@ from .indicators import (
     tasmin0,
     dju,
     wsmean,
+    wsp10,
+    wsp90,
     rsdsmean,
+    rsdsp10,
+    rsdsp90,
+    tasmax25,
+    tasmax35,
+    tasminm5,
+    wscutin,
+    wscutout,
+    rsdslow,
     compute_indicator,
+    get_indicator,
+    list_indicators,
+    compute_cached,
+    compute_change,
+    reference_climatology,
 )
+from .zonal import zonal_mean, build_zonal_weights
+from .ensemble import EnsembleAccumulator
+from ..precision import get_compute_dtype, set_compute_dtype, compute_precision
 
 __all__ = [
     "tasmean",
@@ -15,6 +33,27 @@ __all__ = [
     "tasmin0",
     "dju",
     "wsmean",
+    "wsp10",
+    "wsp90",
     "rsdsmean",
+    "rsdsp10",
+    "rsdsp90",
+    "tasmax25",
+    "tasmax35",
+    "tasminm5",
+    "wscutin",
+    "wscutout",
+    "rsdslow",
     "compute_indicator",
+    "get_indicator",
+    "list_indicators",
+    "compute_cached",
+    "compute_change",
+    "reference_climatology",
+    "zonal_mean",
+    "build_zonal_weights",
+    "EnsembleAccumulator",
+    "get_compute_dtype",
+    "set_compute_dtype",
+    "compute_precision",
 ]
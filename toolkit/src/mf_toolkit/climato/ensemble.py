@@ -0,0 +1,167 @@
+from typing import Optional, Union
+
+import numpy as np
+import xarray as xr
+
+from ..precision import get_compute_dtype
+from .sketch import accumulate_histogram, bin_edges, histogram_rank
+
+ENSEMBLE_STATS = ("mean", "median", "std", "min", "max", "agreement", "count")
+# Classes de l'histogramme de la médiane, entre le min et le max de chaque maille
+MEDIAN_BINS = 64
+
+
+class EnsembleAccumulator:
+    """Statistiques d'ensemble multi-modèles calculées membre par membre.
+
+    Moyenne et écart-type par l'algorithme de Welford, min/max et accord des modèles sur le
+    signe du changement sont accumulés membre par membre. La médiane demande une seconde
+    passe sur les membres (`add_median`) : chacun est compté dans un histogramme de
+    `median_bins` classes entre le min et le max de chaque maille, connus après la première.
+    Elle est approchée à une classe près ; la mémoire ne dépend pas du nombre de membres.
+
+    Exemple :
+        ensemble = EnsembleAccumulator()
+        for path in paths:
+            ensemble.add(compute_cached("tasmean", path, "tracc20")["tasmean"])
+        for path in paths:
+            ensemble.add_median(compute_cached("tasmean", path, "tracc20")["tasmean"])
+        stats = ensemble.result()
+    """
+
+    def __init__(self, median_bins: int = MEDIAN_BINS) -> None:
+        self.template = None
+        self.members = []
+        self.median_bins = median_bins
+        self.median_counts = None
+        self.median_members = 0
+
+    def _start(self, member: xr.DataArray) -> None:
+        if "month" not in member.dims:
+            raise ValueError(f"Ensemble members must have a 'month' dimension, got {member.dims}")
+        self.template = member.transpose("month", ...)
+        shape = self.template.shape
+        self.count = np.zeros(shape, dtype=np.int32)
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+        self.min = np.full(shape, np.nan)
+        self.max = np.full(shape, np.nan)
+        self.positive = np.zeros(shape, dtype=np.int32)
+        self.negative = np.zeros(shape, dtype=np.int32)
+
+    def add(
+        self,
+        member: xr.DataArray,
+        reference: Union[xr.DataArray, float, None] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        """Ajoute un membre (dimensions mois + spatiales, identiques pour tous les membres).
+
+        Args:
+            member (xr.DataArray): Indicateur d'un couple GCM x RCM.
+            reference (xr.DataArray | float): Référence du même membre pour l'accord sur le
+                signe du changement (par ex. sa climatologie tracc15). Par défaut 0, adapté
+                aux couches de changement.
+            name (str): Nom du membre, conservé dans l'attribut 'members' du résultat.
+        """
+        if self.template is None:
+            self._start(member)
+        if self.median_counts is not None:
+            raise ValueError("Members cannot be added once the median pass started")
+        values = self._values(member)
+        valid = ~np.isnan(values)
+
+        # Welford, uniquement sur les mailles valides du membre
+        self.count += valid
+        delta = np.where(valid, values - self.mean, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean += np.where(valid, delta / np.maximum(self.count, 1), 0.0)
+        self.m2 += np.where(valid, delta * (values - self.mean), 0.0)
+        self.min = np.fmin(self.min, values)
+        self.max = np.fmax(self.max, values)
+
+        if reference is None:
+            change = values
+        elif isinstance(reference, xr.DataArray):
+            change = values - reference.transpose(*self.template.dims).values
+        else:
+            change = values - reference
+        self.positive += change > 0
+        self.negative += change < 0
+
+        self.members.append(name or str(len(self.members)))
+
+    def _values(self, member: xr.DataArray) -> np.ndarray:
+        member = member.transpose(*self.template.dims)
+        if member.shape != self.template.shape:
+            raise ValueError(f"Member shape {member.shape} differs from {self.template.shape}")
+        return member.values.astype(np.float64)
+
+    def add_median(self, member: xr.DataArray) -> None:
+        """Seconde passe : ajoute un membre, déjà passé à `add`, à l'histogramme de la médiane."""
+        if self.template is None:
+            raise ValueError("Add every member with `add` before the median pass")
+        if self.median_counts is None:
+            nmonths = self.template.shape[0]
+            dtype = np.uint8 if len(self.members) <= np.iinfo(np.uint8).max else np.uint32
+            self.median_counts = np.zeros((nmonths, self.median_bins, self.count[0].size), dtype=dtype)
+        values = self._values(member)
+        # Position dans [min, max] de la maille ; une maille de valeur unique tombe dans la première classe
+        span = self.max - self.min
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scaled = np.where(span > 0, (values - self.min) / span, 0.0)
+        scaled[np.isnan(values)] = np.nan
+        months = np.arange(1, values.shape[0] + 1)
+        accumulate_histogram(self.median_counts, scaled, months, (0.0, 1.0))
+        self.median_members += 1
+
+    def result(self) -> xr.Dataset:
+        """
+        Moyenne, médiane, écart-type, min, max, accord (part des membres du signe majoritaire) et effectif.
+        La médiane n'est présente qu'après la seconde passe (`add_median`) sur tous les membres.
+        """
+        if self.template is None:
+            raise ValueError("No ensemble member was added")
+        if self.median_members not in (0, len(self.members)):
+            raise ValueError(
+                f"The median pass saw {self.median_members} of the {len(self.members)} ensemble members"
+            )
+        dims = self.template.dims
+        coords = self.template.coords
+        dtype = get_compute_dtype()
+        empty = self.count == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(self.m2 / (self.count - 1))
+            agreement = np.maximum(self.positive, self.negative) / self.count
+        std[self.count < 2] = np.nan
+        mean = np.where(empty, np.nan, self.mean)
+
+        variables = {"mean": mean}
+        if self.median_members:
+            variables["median"] = self._median()
+        variables.update({
+            "std": std,
+            "min": self.min,
+            "max": self.max,
+            "agreement": agreement,
+        })
+        result = xr.Dataset(
+            {name: (dims, values.astype(dtype)) for name, values in variables.items()},
+            coords=coords,
+        )
+        result["count"] = (dims, self.count)
+        result.attrs = dict(self.template.attrs)
+        result.attrs["members"] = ",".join(self.members)
+        return result
+
+    def _median(self) -> np.ndarray:
+        # Moyenne des valeurs de rang (n + 1) // 2 et n // 2 + 1, une médiane exacte à une classe près
+        edges = bin_edges((0.0, 1.0), self.median_bins)
+        count = self.count.reshape(self.count.shape[0], -1)
+        scaled = np.empty(count.shape)
+        for month in range(count.shape[0]):
+            counts = self.median_counts[month]
+            lower = histogram_rank(counts, edges, (count[month] + 1) // 2)
+            upper = histogram_rank(counts, edges, count[month] // 2 + 1)
+            scaled[month] = (lower + upper) / 2
+        return self.min + scaled.reshape(self.template.shape) * (self.max - self.min)
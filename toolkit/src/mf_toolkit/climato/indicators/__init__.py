@@ -1,7 +1,22 @@
 from .temperature import tasmean, tasmax30, tasmin0, dju
-from .wind import wsmean
-from .solar import rsdsmean
-from .base import compute_indicator
+from .wind import wsmean, wsp10, wsp90
+from .solar import rsdsmean, rsdsp10, rsdsp90
+from .thresholds import tasmax25, tasmax35, tasminm5, wscutin, wscutout, rsdslow, DAILY_HISTOGRAMS
+from .base import compute_indicator, compute_change
+from .registry import Indicator, CHANGE_MODES, register, get_indicator, list_indicators
+from .cache import (
+    compute_cached,
+    compute_windowed,
+    compute_running,
+    prefix_sums,
+    histogram_cached,
+    compute_threshold_days,
+    compute_threshold_quantile,
+    reference_climatology,
+    model_id,
+    REFERENCE_PERIOD,
+)
+from .parallel import compute_indicators
 
 __all__ = [
     "tasmean",
@@ -9,6 +24,34 @@ __all__ = [
     "tasmin0",
     "dju",
     "wsmean",
+    "wsp10",
+    "wsp90",
     "rsdsmean",
+    "rsdsp10",
+    "rsdsp90",
+    "tasmax25",
+    "tasmax35",
+    "tasminm5",
+    "wscutin",
+    "wscutout",
+    "rsdslow",
+    "DAILY_HISTOGRAMS",
     "compute_indicator",
+    "compute_change",
+    "Indicator",
+    "register",
+    "get_indicator",
+    "list_indicators",
+    "compute_cached",
+    "compute_windowed",
+    "compute_running",
+    "compute_indicators",
+    "prefix_sums",
+    "histogram_cached",
+    "compute_threshold_days",
+    "compute_threshold_quantile",
+    "reference_climatology",
+    "model_id",
+    "REFERENCE_PERIOD",
+    "CHANGE_MODES",
 ]
@@ -2,17 +2,48 @@ from typing import Callable, Optional
 
 import xarray as xr
 
+from ... import instrumentation
+from ...precision import as_compute_dtype
+
 
 def compute_indicator(
     func: Callable, dataset: xr.Dataset, variable: Optional[str] = None
 ) -> xr.Dataset:
-    """Compute an indicator from a dataset using the provided function."""
+    """Compute an indicator from a dataset using the provided function.
+
+    Inputs and result are cast to the compute precision (float32 by default, see `precision`).
+    """
     if variable:
         data_array = dataset[variable]
     else:
         data_array = dataset
+    data_array = as_compute_dtype(data_array)
 
-    indicator = func(data_array)
-    indicator = indicator.to_dataset()
+    name = getattr(getattr(func, "func", func), "__name__", "indicator")
+    with instrumentation.span("compute_indicator", profile=True, indicator=name):
+        indicator = func(data_array)
+    instrumentation.count("cells_processed", data_array.size)
+    indicator = as_compute_dtype(indicator).to_dataset()
     indicator.attrs = dataset.attrs
     return indicator
+
+
+def compute_change(indicator: xr.Dataset, reference: xr.Dataset, mode: str = "delta") -> xr.Dataset:
+    """Change of an indicator relative to a reference climatology of the same model.
+
+    'delta' is the difference (indicator units), 'ratio' the relative change in percent
+    (NaN where the reference is 0). Only array operations: no pass over daily data.
+    """
+    if mode == "delta":
+        change = indicator - reference
+    elif mode == "ratio":
+        change = (indicator / reference.where(reference != 0) - 1) * 100
+    else:
+        raise ValueError(f"Unknown change mode '{mode}'")
+    change = as_compute_dtype(change)
+    change.attrs = {**indicator.attrs, "change": mode}
+    for name in change.data_vars:
+        change[name].attrs = dict(indicator[name].attrs)
+        if mode == "ratio":
+            change[name].attrs["units"] = "%"
+    return change
@@ -0,0 +1,352 @@
+import os
+import json
+import hashlib
+import logging
+from functools import partial
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ... import instrumentation
+from ...precision import as_compute_dtype, get_compute_dtype
+from ...data.config import CACHE_DIR
+from ...data.mmap_cache import mmap_cache_enabled, open_cached_dataset
+from ...data.remote import is_remote, object_version, open_remote_dataset
+from ..subdaily import DAILY_BLOCK_BYTES, block_steps, time_blocks
+from ..windows import cumulative_sums, running_climatology, window_climatology, yearly_monthly_sums
+from .base import compute_indicator
+from .registry import get_indicator
+from .thresholds import DAILY_HISTOGRAMS, daily_histogram, threshold_days, threshold_quantile
+
+INDICATOR_CACHE_DIR = os.path.join(CACHE_DIR, "indicators")
+CLIMATOLOGY_CACHE_DIR = os.path.join(CACHE_DIR, "climatologies")
+REFERENCE_PERIOD = ("1985-01-01", "2014-12-31")
+FINGERPRINT_HEAD_BYTES = 1024 * 1024
+
+Period = Union[str, Tuple[str, str], None]
+
+
+def file_fingerprint(path: str) -> str:
+    """Empreinte rapide d'un fichier : taille, date de modification et début du contenu."""
+    if is_remote(path):
+        # Objet distant : taille et ETag (requête HEAD)
+        version = object_version(path)
+        return hashlib.sha1(f"{path}:{version['size']}:{version['etag']}".encode()).hexdigest()
+    stat = os.stat(path)
+    digest = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_HEAD_BYTES))
+    return digest.hexdigest()
+
+
+def result_key(path: str, name: str, params: dict, period: Period) -> str:
+    """Clé de cache d'un résultat : (empreinte du fichier, indicateur, paramètres, période, précision)."""
+    payload = json.dumps(
+        [file_fingerprint(path), name, params, period, str(get_compute_dtype())],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def select_period(dataset: xr.Dataset, period: Period) -> xr.Dataset:
+    """Sélectionne un niveau TRACC ('tracc20', '2.7', ...) ou un intervalle de dates (début, fin)."""
+    if period is None:
+        return dataset
+    if isinstance(period, str):
+        return dataset.climato.sel_tracc_period(period)
+    datetime_start, datetime_end = period
+    return dataset.sel(time=slice(datetime_start, datetime_end))
+
+
+def _open_input(path: str) -> xr.Dataset:
+    if is_remote(path):
+        # Lecture partielle : seuls les blocs de la période sélectionnée sont téléchargés
+        return open_remote_dataset(path)
+    if mmap_cache_enabled():
+        # Copie décompressée et projetée en mémoire (voir `data.mmap_cache`)
+        with instrumentation.span("open_cached_dataset", path=path):
+            return open_cached_dataset(path)
+    with instrumentation.span("xr.open_dataset", path=path):
+        dataset = xr.open_dataset(path)
+    if instrumentation.is_enabled():
+        instrumentation.count("input_bytes", os.path.getsize(path))
+    return dataset
+
+
+def compute_cached(
+    name: str,
+    path: str,
+    period: Period = None,
+    params: Optional[dict] = None,
+    cache_dir: Optional[str] = INDICATOR_CACHE_DIR,
+    windowed: bool = False,
+) -> xr.Dataset:
+    """Calcule un indicateur enregistré sur un fichier, en réutilisant le résultat en cache s'il existe.
+
+    Avec `windowed`, les indicateurs qui le permettent sont tirés des sommes cumulées du fichier
+    (une passe pour toutes les périodes, voir `compute_windowed`).
+    """
+    indicator = get_indicator(name)
+    params = params or {}
+    if windowed and indicator.series is not None and period is not None:
+        return compute_windowed(indicator.name, path, period, params, cache_dir)
+    if indicator.histogram is not None and not params:
+        family, from_histogram = indicator.histogram
+        histogram = histogram_cached(family, path, period, cache_dir)
+        result = as_compute_dtype(from_histogram(histogram).rename(indicator.name).to_dataset())
+        result.attrs = dict(histogram.attrs)
+        return result
+
+    cache_path = None
+    if cache_dir is not None:
+        key = result_key(path, indicator.name, params, period)
+        cache_path = os.path.join(cache_dir, f"{indicator.name}_{key}.nc")
+        if os.path.isfile(cache_path):
+            logging.info(f"Using cached {indicator.name} from {cache_path}")
+            with xr.open_dataset(cache_path) as cached:
+                return cached.load()
+
+    dataset = select_period(_open_input(path), period)
+    variable = indicator.variables[0] if len(indicator.variables) == 1 else None
+    func = partial(indicator.func, **params) if params else indicator.func
+    result = compute_indicator(func, dataset, variable)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        result.to_netcdf(tmp_path)
+        os.replace(tmp_path, cache_path)
+    return result
+
+
+def prefix_sums(
+    name: str,
+    path: str,
+    params: Optional[dict] = None,
+    cache_dir: Optional[str] = INDICATOR_CACHE_DIR,
+    max_bytes: int = DAILY_BLOCK_BYTES,
+) -> xr.Dataset:
+    """Sommes cumulées par (année, mois) de la série d'un indicateur sur tout un fichier, en cache.
+
+    Les données sont lues par blocs d'années entières d'au plus `max_bytes`.
+    """
+    indicator = get_indicator(name)
+    if indicator.series is None:
+        raise ValueError(f"Indicator '{indicator.name}' cannot be computed by windows")
+    params = params or {}
+
+    cache_path = None
+    if cache_dir is not None:
+        key = result_key(path, indicator.name, params, "prefix_sums")
+        cache_path = os.path.join(cache_dir, f"{indicator.name}_prefix_{key}.nc")
+        if os.path.isfile(cache_path):
+            logging.info(f"Using cached {indicator.name} prefix sums from {cache_path}")
+            with xr.open_dataset(cache_path) as cached:
+                return cached.load()
+
+    dataset = _open_input(path)
+    variable = indicator.variables[0] if len(indicator.variables) == 1 else None
+    data = dataset[variable] if variable else dataset
+    series_func = partial(indicator.series, **params) if params else indicator.series
+    # Par blocs d'années entières : les sommes sont additives, la mémoire reste bornée
+    yearly = []
+    for block_slice in time_blocks(data["time"], "Y", block_steps(data, max_bytes)):
+        block = as_compute_dtype(data.isel(time=block_slice))
+        with instrumentation.span("compute_series", profile=True, indicator=indicator.name):
+            series = series_func(block)
+        instrumentation.count("cells_processed", block.size)
+        yearly.append(yearly_monthly_sums(series))
+    sums = xr.concat(yearly, dim="year") if len(yearly) > 1 else yearly[0]
+    years = sums["year"].values
+    # Années absentes entre deux blocs : sommes nulles, comme dans un bloc unique
+    sums = sums.reindex(year=np.arange(years[0], years[-1] + 1), fill_value=0)
+    result = cumulative_sums(sums)
+    result.attrs = dataset.attrs
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        result.to_netcdf(tmp_path)
+        os.replace(tmp_path, cache_path)
+    return result
+
+
+def histogram_cached(
+    family: str,
+    path: str,
+    period: Period = None,
+    cache_dir: Optional[str] = INDICATOR_CACHE_DIR,
+) -> xr.Dataset:
+    """Histogramme journalier d'une famille (voir `thresholds.DAILY_HISTOGRAMS`) sur une période, en cache."""
+    if family not in DAILY_HISTOGRAMS:
+        raise ValueError(f"Unknown histogram family '{family}', expected one of {list(DAILY_HISTOGRAMS)}")
+    spec = DAILY_HISTOGRAMS[family]
+
+    cache_path = None
+    if cache_dir is not None:
+        params = {"value_range": spec["value_range"], "bins": spec["bins"]}
+        key = result_key(path, f"histogram_{family}", params, period)
+        cache_path = os.path.join(cache_dir, f"histogram_{family}_{key}.nc")
+        if os.path.isfile(cache_path):
+            logging.info(f"Using cached {family} histogram from {cache_path}")
+            with xr.open_dataset(cache_path) as cached:
+                return cached.load()
+
+    dataset = select_period(_open_input(path), period)
+    data = as_compute_dtype(dataset[spec["variable"]])
+    with instrumentation.span("daily_histogram", profile=True, family=family):
+        result = daily_histogram(data, family)
+    instrumentation.count("cells_processed", data.size)
+    result.attrs = {**dataset.attrs, **result.attrs}
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        # Classes vides en majorité : compressé, l'histogramme reste petit sur disque
+        result.to_netcdf(tmp_path, encoding={"counts": {"zlib": True, "complevel": 4}})
+        os.replace(tmp_path, cache_path)
+    return result
+
+
+def compute_threshold_days(
+    family: str,
+    path: str,
+    period: Period,
+    threshold: float,
+    below: bool = False,
+    cache_dir: Optional[str] = INDICATOR_CACHE_DIR,
+) -> xr.Dataset:
+    """Jours au-dessus (ou en dessous) d'un seuil quelconque, moyennés par mois, depuis l'histogramme en cache.
+
+    Exemple : `compute_threshold_days("tasmax", path, "tracc27", 32)` (°C).
+    """
+    histogram = histogram_cached(family, path, period, cache_dir)
+    name = f"{family}_{'below' if below else 'above'}_{threshold:g}"
+    result = as_compute_dtype(threshold_days(histogram, threshold, below).rename(name).to_dataset())
+    result.attrs = dict(histogram.attrs)
+    return result
+
+
+def compute_threshold_quantile(
+    family: str,
+    path: str,
+    period: Period,
+    q: float,
+    cache_dir: Optional[str] = INDICATOR_CACHE_DIR,
+) -> xr.Dataset:
+    """Centile mensuel approché des valeurs journalières d'une famille, depuis l'histogramme en cache."""
+    histogram = histogram_cached(family, path, period, cache_dir)
+    result = threshold_quantile(histogram, q).rename(f"{family}_p{q * 100:g}").to_dataset()
+    result = as_compute_dtype(result)
+    result.attrs = dict(histogram.attrs)
+    return result
+
+
+def period_years(dataset: xr.Dataset, period: Period) -> Tuple[int, int]:
+    """Années (début, fin incluses) d'un niveau TRACC ou d'un intervalle d'années entières."""
+    if isinstance(period, str):
+        _, year_start, year_end = dataset.climato.tracc_years(period)
+        return year_start, year_end
+    start, end = (pd.Timestamp(date) for date in period)
+    if (start.month, start.day, end.month, end.day) != (1, 1, 12, 31):
+        raise ValueError(f"Windowed climatologies need whole years, got {period}")
+    return start.year, end.year
+
+
+def compute_windowed(
+    name: str,
+    path: str,
+    period: Period,
+    params: Optional[dict] = None,
+    cache_dir: Optional[str] = INDICATOR_CACHE_DIR,
+    variance: bool = False,
+) -> xr.Dataset:
+    """
+    Indicateur d'une période par différence de sommes cumulées, même résultat que `compute_cached`.
+    Avec `variance`, la variance interannuelle des moyennes mensuelles est ajoutée
+    (`{nom}_variance`, voir `window_climatology`).
+    """
+    indicator = get_indicator(name)
+    prefix = prefix_sums(indicator.name, path, params, cache_dir)
+    year_start, year_end = period_years(prefix, period)
+    climatology = window_climatology(prefix, year_start, year_end)
+    result = climatology["mean"].rename(indicator.name).to_dataset()
+    if variance:
+        result[f"{indicator.name}_variance"] = climatology["variance"]
+    result = as_compute_dtype(result)
+    result.attrs = dict(prefix.attrs)
+    if isinstance(period, str):
+        result.attrs["tracc_level"] = prefix.climato.tracc_years(period)[0]
+    return result
+
+
+def compute_running(
+    name: str,
+    path: str,
+    window: int = 20,
+    params: Optional[dict] = None,
+    cache_dir: Optional[str] = INDICATOR_CACHE_DIR,
+) -> xr.Dataset:
+    """Climatologies glissantes de `window` ans d'un indicateur pour chaque année couverte (dimension 'year')."""
+    indicator = get_indicator(name)
+    prefix = prefix_sums(indicator.name, path, params, cache_dir)
+    result = running_climatology(prefix, window, before=window // 2)
+    result = as_compute_dtype(result.rename(indicator.name).to_dataset())
+    result.attrs = dict(prefix.attrs)
+    return result
+
+
+def model_id(dataset: xr.Dataset) -> str:
+    """Identifiant du modèle (GCM, membre, RCM, correction), commun aux runs historique et scénario."""
+    try:
+        return dataset.climato.dataset_id()
+    except KeyError as e:
+        raise ValueError(f"Cannot identify the model of the dataset, missing attribute {e}") from None
+
+
+def reference_climatology(
+    name: str,
+    model: Optional[str] = None,
+    path: Optional[str] = None,
+    period: Period = REFERENCE_PERIOD,
+    cache_dir: str = CLIMATOLOGY_CACHE_DIR,
+) -> xr.Dataset:
+    """Climatologie de référence d'un indicateur pour un modèle, calculée une fois puis relue.
+
+    Le cache est indexé par (indicateur, modèle, précision) : les exports des niveaux TRACC la
+    retrouvent sans le fichier historique. `path` (run historique) n'est nécessaire qu'au premier
+    calcul ; sans `model`, le modèle est lu dans les attributs de ce fichier. Avec `path`, la
+    climatologie est recalculée si le fichier a changé depuis (empreinte `reference_fingerprint`).
+    """
+    indicator = get_indicator(name)
+    if model is None and path is None:
+        raise ValueError("Either a model or the path of its historical run is required")
+    result = None
+    if model is None:
+        result = compute_cached(indicator.name, path, period)
+        model = model_id(result)
+    payload = json.dumps([model, period, str(get_compute_dtype())], default=str)
+    key = hashlib.sha1(payload.encode()).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, f"{indicator.name}_{key}.nc")
+    fingerprint = file_fingerprint(path) if path is not None else None
+    if os.path.isfile(cache_path):
+        with xr.open_dataset(cache_path) as cached:
+            if fingerprint is None or cached.attrs.get("reference_fingerprint") == fingerprint:
+                return cached.load()
+        logging.info(f"Historical run of {model} changed, recomputing the {indicator.name} reference")
+    if path is None:
+        raise FileNotFoundError(
+            f"No reference climatology of {indicator.name} for {model}: process its historical run first"
+        )
+    if result is None:
+        result = compute_cached(indicator.name, path, period)
+    result.attrs["tracc_level"] = "tracc15"
+    result.attrs["reference_fingerprint"] = fingerprint
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    result.to_netcdf(tmp_path)
+    os.replace(tmp_path, cache_path)
+    return result
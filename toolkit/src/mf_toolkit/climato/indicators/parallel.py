@@ -0,0 +1,63 @@
+"""
+Calcul de plusieurs indicateurs d'un même fichier par un pool de processus.
+
+Le fichier est ouvert, décodé et converti à la précision de calcul une seule fois, dans le
+processus parent, puis publié en mémoire partagée (voir `dataplane`) : chaque processus
+reçoit une poignée de quelques Ko et lit les mêmes pages, au lieu d'une copie picklée du
+champ journalier ou d'une nouvelle lecture du fichier.
+
+    results = compute_indicators(["tasmean", "tasmax30", "dju"], path, period="tracc20", workers=4)
+"""
+import os
+import multiprocessing
+from typing import Dict, Optional, Sequence
+
+import xarray as xr
+
+from ...dataplane import DataPlane, attach_dataset
+from ...precision import as_compute_dtype
+from .base import compute_indicator
+from .cache import Period, _open_input, select_period
+from .registry import get_indicator
+
+DEFAULT_WORKERS = int(os.environ.get("MF_TOOLKIT_WORKERS", os.cpu_count() or 1))
+
+
+def _compute(name: str, dataset: xr.Dataset) -> xr.Dataset:
+    indicator = get_indicator(name)
+    variable = indicator.variables[0] if len(indicator.variables) == 1 else None
+    return compute_indicator(indicator.func, dataset, variable).load()
+
+
+def _compute_shared(task) -> xr.Dataset:
+    """Tâche d'un processus : indicateur calculé sur les vues partagées du jeu de données."""
+    name, handle = task
+    # Le résultat, petit devant l'entrée, revient au parent par pickle
+    return _compute(name, attach_dataset(handle))
+
+
+def compute_indicators(
+    names: Sequence[str],
+    path: str,
+    period: Period = None,
+    workers: Optional[int] = None,
+) -> Dict[str, xr.Dataset]:
+    """Calcule les indicateurs `names` sur le fichier `path`, un indicateur par tâche.
+
+    Seules les variables d'entrée des indicateurs demandés sont publiées. Avec un seul
+    processus (ou un seul indicateur), le calcul se fait dans le processus courant.
+    """
+    indicators = [get_indicator(name) for name in names]
+    variables = sorted({variable for indicator in indicators for variable in indicator.variables})
+    workers = min(workers or DEFAULT_WORKERS, len(indicators))
+
+    with _open_input(path) as opened:
+        dataset = as_compute_dtype(select_period(opened, period)[variables])
+        if workers <= 1:
+            dataset = dataset.load()
+            return {indicator.name: _compute(indicator.name, dataset) for indicator in indicators}
+        with DataPlane() as plane:
+            handle = plane.publish_dataset(dataset)
+            with multiprocessing.Pool(workers) as pool:
+                results = pool.map(_compute_shared, [(indicator.name, handle) for indicator in indicators], chunksize=1)
+    return {indicator.name: result for indicator, result in zip(indicators, results)}
@@ -0,0 +1,130 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypedDict
+
+
+class TileEncoding(TypedDict):
+    lowest_value: float
+    value_step: float
+    channels: str
+
+
+CHANGE_MODES = ("delta", "ratio")
+
+# (famille d'histogrammes journaliers, fonction de l'histogramme donnant l'indicateur)
+HistogramQuery = Tuple[str, Callable]
+
+
+class Indicator:
+    """Indicateur enregistré : fonction de calcul et métadonnées (entrées, unité, encodage)."""
+
+    def __init__(
+        self,
+        func: Callable,
+        variables: Sequence[str],
+        units: str,
+        encoding: TileEncoding,
+        cost: int = 1,
+        short_name: Optional[str] = None,
+        change: str = "delta",
+        series: Optional[Callable] = None,
+        histogram: Optional[HistogramQuery] = None,
+    ) -> None:
+        if change not in CHANGE_MODES:
+            raise ValueError(f"Unknown change mode '{change}', expected one of {CHANGE_MODES}")
+        self.func = func
+        self.name = func.__name__
+        self.variables = list(variables)
+        self.units = units
+        self.encoding = encoding
+        self.cost = cost
+        self.short_name = short_name or self.name
+        self.change = change
+        self.series = series
+        self.histogram = histogram
+        self.description = (func.__doc__ or "").strip().split("\n")[0]
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def change_units(self, mode: Optional[str] = None) -> str:
+        """Unité des couches de changement par rapport à la référence."""
+        return "%" if (mode or self.change) == "ratio" else self.units
+
+    def change_encoding(self, mode: Optional[str] = None) -> TileEncoding:
+        """Encodage des tuiles de changement : centré sur 0 pour un écart, en % pour un rapport."""
+        if (mode or self.change) == "ratio":
+            return {"lowest_value": -100, "value_step": 0.01, "channels": self.encoding["channels"]}
+        levels = 2 ** (8 * len(self.encoding["channels"]))
+        return {
+            "lowest_value": -self.encoding["value_step"] * (levels // 2),
+            "value_step": self.encoding["value_step"],
+            "channels": self.encoding["channels"],
+        }
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "short_name": self.short_name,
+            "variables": self.variables,
+            "units": self.units,
+            "encoding": dict(self.encoding),
+            "cost": self.cost,
+            "change": self.change,
+            "windowed": self.series is not None,
+            "histogram": self.histogram[0] if self.histogram else None,
+            "description": self.description,
+        }
+
+
+_registry: Dict[str, Indicator] = {}
+_short_names: Dict[str, str] = {}
+
+
+def register(
+    variables: Sequence[str],
+    units: str,
+    encoding: TileEncoding,
+    cost: int = 1,
+    short_name: Optional[str] = None,
+    change: str = "delta",
+    series: Optional[Callable] = None,
+    histogram: Optional[HistogramQuery] = None,
+) -> Callable[[Callable], Callable]:
+    """Décorateur enregistrant une fonction d'indicateur et ses métadonnées.
+
+    `cost` est un coût relatif (nombre de passes sur les données journalières).
+    `short_name` est le nom utilisé pour les tuiles et le frontend (ex: 'tas' pour tasmean).
+    `change` est le changement par défaut par rapport à la référence : écart ('delta') ou
+    rapport en % ('ratio').
+    `series` est la série (journalière ou mensuelle) dont l'indicateur est la moyenne par mois
+    calendaire : elle permet le calcul par fenêtres glissantes (voir `climato.windows`).
+    `histogram` (famille, fonction) tire l'indicateur de l'histogramme journalier en cache de
+    la famille (voir `indicators.thresholds`) au lieu de relire les données journalières.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        indicator = Indicator(
+            func, variables, units, encoding, cost, short_name, change, series, histogram
+        )
+        _registry[indicator.name] = indicator
+        _short_names[indicator.short_name] = indicator.name
+        return func
+
+    return decorator
+
+
+def get_indicator(name: str) -> Indicator:
+    """Retourne un indicateur enregistré par son nom ou son nom court."""
+    indicator = _registry.get(name) or _registry.get(_short_names.get(name, ""))
+    if indicator is None:
+        raise ValueError(f"Indicator '{name}' not registered.")
+    return indicator
+
+
+def list_indicators() -> List[Indicator]:
+    """Liste des indicateurs enregistrés, triés par nom."""
+    return [_registry[name] for name in sorted(_registry)]
+
+
+def daily_series(data_array):
+    """Série des indicateurs qui sont la moyenne des valeurs journalières de leur variable d'entrée."""
+    return data_array
@@ -1,10 +1,47 @@
 import xarray as xr
 
 from ..xarray_accesor import *  # noqa: F401
+from .registry import register, daily_series
 
 
+@register(
+    variables=["rsdsAdjust"],
+    units="W/m²",
+    encoding={"lowest_value": 0, "value_step": 0.1, "channels": "rg"},
+    change="ratio",
+    short_name="rsds",
+    series=daily_series,
+)
 def rsdsmean(rsds: xr.DataArray) -> xr.DataArray:
     """Calcule la moyenne mensuelle du rayonnement solaire à la surface (rsds)."""
     rsds = rsds.stats.ymonstat("mean")
     rsds.name = "rsdsmean"
     return rsds
+
+
+@register(
+    variables=["rsdsAdjust"],
+    units="W/m²",
+    encoding={"lowest_value": 0, "value_step": 0.1, "channels": "rg"},
+    change="ratio",
+    cost=2,
+)
+def rsdsp10(rsds: xr.DataArray) -> xr.DataArray:
+    """10e centile mensuel pluri-annuel du rayonnement solaire à la surface (précision 1 W/m²)."""
+    rsds = rsds.stats.ymonquantile(0.1, value_range=(0, 500), bins=500)
+    rsds.name = "rsdsp10"
+    return rsds
+
+
+@register(
+    variables=["rsdsAdjust"],
+    units="W/m²",
+    encoding={"lowest_value": 0, "value_step": 0.1, "channels": "rg"},
+    change="ratio",
+    cost=2,
+)
+def rsdsp90(rsds: xr.DataArray) -> xr.DataArray:
+    """90e centile mensuel pluri-annuel du rayonnement solaire à la surface (précision 1 W/m²)."""
+    rsds = rsds.stats.ymonquantile(0.9, value_range=(0, 500), bins=500)
+    rsds.name = "rsdsp90"
+    return rsds
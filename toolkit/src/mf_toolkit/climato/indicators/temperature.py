@@ -1,15 +1,24 @@
 import xarray as xr
 
 from ..xarray_accesor import *  # noqa: F401
+from .registry import register, daily_series
 
 
 def kelvin_to_celsius(tas: xr.DataArray) -> xr.DataArray:
     """Convertit la température de Kelvin en degrés Celsius."""
-    tas = tas - 273.15
+    # Scalaire du même type que les données pour ne pas promouvoir float32 en float64
+    tas = tas - tas.dtype.type(273.15)
     tas.attrs["units"] = "C"
     return tas
 
 
+@register(
+    variables=["tasAdjust"],
+    units="°C",
+    encoding={"lowest_value": -20, "value_step": 0.01, "channels": "rg"},
+    short_name="tas",
+    series=kelvin_to_celsius,
+)
 def tasmean(tas: xr.DataArray) -> xr.DataArray:
     """Moyenne mensuelle de la température de l'air près de la surface en degrés Celsius."""
     tas = kelvin_to_celsius(tas)
@@ -18,42 +27,57 @@ def tasmean(tas: xr.DataArray) -> xr.DataArray:
     return tas_monthly
 
 
-def tasmax30(tasmax: xr.DataArray) -> xr.DataArray:
-    """Nombre de jours avec une température maximale supérieure à 30 degrés Celsius, moyenné par mois."""
+def tasmax30_series(tasmax: xr.DataArray) -> xr.DataArray:
+    """Nombre mensuel de jours avec une température maximale supérieure à 30 degrés Celsius."""
     tasmax = kelvin_to_celsius(tasmax)
     tasmax30 = tasmax.where(tasmax > 30)
-    tasmax30 = tasmax30.stats.monstat("count")
+    return tasmax30.stats.monstat("count")
+
+
+@register(
+    variables=["tasmaxAdjust"],
+    units="jour(s)",
+    encoding={"lowest_value": 0, "value_step": 1, "channels": "rg"},
+    cost=2,
+    series=tasmax30_series,
+)
+def tasmax30(tasmax: xr.DataArray) -> xr.DataArray:
+    """Nombre de jours avec une température maximale supérieure à 30 degrés Celsius, moyenné par mois."""
+    tasmax30 = tasmax30_series(tasmax)
     tasmax30 = tasmax30.stats.ymonstat("mean")
     tasmax30.name = "tasmax30"
     return tasmax30
 
 
-def tasmin0(tasmin: xr.DataArray) -> xr.DataArray:
-    """Nombre de jours avec une température minimale inférieure à 0 degré Celsius, moyenné par mois."""
+def tasmin0_series(tasmin: xr.DataArray) -> xr.DataArray:
+    """Nombre mensuel de jours avec une température minimale inférieure à 0 degré Celsius."""
     tasmin = kelvin_to_celsius(tasmin)
     tasmin0 = tasmin.where(tasmin < 0)
-    tasmin0 = tasmin0.stats.monstat("count")
+    return tasmin0.stats.monstat("count")
+
+
+@register(
+    variables=["tasminAdjust"],
+    units="jour(s)",
+    encoding={"lowest_value": 0, "value_step": 1, "channels": "rg"},
+    cost=2,
+    series=tasmin0_series,
+)
+def tasmin0(tasmin: xr.DataArray) -> xr.DataArray:
+    """Nombre de jours avec une température minimale inférieure à 0 degré Celsius, moyenné par mois."""
+    tasmin0 = tasmin0_series(tasmin)
     tasmin0 = tasmin0.stats.ymonstat("mean")
     tasmin0.name = "tasmin0"
     return tasmin0
 
 
-def dju(
+def dju_series(
     tas: xr.DataArray,
     base_temp: float = 18.0,
     heating_start: str = "10-15",
     heating_end: str = "04-15",
 ) -> xr.DataArray:
-    """
-    Calcule les degrés-jours de chauffage (DJU) à partir de la température de l'air près de la surface (tas),
-    sur une période de chauffage définie par une date de début et de fin (MM-DD).
-
-    Args:
-        tas (xr.DataArray): Température de l'air près de la surface en Kelvin.
-        base_temp (float): Température de base pour le calcul des DJU.
-        heating_start (str): Date de début de la période de chauffage au format 'MM-DD' (ex: '10-15').
-        heating_end (str): Date de fin de la période de chauffage au format 'MM-DD' (ex: '04-15').
-    """
+    """Degrés-jours de chauffage cumulés par mois (voir `dju`)."""
     # Convertir la température de Kelvin en degrés Celsius
     tas = kelvin_to_celsius(tas)
 
@@ -85,8 +109,51 @@ def dju(
     #
     dju = dju.where(~tas.isnull())
     # Calcul de la moyenne mensuelle pluriannuelle des DJU
-    dju = dju.stats.monstat("sum")
+    return dju.stats.monstat("sum")
+
+
+@register(
+    variables=["tasAdjust"],
+    units="°C.day",
+    encoding={"lowest_value": 0, "value_step": 1, "channels": "rg"},
+    cost=2,
+    series=dju_series,
+)
+def dju(
+    tas: xr.DataArray,
+    base_temp: float = 18.0,
+    heating_start: str = "10-15",
+    heating_end: str = "04-15",
+) -> xr.DataArray:
+    """
+    Calcule les degrés-jours de chauffage (DJU) à partir de la température de l'air près de la surface (tas),
+    sur une période de chauffage définie par une date de début et de fin (MM-DD).
+
+    Args:
+        tas (xr.DataArray): Température de l'air près de la surface en Kelvin.
+        base_temp (float): Température de base pour le calcul des DJU.
+        heating_start (str): Date de début de la période de chauffage au format 'MM-DD' (ex: '10-15').
+        heating_end (str): Date de fin de la période de chauffage au format 'MM-DD' (ex: '04-15').
+    """
+    dju = dju_series(tas, base_temp, heating_start, heating_end)
+    # Calcul de la moyenne mensuelle pluriannuelle des DJU
     dju = dju.stats.ymonstat("mean")
     # Renommer l'indicateur
     dju.name = "dju"
     return dju
+
+
+@register(
+    variables=["tasAdjust_hours_above_303.15"],
+    units="h/jour",
+    encoding={"lowest_value": 0, "value_step": 0.01, "channels": "rg"},
+    series=daily_series,
+)
+def tas30h(hours: xr.DataArray) -> xr.DataArray:
+    """
+    Nombre d'heures par jour avec une température supérieure à 30 degrés Celsius, moyenné par mois.
+    Données horaires (CPCRCM) seulement : les heures sont comptées à l'agrégation journalière.
+    """
+    tas30h = hours.stats.ymonstat("mean")
+    tas30h.name = "tas30h"
+    return tas30h
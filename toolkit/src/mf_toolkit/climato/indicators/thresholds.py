@@ -0,0 +1,153 @@
+"""
+Indicateurs à seuil tirés d'histogrammes journaliers par maille.
+
+Une passe sur les données journalières d'une période donne, pour chaque maille et chaque mois
+calendaire, un histogramme à classes fixes des valeurs de la variable (une famille par
+variable, voir `DAILY_HISTOGRAMS`). Mis en cache, il suffit à tous les seuils ("jours au-dessus
+de X" pour tout X, exact sur une borne de classe) et aux centiles approchés, sans relire les
+données journalières.
+"""
+from typing import Callable, Tuple, TypedDict
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ..sketch import histogram_exceedance, histogram_quantile
+from ..xarray_accesor import *  # noqa: F401
+from .registry import register, daily_series
+from .temperature import kelvin_to_celsius
+
+
+class DailyHistogram(TypedDict):
+    variable: str
+    transform: Callable
+    value_range: Tuple[float, float]
+    bins: int
+
+
+# Classes alignées sur les seuils usuels (degré, m/s, 5 W/m²)
+DAILY_HISTOGRAMS = {
+    "tasmax": DailyHistogram(
+        variable="tasmaxAdjust", transform=kelvin_to_celsius, value_range=(-30, 55), bins=170
+    ),
+    "tasmin": DailyHistogram(
+        variable="tasminAdjust", transform=kelvin_to_celsius, value_range=(-40, 35), bins=150
+    ),
+    "ws": DailyHistogram(variable="sfcWindAdjust", transform=daily_series, value_range=(0, 40), bins=160),
+    "rsds": DailyHistogram(variable="rsdsAdjust", transform=daily_series, value_range=(0, 500), bins=100),
+}
+
+DAYS_ENCODING = {"lowest_value": 0, "value_step": 1, "channels": "rg"}
+
+
+def daily_histogram(data: xr.DataArray, family: str) -> xr.Dataset:
+    """Histogramme mensuel par maille des valeurs journalières d'une famille ('tasmax', 'ws', ...).
+
+    Le nombre d'années de chaque mois calendaire ('years') ramène les comptes à une moyenne annuelle.
+    """
+    spec = DAILY_HISTOGRAMS[family]
+    values = spec["transform"](data)
+    counts = values.stats.ymonhist(spec["value_range"], spec["bins"])
+    # Au plus 31 jours x nombre d'années par classe : 16 bits suffisent pour des siècles
+    counts = counts.astype(np.uint16 if int(counts.max()) < 2**16 else np.int32)
+    time = data["time"]
+    months = pd.DataFrame({"year": time.dt.year.values, "month": time.dt.month.values})
+    years = months.drop_duplicates().groupby("month").size().reindex(range(1, 13), fill_value=0)
+    histogram = counts.rename("counts").to_dataset()
+    histogram["years"] = ("month", years.values.astype(np.int32))
+    histogram.attrs = {"family": family, "units": values.attrs.get("units", "")}
+    return histogram
+
+
+def threshold_days(histogram: xr.Dataset, threshold: float, below: bool = False) -> xr.DataArray:
+    """Nombre de jours au-dessus (ou en dessous) d'un seuil, moyenné par mois (0 sans donnée, comme `tasmax30`).
+
+    Une valeur égale au seuil, sur une borne de classe, est comptée au-dessus.
+    """
+    days = histogram_exceedance(histogram["counts"], threshold, below)
+    years = histogram["years"]
+    return (days / years.where(years > 0)).fillna(0)
+
+
+def threshold_quantile(histogram: xr.Dataset, q: float) -> xr.DataArray:
+    """Centile(s) mensuel(s) approché(s) des valeurs journalières, à la précision d'une classe."""
+    return histogram_quantile(histogram["counts"], q)
+
+
+@register(
+    variables=["tasmaxAdjust"],
+    units="jour(s)",
+    encoding=DAYS_ENCODING,
+    histogram=("tasmax", lambda histogram: threshold_days(histogram, 25)),
+)
+def tasmax25(tasmax: xr.DataArray) -> xr.DataArray:
+    """Nombre de jours avec une température maximale supérieure à 25 degrés Celsius, moyenné par mois."""
+    tasmax25 = threshold_days(daily_histogram(tasmax, "tasmax"), 25)
+    tasmax25.name = "tasmax25"
+    return tasmax25
+
+
+@register(
+    variables=["tasmaxAdjust"],
+    units="jour(s)",
+    encoding=DAYS_ENCODING,
+    histogram=("tasmax", lambda histogram: threshold_days(histogram, 35)),
+)
+def tasmax35(tasmax: xr.DataArray) -> xr.DataArray:
+    """Nombre de jours avec une température maximale supérieure à 35 degrés Celsius, moyenné par mois."""
+    tasmax35 = threshold_days(daily_histogram(tasmax, "tasmax"), 35)
+    tasmax35.name = "tasmax35"
+    return tasmax35
+
+
+@register(
+    variables=["tasminAdjust"],
+    units="jour(s)",
+    encoding=DAYS_ENCODING,
+    histogram=("tasmin", lambda histogram: threshold_days(histogram, -5, below=True)),
+)
+def tasminm5(tasmin: xr.DataArray) -> xr.DataArray:
+    """Nombre de jours avec une température minimale inférieure à -5 degrés Celsius, moyenné par mois."""
+    tasminm5 = threshold_days(daily_histogram(tasmin, "tasmin"), -5, below=True)
+    tasminm5.name = "tasminm5"
+    return tasminm5
+
+
+@register(
+    variables=["sfcWindAdjust"],
+    units="jour(s)",
+    encoding=DAYS_ENCODING,
+    histogram=("ws", lambda histogram: threshold_days(histogram, 3, below=True)),
+)
+def wscutin(sfc_wind: xr.DataArray) -> xr.DataArray:
+    """Nombre de jours avec un vent moyen à 10m inférieur à 3 m/s (démarrage des éoliennes), moyenné par mois."""
+    wscutin = threshold_days(daily_histogram(sfc_wind, "ws"), 3, below=True)
+    wscutin.name = "wscutin"
+    return wscutin
+
+
+@register(
+    variables=["sfcWindAdjust"],
+    units="jour(s)",
+    encoding=DAYS_ENCODING,
+    histogram=("ws", lambda histogram: threshold_days(histogram, 25)),
+)
+def wscutout(sfc_wind: xr.DataArray) -> xr.DataArray:
+    """Nombre de jours avec un vent moyen à 10m supérieur à 25 m/s (arrêt des éoliennes), moyenné par mois."""
+    wscutout = threshold_days(daily_histogram(sfc_wind, "ws"), 25)
+    wscutout.name = "wscutout"
+    return wscutout
+
+
+@register(
+    variables=["rsdsAdjust"],
+    units="jour(s)",
+    encoding=DAYS_ENCODING,
+    histogram=("rsds", lambda histogram: threshold_days(histogram, 50, below=True)),
+)
+def rsdslow(rsds: xr.DataArray) -> xr.DataArray:
+    """Nombre de jours avec un rayonnement solaire moyen inférieur à 50 W/m², moyenné par mois."""
+    rsdslow = threshold_days(daily_histogram(rsds, "rsds"), 50, below=True)
+    rsdslow.name = "rsdslow"
+    return rsdslow
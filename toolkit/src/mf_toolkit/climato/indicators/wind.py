@@ -1,6 +1,7 @@
 import xarray as xr
 
 from ..xarray_accesor import *  # noqa: F401
+from .registry import register, daily_series
 
 
 def open_era5_metro(variables: list[str]) -> xr.Dataset:
@@ -47,8 +48,44 @@ def sfcWind100(ws10: xr.DataArray) -> xr.DataArray:
     return ws100
 
 
+@register(
+    variables=["sfcWindAdjust"],
+    units="m/s",
+    encoding={"lowest_value": 0, "value_step": 0.1, "channels": "rg"},
+    change="ratio",
+    short_name="ws",
+    series=daily_series,
+)
 def wsmean(sfc_wind: xr.DataArray) -> xr.DataArray:
     """Calcul la vitesse mensuelle moyenne du vent à 10m."""
     ws = sfc_wind.stats.ymonstat("mean")
     ws.name = "wsmean"
     return ws
+
+
+@register(
+    variables=["sfcWindAdjust"],
+    units="m/s",
+    encoding={"lowest_value": 0, "value_step": 0.1, "channels": "rg"},
+    change="ratio",
+    cost=2,
+)
+def wsp10(sfc_wind: xr.DataArray) -> xr.DataArray:
+    """10e centile mensuel pluri-annuel de la vitesse du vent à 10m (précision 0.1 m/s)."""
+    ws = sfc_wind.stats.ymonquantile(0.1, value_range=(0, 40), bins=400)
+    ws.name = "wsp10"
+    return ws
+
+
+@register(
+    variables=["sfcWindAdjust"],
+    units="m/s",
+    encoding={"lowest_value": 0, "value_step": 0.1, "channels": "rg"},
+    change="ratio",
+    cost=2,
+)
+def wsp90(sfc_wind: xr.DataArray) -> xr.DataArray:
+    """90e centile mensuel pluri-annuel de la vitesse du vent à 10m (précision 0.1 m/s)."""
+    ws = sfc_wind.stats.ymonquantile(0.9, value_range=(0, 40), bins=400)
+    ws.name = "wsp90"
+    return ws
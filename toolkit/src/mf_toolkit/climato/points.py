@@ -0,0 +1,65 @@
+import hashlib
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+import xarray as xr
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+GRID_INDEX_CACHE_SIZE = 8
+
+_grid_index_cache: "OrderedDict[str, cKDTree]" = OrderedDict()
+
+
+def _to_xyz(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Coordonnées cartésiennes sur la sphère unité."""
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    return np.stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1
+    )
+
+
+def grid_lonlat(dataset: xr.Dataset) -> Tuple[xr.DataArray, xr.DataArray]:
+    """Longitudes et latitudes 2D de la grille (les coordonnées 1D sont étendues)."""
+    lon, lat = dataset["lon"], dataset["lat"]
+    if lon.ndim == 1 and lat.ndim == 1:
+        lon, lat = xr.broadcast(lon, lat)
+        lat = lat.transpose(*lon.dims)
+    return lon, lat
+
+
+def grid_index(lon: xr.DataArray, lat: xr.DataArray) -> cKDTree:
+    """KD-tree des mailles de la grille, mis en cache par empreinte des coordonnées."""
+    digest = hashlib.sha1()
+    digest.update(repr(lon.shape).encode())
+    digest.update(np.ascontiguousarray(lon.values, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(lat.values, dtype=np.float64).tobytes())
+    key = digest.hexdigest()
+
+    tree = _grid_index_cache.get(key)
+    if tree is None:
+        tree = cKDTree(_to_xyz(lon.values, lat.values).reshape(-1, 3))
+        _grid_index_cache[key] = tree
+        if len(_grid_index_cache) > GRID_INDEX_CACHE_SIZE:
+            _grid_index_cache.popitem(last=False)
+    else:
+        _grid_index_cache.move_to_end(key)
+    return tree
+
+
+def nearest_cells(
+    dataset: xr.Dataset, lon: np.ndarray, lat: np.ndarray
+) -> Tuple[Tuple[np.ndarray, ...], np.ndarray, Tuple[str, ...]]:
+    """Indices de la maille la plus proche de chaque point, en une requête vectorisée.
+
+    Returns:
+        tuple: (indices par dimension spatiale, distance en km, dimensions spatiales)
+    """
+    grid_lon, grid_lat = grid_lonlat(dataset)
+    tree = grid_index(grid_lon, grid_lat)
+    chord, flat_index = tree.query(_to_xyz(lon, lat))
+    distance_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+    indices = np.unravel_index(flat_index, grid_lon.shape)
+    return indices, distance_km, tuple(grid_lon.dims)
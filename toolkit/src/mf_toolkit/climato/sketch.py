@@ -0,0 +1,150 @@
+from typing import Iterable, Tuple, Union
+
+import numpy as np
+import xarray as xr
+
+
+def bin_edges(value_range: Tuple[float, float], bins: int) -> np.ndarray:
+    """Bornes des classes d'un histogramme à pas constant."""
+    low, high = value_range
+    if not high > low:
+        raise ValueError(f"Invalid value range: {value_range}")
+    return np.linspace(low, high, bins + 1)
+
+
+def accumulate_histogram(
+    counts: np.ndarray,
+    values: np.ndarray,
+    months: np.ndarray,
+    value_range: Tuple[float, float],
+) -> np.ndarray:
+    """Ajoute un bloc de valeurs journalières aux compteurs d'un histogramme mensuel.
+
+    Args:
+        counts (np.ndarray): Compteurs de forme (mois, classe, maille), mis à jour en place.
+        values (np.ndarray): Valeurs de forme (temps, ...), les dimensions spatiales sont aplaties.
+        months (np.ndarray): Mois (1-12) de chaque pas de temps.
+        value_range (tuple): Bornes (min, max) de l'histogramme. Les valeurs hors bornes
+            sont comptées dans la première ou la dernière classe, les NaN sont ignorés.
+    """
+    _, nbins, ncells = counts.shape
+    low, high = value_range
+    values = values.reshape(values.shape[0], -1)
+    cell_index = np.arange(ncells, dtype=np.int64)
+
+    # Un mois à la fois : le tableau temporaire de bincount reste de taille (classe, maille)
+    for month in np.unique(months):
+        month_values = values[months == month]
+        valid = ~np.isnan(month_values)
+        # Classe calculée en float64 : identique quelle que soit la précision des données
+        bin_index = np.floor((month_values[valid].astype(np.float64) - low) * (nbins / (high - low)))
+        bin_index = np.clip(bin_index, 0, nbins - 1).astype(np.int64)
+        flat_index = bin_index * ncells + np.broadcast_to(cell_index, month_values.shape)[valid]
+        counts[month - 1] += np.bincount(flat_index, minlength=nbins * ncells).reshape(
+            nbins, ncells
+        ).astype(counts.dtype)
+    return counts
+
+
+def histogram_quantile(
+    hist: xr.DataArray, q: Union[float, Iterable[float]]
+) -> xr.DataArray:
+    """Quantiles approchés par interpolation linéaire dans les classes d'un histogramme.
+
+    Args:
+        hist (xr.DataArray): Histogramme produit par `stats.ymonhist` (dimension 'bin').
+        q (float | list[float]): Quantile(s) entre 0 et 1.
+    """
+    scalar = np.isscalar(q)
+    quantiles = np.atleast_1d(np.asarray(q, dtype=float))
+    if np.any((quantiles < 0) | (quantiles > 1)):
+        raise ValueError("Quantiles must be between 0 and 1.")
+
+    hist = hist.transpose("month", "bin", ...)
+    counts = hist.values
+    lower = hist["bin_lower"].values
+    width = hist["bin_upper"].values - lower
+    nbins = counts.shape[1]
+
+    # Mois par mois : les cumuls restent contigus et de taille (classe, maille)
+    results = np.full((quantiles.size, counts.shape[0]) + counts.shape[2:], np.nan)
+    for month in range(counts.shape[0]):
+        month_counts = counts[month].reshape(nbins, -1)
+        cdf = month_counts.cumsum(axis=0)
+        total = cdf[-1]
+        for i, quantile in enumerate(quantiles):
+            target = quantile * total
+            index = np.minimum((cdf < target).sum(axis=0), nbins - 1)
+            in_bin = np.take_along_axis(month_counts, index[None], axis=0)[0]
+            before = np.take_along_axis(cdf, index[None], axis=0)[0] - in_bin
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fraction = np.where(in_bin > 0, (target - before) / in_bin, 0.0)
+            value = lower[index] + np.clip(fraction, 0, 1) * width[index]
+            value[total == 0] = np.nan
+            results[i, month] = value.reshape(counts.shape[2:])
+
+    dims = tuple(dim for dim in hist.dims if dim != "bin")
+    coords = {name: coord for name, coord in hist.coords.items() if "bin" not in coord.dims}
+    if scalar:
+        result = xr.DataArray(results[0], dims=dims, coords=coords)
+    else:
+        result = xr.DataArray(
+            results, dims=("quantile", *dims), coords=coords
+        ).assign_coords(quantile=quantiles)
+    result.attrs = {k: v for k, v in hist.attrs.items() if k != "long_name"}
+    return result
+
+
+def histogram_rank(counts: np.ndarray, edges: np.ndarray, rank: np.ndarray) -> np.ndarray:
+    """Valeur approchée de rang `rank` (1 = la plus petite) de chaque maille d'un histogramme.
+
+    Les valeurs d'une classe sont supposées réparties au milieu de parts égales de la classe :
+    l'erreur est d'au plus une largeur de classe.
+
+    Args:
+        counts (np.ndarray): Compteurs de forme (classe, maille).
+        edges (np.ndarray): Bornes des classes (voir `bin_edges`).
+        rank (np.ndarray): Rang de chaque maille ; NaN pour un rang nul ou au-delà de l'effectif.
+    """
+    nbins = counts.shape[0]
+    cdf = counts.cumsum(axis=0)
+    rank = np.asarray(rank)
+    index = np.minimum((cdf < rank).sum(axis=0), nbins - 1)
+    in_bin = np.take_along_axis(counts, index[None], axis=0)[0]
+    before = np.take_along_axis(cdf, index[None], axis=0)[0] - in_bin
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = (rank - before - 0.5) / in_bin
+    value = edges[index] + np.clip(fraction, 0, 1) * (edges[index + 1] - edges[index])
+    value[(rank < 1) | (rank > cdf[-1])] = np.nan
+    return value
+
+
+def histogram_exceedance(
+    hist: xr.DataArray, threshold: float, below: bool = False
+) -> xr.DataArray:
+    """Nombre de valeurs au-dessus (ou en dessous) d'un seuil d'après un histogramme.
+
+    Les classes entièrement au-delà du seuil sont comptées exactement, celle qui le contient
+    au prorata (valeurs supposées uniformes dans la classe) : le résultat est exact pour un
+    seuil sur une borne de classe.
+
+    Args:
+        hist (xr.DataArray): Histogramme produit par `stats.ymonhist` (dimension 'bin').
+        threshold (float): Seuil, dans l'unité des valeurs de l'histogramme.
+        below (bool): Compter les valeurs sous le seuil plutôt qu'au-dessus.
+    """
+    hist = hist.transpose("month", "bin", ...)
+    lower = hist["bin_lower"].values
+    upper = hist["bin_upper"].values
+    # Part de chaque classe au-dessus du seuil, sans bruit d'arrondi sur les bornes
+    above = np.clip((upper - threshold) / (upper - lower), 0, 1)
+    above[np.isclose(above, 0)] = 0
+    above[np.isclose(above, 1)] = 1
+    fraction = 1 - above if below else above
+    counts = np.tensordot(fraction, hist.values, axes=([0], [1]))
+
+    dims = tuple(dim for dim in hist.dims if dim != "bin")
+    coords = {name: coord for name, coord in hist.coords.items() if "bin" not in coord.dims}
+    result = xr.DataArray(counts, dims=dims, coords=coords)
+    result.attrs = {k: v for k, v in hist.attrs.items() if k != "long_name"}
+    return result
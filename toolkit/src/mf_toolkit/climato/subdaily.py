@@ -0,0 +1,288 @@
+"""
+Agrégation en flux des données horaires (CPCRCM) en journalier, puis en mensuel.
+
+Les simulations à convection résolue sont horaires et à maille fine : une variable d'un membre
+pèse ~24 fois ses données journalières. Chaque étape lit des blocs de jours (ou de mois)
+entiers dont la taille est bornée, les réduit et écrit le résultat à la suite d'un fichier
+NetCDF : la mémoire d'une étape ne dépend pas de la longueur de la simulation.
+
+Le fichier journalier nomme ses variables comme les données journalières RCM (`tasAdjust`,
+`tasmaxAdjust`, `tasminAdjust`...) : tous les indicateurs enregistrés s'y appliquent.
+
+Plafonds mémoire par étape (en Mio, variables d'environnement) :
+    MF_TOOLKIT_HOURLY_BLOCK_MB (horaire -> journalier), MF_TOOLKIT_DAILY_BLOCK_MB
+    (journalier -> mensuel, et sommes cumulées des indicateurs).
+"""
+import os
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import netCDF4
+import numpy as np
+import xarray as xr
+from xarray.coding.times import encode_cf_datetime
+
+from .. import instrumentation
+from ..data.remote import is_remote, open_remote_dataset
+from ..precision import as_compute_dtype, get_compute_dtype
+
+HOURLY_BLOCK_BYTES = int(os.environ.get("MF_TOOLKIT_HOURLY_BLOCK_MB", 1024)) * 2**20
+DAILY_BLOCK_BYTES = int(os.environ.get("MF_TOOLKIT_DAILY_BLOCK_MB", 1024)) * 2**20
+DAILY_STATS = ("mean", "max", "min")
+ADJUST_SUFFIX = "Adjust"
+HOURS_ABOVE = "_hours_above_"
+
+
+def _split_suffix(variable: str) -> Tuple[str, str]:
+    if variable.endswith(ADJUST_SUFFIX):
+        return variable[: -len(ADJUST_SUFFIX)], ADJUST_SUFFIX
+    return variable, ""
+
+
+def daily_variable(variable: str, stat: str) -> str:
+    """Nom de la statistique journalière d'une variable horaire ('tasAdjust', 'max' -> 'tasmaxAdjust')."""
+    if stat == "mean":
+        return variable
+    base, suffix = _split_suffix(variable)
+    return f"{base}{stat}{suffix}"
+
+
+def hourly_source(variable: str) -> Tuple[str, str]:
+    """Variable horaire et statistique d'une variable journalière ('tasminAdjust' -> ('tasAdjust', 'min')).
+
+    Les heures au-dessus d'un seuil ('tasAdjust_hours_above_303.15') viennent de 'tasAdjust', 'hours_above'.
+    """
+    if HOURS_ABOVE in variable:
+        return variable.split(HOURS_ABOVE)[0], "hours_above"
+    base, suffix = _split_suffix(variable)
+    for stat in ("max", "min"):
+        if base.endswith(stat) and len(base) > len(stat):
+            return f"{base[: -len(stat)]}{suffix}", stat
+    return variable, "mean"
+
+
+def hours_variable(variable: str, threshold: float) -> str:
+    """Nom du nombre d'heures au-dessus d'un seuil ('tasAdjust', 303.15 -> 'tasAdjust_hours_above_303.15')."""
+    return f"{variable}{HOURS_ABOVE}{threshold:g}"
+
+
+def daily_thresholds(variables: Iterable[str]) -> Dict[str, List[float]]:
+    """Seuils horaires à compter pour produire des variables journalières (voir `hours_variable`)."""
+    thresholds: Dict[str, List[float]] = {}
+    for variable in variables:
+        if HOURS_ABOVE in variable:
+            source, threshold = variable.split(HOURS_ABOVE)
+            thresholds.setdefault(source, []).append(float(threshold))
+    return thresholds
+
+
+def period_keys(time: xr.DataArray, freq: str) -> np.ndarray:
+    """Clé entière de la période ('D' jour, 'M' mois, 'Y' année) de chaque pas de temps (tout calendrier)."""
+    key = time.dt.year.values.astype(np.int64)
+    if freq in ("M", "D"):
+        key = key * 100 + time.dt.month.values
+    if freq == "D":
+        key = key * 100 + time.dt.day.values
+    return key
+
+
+def period_starts(key: np.ndarray) -> np.ndarray:
+    """Indice du premier pas de temps de chaque période (pas de temps triés)."""
+    return np.concatenate([[0], np.flatnonzero(np.diff(key)) + 1]).astype(np.int64)
+
+
+def time_blocks(time: xr.DataArray, freq: str, max_steps: int) -> List[slice]:
+    """Tranches de pas de temps faites de périodes entières, d'au plus `max_steps` pas (au moins une période)."""
+    starts = period_starts(period_keys(time, freq))
+    ends = np.append(starts[1:], time.size)
+    blocks = []
+    block_start = 0
+    for start, end in zip(starts, ends):
+        if end - block_start > max_steps and start > block_start:
+            blocks.append(slice(int(block_start), int(start)))
+            block_start = start
+    blocks.append(slice(int(block_start), int(time.size)))
+    return blocks
+
+
+def block_steps(data: xr.DataArray, max_bytes: int, copies: int = 3) -> int:
+    """Nombre de pas de temps par bloc pour rester sous `max_bytes` (bloc et temporaires de réduction)."""
+    step_bytes = get_compute_dtype().itemsize * copies
+    for dim, size in data.sizes.items():
+        if dim != "time":
+            step_bytes *= size
+    return max(1, max_bytes // step_bytes)
+
+
+def _reduce_periods(values: np.ndarray, starts: np.ndarray, stat: str) -> np.ndarray:
+    """Réduction de chaque période (suite de pas de temps) ; un NaN rend la période NaN, comme `ymonstat`."""
+    lengths = np.diff(np.append(starts, len(values)))
+    if np.all(lengths == lengths[0]):
+        # Cas courant (24 heures par jour) : une seule réduction sur un tableau remodelé
+        grouped = values.reshape((len(starts), int(lengths[0])) + values.shape[1:])
+        return getattr(np, stat)(grouped, axis=1)
+    if stat == "mean":
+        shape = (-1,) + (1,) * (values.ndim - 1)
+        return np.add.reduceat(values, starts, axis=0) / lengths.reshape(shape)
+    if stat == "sum":
+        return np.add.reduceat(values, starts, axis=0)
+    ufunc = np.maximum if stat == "max" else np.minimum
+    return ufunc.reduceat(values, starts, axis=0)
+
+
+def aggregate_block(
+    block: xr.DataArray,
+    freq: str,
+    stats: Dict[str, str],
+    thresholds: Sequence[float] = (),
+) -> xr.Dataset:
+    """Agrège un bloc de périodes entières.
+
+    Args:
+        block (xr.DataArray): Pas de temps (dimension 'time' en premier) de périodes entières.
+        freq (str): 'D' (journalier) ou 'M' (mensuel).
+        stats (dict): Nom de la variable produite -> statistique ('mean', 'max', 'min', 'sum').
+        thresholds (list): Seuils (unité de `block`) dont on compte les pas de temps au-dessus,
+            en heures pour des données horaires.
+    """
+    block = block.transpose("time", ...)
+    starts = period_starts(period_keys(block["time"], freq))
+    values = block.values
+    dims = block.dims
+    coords = {name: coord for name, coord in block.coords.items() if "time" not in coord.dims}
+    # Date du premier pas de temps de chaque période
+    coords["time"] = block["time"].isel(time=starts).dt.floor("D").values
+
+    result = xr.Dataset(coords=coords)
+    for name, stat in stats.items():
+        result[name] = (dims, _reduce_periods(values, starts, stat), dict(block.attrs))
+    if thresholds:
+        missing = _reduce_periods(np.isnan(values), starts, "max")
+        for threshold in thresholds:
+            hours = _reduce_periods((values > threshold).astype(values.dtype), starts, "sum")
+            hours[missing] = np.nan
+            result[hours_variable(str(block.name), threshold)] = (dims, hours, {"units": "h"})
+    return result
+
+
+class NetCDFAppender:
+    """Écrit des blocs successifs le long de 'time' dans un fichier NetCDF, publié à la fermeture.
+
+    Le premier bloc crée le fichier (dimension 'time' illimitée), les suivants y sont ajoutés
+    sans relire les précédents. Le fichier n'apparaît sous `path` qu'une fois complet.
+    """
+
+    def __init__(self, path: str, attrs: Optional[dict] = None) -> None:
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.attrs = attrs or {}
+        self.steps = 0
+
+    def append(self, block: xr.Dataset) -> None:
+        if self.steps == 0:
+            block = block.copy()
+            block.attrs = {**self.attrs, **block.attrs}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            block.to_netcdf(self.tmp_path, unlimited_dims=["time"])
+        else:
+            with netCDF4.Dataset(self.tmp_path, "a") as nc:
+                time = nc.variables["time"]
+                calendar = getattr(time, "calendar", "standard")
+                values, _, _ = encode_cf_datetime(block["time"].values, time.units, calendar)
+                stop = self.steps + block.sizes["time"]
+                time[self.steps:stop] = values
+                for name, variable in block.data_vars.items():
+                    nc.variables[name][self.steps:stop] = variable.transpose("time", ...).values
+        self.steps += block.sizes["time"]
+
+    def close(self) -> str:
+        if self.steps == 0:
+            raise ValueError(f"Nothing was written to {self.path}")
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+
+def _open(path: str) -> xr.Dataset:
+    if is_remote(path):
+        return open_remote_dataset(path)
+    return xr.open_dataset(path)
+
+
+def _time_variables(dataset: xr.Dataset) -> List[str]:
+    return [
+        name for name, variable in dataset.data_vars.items()
+        if "time" in variable.dims and variable.ndim > 1 and not name.endswith("_bnds")
+    ]
+
+
+@instrumentation.traced("hourly_to_daily", profile=True)
+def hourly_to_daily(
+    path: str,
+    output_path: str,
+    variables: Optional[Iterable[str]] = None,
+    stats: Sequence[str] = DAILY_STATS,
+    thresholds: Optional[Dict[str, Sequence[float]]] = None,
+    max_bytes: int = HOURLY_BLOCK_BYTES,
+) -> str:
+    """
+    Statistiques journalières d'un fichier horaire, lues et écrites par blocs de jours entiers.
+
+    Args:
+        path (str): Fichier horaire (chemin ou URL).
+        output_path (str): Fichier journalier produit (variables nommées par `daily_variable`).
+        variables (list): Variables horaires à agréger (par défaut, toutes).
+        stats (list): Statistiques journalières ('mean', 'max', 'min').
+        thresholds (dict): Variable -> seuils dont on compte les heures au-dessus par jour.
+        max_bytes (int): Plafond mémoire d'un bloc horaire.
+    Returns:
+        str: `output_path`
+    """
+    dataset = _open(path)
+    variables = list(variables or _time_variables(dataset))
+    thresholds = thresholds or {}
+    appender = NetCDFAppender(output_path, {**dataset.attrs, "frequency": "day"})
+    # Un seul bloc horaire d'une variable en mémoire à la fois
+    steps = min(block_steps(dataset[variable], max_bytes) for variable in variables)
+    for block_slice in time_blocks(dataset["time"], "D", steps):
+        daily = []
+        for variable in variables:
+            with instrumentation.span("hourly_to_daily.read", variable=variable):
+                block = as_compute_dtype(dataset[variable].isel(time=block_slice)).load()
+            instrumentation.count("cells_processed", block.size)
+            with instrumentation.span("hourly_to_daily.reduce", variable=variable):
+                daily.append(
+                    aggregate_block(
+                        block,
+                        "D",
+                        {daily_variable(variable, stat): stat for stat in stats},
+                        thresholds.get(variable, ()),
+                    )
+                )
+        appender.append(xr.merge(daily, combine_attrs="drop"))
+    logging.info(f"Wrote {appender.steps} days to {output_path}")
+    return appender.close()
+
+
+@instrumentation.traced("daily_to_monthly", profile=True)
+def daily_to_monthly(
+    path: str,
+    output_path: str,
+    variables: Optional[Iterable[str]] = None,
+    max_bytes: int = DAILY_BLOCK_BYTES,
+) -> str:
+    """
+    Série mensuelle d'un fichier journalier, par blocs de mois entiers : moyenne des
+    statistiques journalières, somme des heures au-dessus des seuils.
+    """
+    dataset = _open(path)
+    variables = list(variables or _time_variables(dataset))
+    appender = NetCDFAppender(output_path, {**dataset.attrs, "frequency": "mon"})
+    steps = min(block_steps(dataset[variable], max_bytes) for variable in variables)
+    for block_slice in time_blocks(dataset["time"], "M", steps):
+        monthly = []
+        for variable in variables:
+            block = as_compute_dtype(dataset[variable].isel(time=block_slice)).load()
+            stat = "sum" if "_hours_above_" in variable else "mean"
+            monthly.append(aggregate_block(block, "M", {variable: stat}))
+        appender.append(xr.merge(monthly, combine_attrs="drop"))
+    return appender.close()
@@ -0,0 +1,140 @@
+"""
+Climatologies de fenêtres quelconques à partir de sommes cumulées annuelles par mois.
+
+Une seule passe sur les données journalières calcule, pour chaque (année, mois) et chaque
+maille, la somme, la somme des carrés et le nombre de valeurs valides de la série d'un
+indicateur. Les sommes cumulées sur les années donnent ensuite la climatologie mensuelle
+(et ses variances) de n'importe quelle fenêtre d'années par une simple différence : tous les
+niveaux TRACC et les fenêtres glissantes viennent de la même passe.
+"""
+from typing import Tuple
+
+import numpy as np
+import xarray as xr
+
+from .. import instrumentation
+
+PREFIX_VARIABLES = ("sum", "sumsq", "count", "total")
+
+
+def yearly_monthly_sums(series: xr.DataArray) -> xr.Dataset:
+    """Somme, somme des carrés, nombre de valeurs valides et nombre total par (année, mois).
+
+    `series` est une série temporelle (journalière ou mensuelle) triée par date.
+    """
+    series = series.transpose("time", ...)
+    spatial_dims = [dim for dim in series.dims if dim != "time"]
+    years = series["time.year"].values
+    months = series["time.month"].values
+    first_year = int(years.min())
+    year_count = int(years.max()) - first_year + 1
+
+    # Une passe : les pas de temps d'un même (année, mois) sont contigus, sommés bloc par bloc
+    # (seul un mois est converti en float64 à la fois)
+    key = (years - first_year) * 12 + months - 1
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(key)) + 1])
+    ends = np.concatenate([starts[1:], [len(key)]])
+    values = series.values
+    shape = (year_count * 12,) + values.shape[1:]
+    data = {
+        "sum": np.zeros(shape, dtype=np.float64),
+        "sumsq": np.zeros(shape, dtype=np.float64),
+        "count": np.zeros(shape, dtype=np.int32),
+    }
+    total = np.zeros(year_count * 12, dtype=np.int32)
+    with instrumentation.span("windows.yearly_monthly_sums"):
+        for start, end in zip(starts, ends):
+            block = values[start:end].astype(np.float64)
+            valid = ~np.isnan(block)
+            block[~valid] = 0.0
+            index = key[start]
+            data["sum"][index] = block.sum(axis=0)
+            data["sumsq"][index] = np.einsum("t...,t...->...", block, block)
+            data["count"][index] = valid.sum(axis=0)
+            total[index] = end - start
+    data = {name: array.reshape((year_count, 12) + values.shape[1:]) for name, array in data.items()}
+
+    coords = {name: coord for name, coord in series.coords.items() if "time" not in coord.dims}
+    dims = ("year", "month", *spatial_dims)
+    dataset = xr.Dataset(
+        {name: (dims, array) for name, array in data.items()},
+        coords={**coords, "year": np.arange(first_year, first_year + year_count), "month": np.arange(1, 13)},
+    )
+    dataset["total"] = (("year", "month"), total.reshape(year_count, 12))
+    dataset["sum"].attrs = dict(series.attrs)
+    return dataset
+
+
+def cumulative_sums(sums: xr.Dataset) -> xr.Dataset:
+    """Sommes cumulées sur les années : la valeur à l'année `y` couvre les années < `y`."""
+    years = sums["year"].values
+    edges = np.arange(years[0], years[-1] + 2)
+    prefix = {}
+    for name in PREFIX_VARIABLES:
+        data = sums[name]
+        values = np.cumsum(data.values, axis=0)
+        values = np.concatenate([np.zeros((1,) + values.shape[1:], dtype=values.dtype), values])
+        prefix[name] = (data.dims, values, data.attrs)
+    coords = {name: coord for name, coord in sums.coords.items() if name != "year"}
+    return xr.Dataset(prefix, coords={**coords, "year": edges}, attrs=sums.attrs)
+
+
+def _window_index(prefix: xr.Dataset, year_start: int, year_end: int) -> Tuple[int, int]:
+    # Comme une sélection par dates : la fenêtre est réduite aux années disponibles
+    first = int(prefix["year"].values[0])
+    last = int(prefix["year"].values[-1])
+    start = min(max(year_start, first), last)
+    end = min(max(year_end + 1, first), last)
+    if end <= start:
+        raise ValueError(f"Window {year_start}-{year_end} is outside the data ({first}-{last - 1})")
+    return start - first, end - first
+
+
+def window_climatology(prefix: xr.Dataset, year_start: int, year_end: int) -> xr.Dataset:
+    """Moyenne et variances mensuelles des années `year_start` à `year_end` (incluses).
+
+    `variance` est la variance interannuelle : celle des moyennes mensuelles de chaque année de
+    la fenêtre. `daily_variance` est celle de toutes les valeurs de la série du mois sur la
+    fenêtre (journalières pour une série journalière), variabilité au sein du mois comprise.
+    Variances de population, comme `ymonvar`. Comme `ymonstat` (skipna=False), une maille est
+    NaN dès qu'une valeur manque.
+    """
+    start, end = _window_index(prefix, year_start, year_end)
+    window = {name: prefix[name].isel(year=end) - prefix[name].isel(year=start) for name in PREFIX_VARIABLES}
+    complete = (window["count"] == window["total"]) & (window["total"] > 0)
+    count = window["count"].where(complete)
+    mean = window["sum"] / count
+    daily_variance = window["sumsq"] / count - mean * mean
+    mean.attrs = dict(prefix["sum"].attrs)
+
+    # Sommes de chaque année de la fenêtre : différences des sommes cumulées consécutives
+    yearly = {name: prefix[name].isel(year=slice(start, end + 1)).diff("year") for name in ("sum", "count")}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        monthly_means = yearly["sum"] / yearly["count"]
+    variance = monthly_means.var("year", skipna=False).where(complete)
+    return xr.Dataset(
+        {"mean": mean, "variance": variance, "daily_variance": daily_variance.clip(min=0)},
+        attrs=prefix.attrs,
+    )
+
+
+def running_climatology(prefix: xr.Dataset, window: int = 20, before: int = 10) -> xr.DataArray:
+    """Climatologies mensuelles glissantes : pour chaque année `y` entièrement couverte, la
+    moyenne des années `y - before` à `y - before + window - 1` (fenêtres TRACC par défaut)."""
+    years = prefix["year"].values
+    if len(years) - 1 < window:
+        raise ValueError(f"{len(years) - 1} years of data, less than a {window}-year window")
+    upper = {name: prefix[name].isel(year=slice(window, None)) for name in PREFIX_VARIABLES}
+    lower = {name: prefix[name].isel(year=slice(0, len(years) - window)) for name in PREFIX_VARIABLES}
+    window_sums = {name: upper[name].values - lower[name].values for name in PREFIX_VARIABLES}
+    # Le nombre total de pas de temps ne dépend pas de la maille
+    total = window_sums["total"]
+    window_sums["total"] = total.reshape(total.shape + (1,) * (window_sums["count"].ndim - total.ndim))
+    complete = (window_sums["count"] == window_sums["total"]) & (window_sums["total"] > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(complete, window_sums["sum"] / window_sums["count"], np.nan)
+    coords = {name: coord for name, coord in prefix["sum"].coords.items() if name != "year"}
+    center = years[: len(years) - window] + before
+    result = xr.DataArray(mean, dims=prefix["sum"].dims, coords={**coords, "year": center})
+    result.attrs = dict(prefix["sum"].attrs)
+    return result
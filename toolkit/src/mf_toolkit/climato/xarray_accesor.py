@@ -1,9 +1,15 @@
-from typing import Callable
+from functools import partial
+from typing import Callable, Iterable, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import xarray as xr
 from xarray.core import _aggregations
 
+from .. import instrumentation
+from .points import nearest_cells
+from .sketch import accumulate_histogram, bin_edges, histogram_quantile
+
 
 @xr.register_dataarray_accessor("stats")
 class StatsDataArrayAccessor:
@@ -15,22 +21,80 @@ class StatsDataArrayAccessor:
             func = getattr(_aggregations.DataArrayResampleAggregations, stat)
         except AttributeError:
             raise ValueError(f"Stat '{stat}' not recognized.")
-        return func
+        if stat == "count":
+            # count ne prend pas d'argument skipna
+            return func
+        return partial(func, skipna=False)
 
     def timestat(self, stat: str) -> xr.DataArray:
         """Statistique temporelle"""
         stat_func = self.__get_stat_func(stat)
-        return self._obj.map(stat_func, dim="time", skipna=False)
+        return self._obj.map(stat_func, dim="time")
 
     def monstat(self, stat: str) -> xr.DataArray:
         """Statistique mensuelle."""
         stat_func = self.__get_stat_func(stat)
-        return self._obj.resample(time="ME").map(stat_func, dim="time", skipna=False)
+        with instrumentation.span("stats.monstat", stat=stat):
+            return self._obj.resample(time="ME").map(stat_func, dim="time")
 
     def ymonstat(self, stat: str) -> xr.DataArray:
         """Statistique mensuelle pluri-annuelles"""
         stat_func = self.__get_stat_func(stat)
-        return self._obj.groupby("time.month").map(stat_func, dim="time", skipna=False)
+        with instrumentation.span("stats.ymonstat", stat=stat):
+            return self._obj.groupby("time.month").map(stat_func, dim="time")
+
+    def ymonhist(
+        self, value_range: Tuple[float, float], bins: int = 200, block: str = "YS"
+    ) -> xr.DataArray:
+        """Histogramme mensuel pluri-annuel par maille, calculé bloc par bloc.
+
+        Seul un bloc temporel (une année par défaut) est chargé à la fois : la mémoire
+        est fixe par maille (12 x `bins` compteurs) quelle que soit la longueur de la période.
+        """
+        da = self._obj
+        spatial_dims = [dim for dim in da.dims if dim != "time"]
+        da = da.transpose("time", *spatial_dims)
+        spatial_shape = tuple(da.sizes[dim] for dim in spatial_dims)
+        edges = bin_edges(value_range, bins)
+
+        counts = np.zeros((12, bins, int(np.prod(spatial_shape))), dtype=np.int32)
+        for _, indices in da.resample(time=block).groups.items():
+            block_da = da.isel(time=indices)
+            with instrumentation.span("stats.ymonhist.block"):
+                accumulate_histogram(
+                    counts, block_da.values, block_da["time.month"].values, value_range
+                )
+
+        coords = {
+            name: coord
+            for name, coord in da.coords.items()
+            if "time" not in coord.dims
+        }
+        hist = xr.DataArray(
+            counts.reshape((12, bins) + spatial_shape),
+            dims=("month", "bin", *spatial_dims),
+            coords=coords,
+        )
+        hist = hist.assign_coords(
+            month=np.arange(1, 13),
+            bin=(edges[:-1] + edges[1:]) / 2,
+            bin_lower=("bin", edges[:-1]),
+            bin_upper=("bin", edges[1:]),
+        )
+        hist.attrs = {**da.attrs, "long_name": "count"}
+        return hist
+
+    def ymonquantile(
+        self,
+        q: Union[float, Iterable[float]],
+        value_range: Tuple[float, float],
+        bins: int = 200,
+    ) -> xr.DataArray:
+        """Quantile(s) mensuel(s) pluri-annuel(s) approché(s), en une seule passe à mémoire bornée.
+
+        La précision est celle d'une classe de l'histogramme : (max - min) / `bins`.
+        """
+        return histogram_quantile(self.ymonhist(value_range, bins), q)
 
 
 @xr.register_dataset_accessor("climato")
@@ -57,7 +121,8 @@ class ClimatoDatasetAccessor:
             "datetime_end": datetime_end,
         }
 
-    def sel_tracc_period(self, level: str) -> xr.Dataset:
+    def tracc_years(self, level: str) -> Tuple[str, int, int]:
+        """Niveau TRACC normalisé et années (début, fin incluses) de sa fenêtre de 20 ans."""
         json_path = "data/tracc/tracc.json"
         tracc_info_all = pd.read_json(json_path, typ="series").to_dict()
         dataset_id = self.dataset_id()
@@ -71,9 +136,74 @@ class ClimatoDatasetAccessor:
         year = tracc_info.get(level)
         if year is None:
             raise ValueError(f"No year found for tracc level: {level}")
-        year_start = year - 10
-        year_end = year + 9
+        return level, year - 10, year + 9
+
+    def sel_tracc_period(self, level: str) -> xr.Dataset:
+        level, year_start, year_end = self.tracc_years(level)
         date_start = f"{year_start}-01-01"
         date_end = f"{year_end}-12-31"
         self._obj.attrs.update({"tracc_level": level})
         return self._obj.sel(time=slice(date_start, date_end))
+
+    def extract_points(
+        self,
+        lon: Sequence[float],
+        lat: Sequence[float],
+        site: Optional[Sequence] = None,
+        variables: Optional[Sequence[str]] = None,
+        max_distance_km: Optional[float] = None,
+    ) -> pd.DataFrame:
+        """Extrait les séries des mailles les plus proches d'une liste de points (lon/lat).
+
+        Les points sont associés aux mailles via un KD-tree mis en cache. Les mailles sont lues
+        par bande de la première dimension spatiale, avec seulement leurs colonnes : le volume lu
+        croît avec le nombre de sites, et non avec le produit lignes × colonnes distinctes.
+
+        Returns:
+            pd.DataFrame: Table "tidy", une ligne par (site, pas de temps/mois).
+        """
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        site = np.arange(lon.size) if site is None else np.asarray(site)
+        indices, distance_km, spatial_dims = nearest_cells(self._obj, lon, lat)
+
+        names = variables or [
+            name
+            for name, da in self._obj.data_vars.items()
+            if set(spatial_dims).issubset(da.dims)
+        ]
+        dataset = self._obj[list(names)]
+        cells, inverse = np.unique(np.stack(indices), axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+        if len(spatial_dims) == 1:
+            bands = [np.arange(cells.shape[1])]
+        else:
+            bands = [np.flatnonzero(cells[0] == row) for row in np.unique(cells[0])]
+        parts = []
+        for band in bands:
+            selection = {
+                dim: xr.DataArray(cells[axis, band], dims="cell")
+                for axis, dim in enumerate(spatial_dims)
+            }
+            if len(spatial_dims) > 1:
+                selection[spatial_dims[0]] = int(cells[0, band[0]])
+            parts.append(dataset.isel(selection))
+        subset = (
+            xr.concat(parts, dim="cell", coords="different", compat="equals")
+            if len(parts) > 1
+            else parts[0]
+        )
+        # Position de chaque maille distincte dans la concaténation des bandes
+        position = np.empty(cells.shape[1], dtype=np.intp)
+        position[np.concatenate(bands)] = np.arange(cells.shape[1])
+        points = subset.isel(cell=xr.DataArray(position[inverse], dims="site"))
+        points = points.assign_coords(
+            site=site,
+            site_lon=("site", lon),
+            site_lat=("site", lat),
+            distance_km=("site", distance_km),
+        )
+        if max_distance_km is not None:
+            points = points.where(points["distance_km"] <= max_distance_km)
+        dim_order = ["site"] + [dim for dim in points.dims if dim != "site"]
+        return points.to_dataframe(dim_order=dim_order).reset_index()
@@ -0,0 +1,192 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, Hashable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy import sparse
+
+from ..data.config import CACHE_DIR
+
+ZONAL_CACHE_DIR = os.path.join(CACHE_DIR, "zonal")
+
+
+class ZonalWeights:
+    """Matrice creuse (région x maille) de poids d'agrégation spatiale pour une grille donnée.
+
+    La grille (taille et coordonnées de chaque dimension spatiale) est conservée : `apply`
+    refuse les données d'une autre grille.
+    """
+
+    def __init__(
+        self,
+        matrix: sparse.csr_matrix,
+        regions: Sequence,
+        spatial_dims: Sequence[Hashable],
+        sizes: Optional[Sequence[int]] = None,
+        coords: Optional[Dict[Hashable, np.ndarray]] = None,
+    ) -> None:
+        self.matrix = matrix
+        self.regions = list(regions)
+        self.spatial_dims = list(spatial_dims)
+        self.sizes = tuple(int(size) for size in sizes) if sizes is not None else None
+        self.coords = dict(coords or {})
+
+    def check_grid(self, da: xr.DataArray) -> None:
+        """ValueError si `da` n'est pas sur la grille de la matrice."""
+        sizes = tuple(da.sizes[dim] for dim in self.spatial_dims)
+        if self.sizes is not None:
+            expected = dict(zip(self.spatial_dims, self.sizes))
+            mismatch = sizes != self.sizes
+        else:
+            expected = f"{self.matrix.shape[1]} cells"
+            mismatch = int(np.prod(sizes)) != self.matrix.shape[1]
+        if mismatch:
+            raise ValueError(
+                f"Variable '{da.name}' is on a {dict(zip(self.spatial_dims, sizes))} grid, "
+                f"the zonal weights on a {expected} grid"
+            )
+        for dim, values in self.coords.items():
+            if dim in da.coords and not _same_values(da[dim].values, values):
+                raise ValueError(f"Variable '{da.name}' has other '{dim}' coordinates than the zonal weights")
+
+    def apply(self, data: Union[xr.Dataset, xr.DataArray]) -> pd.DataFrame:
+        """Moyenne pondérée de chaque variable par région, en un seul produit matriciel creux.
+
+        Toutes les dimensions non spatiales (mois, niveau TRACC, ...) sont traitées d'un coup.
+        Les mailles NaN sont exclues et les poids renormalisés.
+
+        Returns:
+            pd.DataFrame: Une ligne par (région, dimensions non spatiales), une colonne par variable.
+        """
+        if isinstance(data, xr.DataArray):
+            data = data.to_dataset(name=data.name or "value")
+
+        columns = {}
+        index = None
+        for name, da in data.data_vars.items():
+            if not set(self.spatial_dims).issubset(da.dims):
+                continue
+            other_dims = [dim for dim in da.dims if dim not in self.spatial_dims]
+            da = da.transpose(*self.spatial_dims, *other_dims)
+            self.check_grid(da)
+            values = da.values.reshape(self.matrix.shape[1], -1)
+            valid = ~np.isnan(values)
+            sums = self.matrix @ np.where(valid, values, 0.0)
+            norms = self.matrix @ valid.astype(np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = np.where(norms > 0, sums / norms, np.nan)
+            columns[name] = means.ravel()
+
+            if index is None:
+                levels = [self.regions] + [da[dim].values for dim in other_dims]
+                index = pd.MultiIndex.from_product(levels, names=["region"] + other_dims)
+        if index is None:
+            raise ValueError(f"No variable with spatial dims {self.spatial_dims}")
+        return pd.DataFrame(columns, index=index).reset_index()
+
+
+def _same_values(a: np.ndarray, b: np.ndarray) -> bool:
+    if a.shape != b.shape:
+        return False
+    if np.issubdtype(a.dtype, np.number) and np.issubdtype(b.dtype, np.number):
+        return bool(np.allclose(a, b))
+    return bool(np.array_equal(a, b))
+
+
+def _grid_coords(regions: xr.DataArray) -> Dict[Hashable, np.ndarray]:
+    """Coordonnées de dimension (x/y, lat/lon 1D) de la grille."""
+    return {dim: regions[dim].values for dim in regions.dims if dim in regions.coords}
+
+
+def _grid_key(regions: xr.DataArray, weights: Optional[xr.DataArray]) -> str:
+    digest = hashlib.sha1()
+    digest.update(repr((regions.dims, regions.shape)).encode())
+    digest.update(np.ascontiguousarray(regions.values).tobytes())
+    # Coordonnées de la grille (x/y, lat/lon) : deux domaines de même forme ne partagent pas d'entrée
+    for name in sorted(str(name) for name in regions.coords):
+        coord = regions.coords[name]
+        if set(coord.dims) <= set(regions.dims):
+            digest.update(name.encode())
+            digest.update(np.ascontiguousarray(coord.values).tobytes())
+    if weights is not None:
+        digest.update(np.ascontiguousarray(weights.values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def build_zonal_weights(
+    regions: Optional[xr.DataArray] = None,
+    weights: Optional[xr.DataArray] = None,
+    cache_dir: Optional[str] = ZONAL_CACHE_DIR,
+) -> ZonalWeights:
+    """Construit (ou relit depuis le cache disque) la matrice de poids maille -> région.
+
+    Args:
+        regions (xr.DataArray): Code de région par maille (NaN ou négatif = hors région).
+            Si absent, toutes les mailles forment une seule région "all".
+        weights (xr.DataArray): Poids fractionnaire par maille sur la même grille
+            (ex: fraction de terre de `fracLand_METROPOLE_SAFRAN.nc`).
+        cache_dir (str): Répertoire du cache, `None` pour le désactiver.
+    """
+    if regions is None and weights is None:
+        raise ValueError("At least one of regions or weights is required.")
+    if regions is None:
+        regions = xr.zeros_like(weights, dtype=np.int64)
+        labels: List = ["all"]
+    else:
+        labels = []
+
+    if weights is not None:
+        weights = weights.transpose(*regions.dims)
+
+    cache_path = None
+    if cache_dir is not None:
+        # Tableaux de la matrice dans le .npz (relus sans pickle), étiquettes et forme en JSON
+        cache_path = os.path.join(cache_dir, _grid_key(regions, weights))
+        if os.path.isfile(f"{cache_path}.json"):
+            logging.info(f"Loading zonal weights from {cache_path}.npz")
+            with open(f"{cache_path}.json") as f:
+                metadata = json.load(f)
+            with np.load(f"{cache_path}.npz", allow_pickle=False) as cached:
+                matrix = sparse.csr_matrix(
+                    (cached["data"], cached["indices"], cached["indptr"]),
+                    shape=tuple(metadata["shape"]),
+                )
+            # Entrée clé de la grille : ses coordonnées sont celles de `regions`
+            return ZonalWeights(matrix, metadata["regions"], regions.dims, regions.shape, _grid_coords(regions))
+
+    codes = regions.values.ravel()
+    cell_weights = (
+        np.ones(codes.shape) if weights is None else np.nan_to_num(weights.values.ravel())
+    )
+    valid = ~pd.isna(codes) & (cell_weights > 0)
+    valid[valid] = codes[valid] >= 0
+    unique_codes, rows = np.unique(codes[valid], return_inverse=True)
+    cols = np.flatnonzero(valid)
+    matrix = sparse.csr_matrix(
+        (cell_weights[valid], (rows, cols)), shape=(len(unique_codes), codes.size)
+    )
+    labels = labels or unique_codes.tolist()
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(f"{cache_path}.npz", data=matrix.data, indices=matrix.indices, indptr=matrix.indptr)
+        # Écrit en dernier : une entrée n'est relue que si ses tableaux sont complets
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"shape": list(matrix.shape), "regions": labels}, f)
+        os.replace(tmp_path, f"{cache_path}.json")
+    return ZonalWeights(matrix, labels, regions.dims, regions.shape, _grid_coords(regions))
+
+
+def zonal_mean(
+    data: Union[xr.Dataset, xr.DataArray],
+    regions: Optional[xr.DataArray] = None,
+    weights: Optional[xr.DataArray] = None,
+    cache_dir: Optional[str] = ZONAL_CACHE_DIR,
+) -> pd.DataFrame:
+    """Moyenne d'un indicateur par région et/ou par masque, sous forme de table."""
+    return build_zonal_weights(regions, weights, cache_dir).apply(data)
@@ -1,9 +1,29 @@
-from .downloader import download
-from .search import list_files
-from .export import export_monthly_geotiff
+import importlib
+
+# Re-exports are resolved on first access so that importing mf_toolkit.data
+# (eg. for a catalog query) does not pull in xarray, rioxarray or minio.
+_EXPORTS = {
+    "download": ".downloader",
+    "list_files": ".search",
+    "export_monthly_geotiff": ".export",
+    "rechunk": ".rechunk",
+    "select_layout": ".rechunk",
+    "open_for_access": ".rechunk",
+}
 
 __all__ = [
     "download",
     "list_files",
     "export_monthly_geotiff",
+    "rechunk",
+    "select_layout",
+    "open_for_access",
 ]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,29 @@
+import os
+import csv
+
+from .config import CATALOG_DIR
+
+
+def search(type: str, **query):
+    """
+    Search the catalog CSV for the given type and filter by query parameters.
+    Uses the csv module rather than pandas so that catalog queries start fast.
+    Args:
+        type (str): Catalog type ('RCM', 'CPCRCM', etc.)
+        **query: Column filters (key=value or key=[values])
+    Returns:
+        List[dict]: Filtered catalog records as dicts (values as strings)
+    """
+    path = os.path.join(CATALOG_DIR, f"{type}.csv")
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        filters = {
+            key: {str(v) for v in value} if isinstance(value, list) else {str(value)}
+            for key, value in query.items()
+            if key in reader.fieldnames
+        }
+        return [
+            record
+            for record in reader
+            if all(record[key] in values for key, values in filters.items())
+        ]
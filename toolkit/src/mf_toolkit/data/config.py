@@ -1,7 +1,13 @@
+import os
+
 DATA_DIR = "./data"
+CACHE_DIR = "./data/cache"
+CATALOG_DIR = "./data/catalogs"
 
-ENDPOINT = "object.files.data.gouv.fr"
-BUCKET = "meteofrance-drias"
+# Overridable to point at a local S3 stand-in (eg. `moto_server` or MinIO)
+ENDPOINT = os.environ.get("MF_TOOLKIT_S3_ENDPOINT", "object.files.data.gouv.fr")
+SECURE = os.environ.get("MF_TOOLKIT_S3_SECURE", "1") != "0"
+BUCKET = os.environ.get("MF_TOOLKIT_S3_BUCKET", "meteofrance-drias")
 
 RCM_DIRECTORY_TEMPLATE = "SocleM-Climat-2025/RCM/%(project)s/%(domain)s/%(gcm)s/%(member)s/%(rcm)s/%(experiment)s/%(timestep)s/%(variable)s/version-hackathon-102025"
 RCM_FILENAME_TEMPLATE = "%(variable)s_%(region)s_%(gcm)s_%(experiment)s_%(member)s_%(institute)s_%(rcm)s_%(version)s_%(bias_adjustment)s_%(timestep)s_%(date_beg)s-%(date_end)s.nc"
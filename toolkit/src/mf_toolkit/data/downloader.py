@@ -1,42 +1,21 @@
-from typing import Optional
+from typing import List, Optional, Tuple
 import os
 import logging
 import requests
 
-import pandas as pd
-from minio import Minio
 from tqdm import tqdm
 
+from .. import instrumentation
+
+from .catalog import search
+from .inventory import ObjectInfo, list_prefixes, object_url
 from .config import (
     DATA_DIR,
-    ENDPOINT,
-    BUCKET,
     RCM_DIRECTORY_TEMPLATE,
     CPCRM_DIRECTORY_TEMPLATE,
 )
 
 
-def search(type: str, **query):
-    """
-    Search the catalog CSV for the given type and filter by query parameters.
-    Args:
-        type (str): Catalog type ('RCM', 'CPCRCM', etc.)
-        **query: Column filters (key=value or key=[values])
-    Returns:
-        List[dict]: Filtered catalog records as dicts
-    """
-    path = f"./data/catalogs/{type}.csv"
-    catalog = pd.read_csv(path)
-    filtered = catalog
-    for key, value in query.items():
-        if key in filtered.columns:
-            if isinstance(value, list):
-                filtered = filtered[filtered[key].isin(value)]
-            else:
-                filtered = filtered[filtered[key] == value]
-    return filtered.to_dict(orient="records")
-
-
 def set_prefix(**params):
     """
     Build the directory prefix for listing objects in storage.
@@ -56,62 +35,113 @@ def set_prefix(**params):
     return directory
 
 
-def list_objects(prefix):
+@instrumentation.traced("download_object")
+def download_object(url: str, output_path: str):
+    """
+    Stream a single object to disk, with a progress bar.
+    Args:
+        url (str): Object URL
+        output_path (str): Local file path
+    """
+    logging.info(f"Downloading {url}")
+    try:
+        response = requests.get(url, stream=True, timeout=60)
+        response.raise_for_status()
+        if not os.path.exists(os.path.dirname(output_path)):
+            os.makedirs(os.path.dirname(output_path))
+        total_size = int(response.headers.get("content-length", 0))
+        with open(output_path, "wb") as f, tqdm(
+            desc=f"Downloading {url.split('/')[-1]}",
+            total=total_size,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+        ) as bar:
+            for chunk in response.iter_content(chunk_size=8192):
+                if chunk:
+                    f.write(chunk)
+                    bar.update(len(chunk))
+                    instrumentation.count("bytes_downloaded", len(chunk))
+        logging.info(f"Saved to {output_path}")
+    except requests.exceptions.ChunkedEncodingError as e:
+        logging.error(f"ChunkedEncodingError while downloading {url}: {e}")
+    except requests.exceptions.RequestException as e:
+        logging.error(f"RequestException while downloading {url}: {e}")
+
+
+def list_remote_files(type: str, refresh: bool = False, **query) -> List[str]:
     """
-    List all objects in the MinIO bucket under the given prefix.
+    Object names matching query, from the bucket inventory.
     Args:
-        prefix (str): Directory prefix in object storage
+        type (str): Projections type ('RCM', 'CPCRCM', etc.)
+        refresh (bool): List the bucket again even if the inventory is recent
+        **query: Filters for catalog search
     Returns:
-        List[str]: List of object names
+        List[str]: Object names
     """
-    client = Minio(ENDPOINT)
-    objects = client.list_objects(BUCKET, prefix=prefix, recursive=True)
-    return [obj.object_name for obj in objects]
+    prefixes = [set_prefix(type=type, **item) for item in search(type, **query)]
+    listings = list_prefixes([prefix for prefix in prefixes if prefix], refresh=refresh)
+    return [obj["name"] for objects in listings.values() for obj in objects]
 
 
-def download(type: str, root_dir: Optional[str] = DATA_DIR, **query):
+def plan(
+    type: str,
+    root_dir: Optional[str] = DATA_DIR,
+    refresh: bool = False,
+    **query,
+) -> List[Tuple[ObjectInfo, str]]:
     """
-    Download files matching query from object storage, with progress bars.
+    Objects matching query that are missing locally (or whose local size differs).
+    Listings come from the persisted inventory when it is recent enough, so repeated
+    plans make no remote call.
     Args:
-        output_dir (str): Directory to save downloaded files
         type (str): Projections type ('RCM', 'CPCRCM', etc.)
+        root_dir (str): Directory where files are saved
+        refresh (bool): List the bucket again even if the inventory is recent
         **query: Filters for catalog search
+    Returns:
+        List[Tuple[ObjectInfo, str]]: Objects to download and their local path
     """
     result = search(type, **query)
     logging.info(f"Found {len(result)} matching records")
-    for item in result:
-        prefix = set_prefix(type=type, **item)
-        objects = list_objects(prefix=prefix)
-        logging.info(f"Found {len(objects)} objects")
+    prefixes = [set_prefix(type=type, **item) for item in result]
+    listings = list_prefixes([prefix for prefix in prefixes if prefix], refresh=refresh)
+    todo = []
+    for prefix, objects in listings.items():
+        logging.info(f"Found {len(objects)} objects under {prefix}")
         for obj in objects:
-            logging.info(f"Found object: {obj}")
-            url = f"https://{ENDPOINT}/{BUCKET}/{obj}"
-            output_path = f"{root_dir}/{obj}"
-            if not os.path.exists(output_path):
-                logging.info(f"Downloading {url}")
-                try:
-                    response = requests.get(url, stream=True, timeout=60)
-                    response.raise_for_status()
-                    if not os.path.exists(os.path.dirname(output_path)):
-                        os.makedirs(os.path.dirname(output_path))
-                    total_size = int(response.headers.get("content-length", 0))
-                    with open(output_path, "wb") as f, tqdm(
-                        desc=f"Downloading {url.split('/')[-1]}",
-                        total=total_size,
-                        unit="B",
-                        unit_scale=True,
-                        unit_divisor=1024,
-                    ) as bar:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                                bar.update(len(chunk))
-                    logging.info(f"Saved to {output_path}")
-                except requests.exceptions.ChunkedEncodingError as e:
-                    logging.error(f"ChunkedEncodingError while downloading {url}: {e}")
-                except requests.exceptions.RequestException as e:
-                    logging.error(f"RequestException while downloading {url}: {e}")
+            output_path = f"{root_dir}/{obj['name']}"
+            if os.path.exists(output_path) and os.path.getsize(output_path) == obj["size"]:
+                logging.info(f"File already exists at {output_path}, skipping download.")
             else:
-                logging.info(
-                    f"File already exists at {output_path}, skipping download."
-                )
+                todo.append((obj, output_path))
+    return todo
+
+
+@instrumentation.traced("download", profile=True)
+def download(
+    type: str,
+    root_dir: Optional[str] = DATA_DIR,
+    dry_run: bool = False,
+    refresh: bool = False,
+    **query,
+):
+    """
+    Download files matching query from object storage, with progress bars.
+    Args:
+        type (str): Projections type ('RCM', 'CPCRCM', etc.)
+        root_dir (str): Directory to save downloaded files
+        dry_run (bool): Only log what would be downloaded
+        refresh (bool): List the bucket again even if the inventory is recent
+        **query: Filters for catalog search
+    Returns:
+        List[Tuple[ObjectInfo, str]]: The planned downloads
+    """
+    todo = plan(type, root_dir, refresh=refresh, **query)
+    logging.info(f"{len(todo)} objects to download ({sum(obj['size'] for obj, _ in todo) / 2**30:.1f} GiB)")
+    for obj, output_path in todo:
+        if dry_run:
+            logging.info(f"Would download {obj['name']} to {output_path}")
+            continue
+        download_object(object_url(obj["name"]), output_path)
+    return todo
@@ -1,8 +1,12 @@
-from typing import Optional
+from typing import Callable, List, Optional, Sequence
 
 import numpy as np
+import rioxarray  # noqa: F401
 import xarray as xr
 
+from .. import instrumentation
+from ..precision import get_compute_dtype
+
 
 def netcdf_to_geotiff(
     dataset: xr.Dataset, geotiff_path: str, variable: str, crs: Optional[str] = None
@@ -16,6 +20,7 @@ def netcdf_to_geotiff(
     """
     # Extraire la variable spécifiée
     data_array = dataset[variable]
+    data_array = data_array.astype(get_compute_dtype(), copy=False)
     # Convertir en DataArray compatible avec rioxarray
     data_array_rio = data_array.rio.write_crs("EPSG:27572")
     # Reprojeter si un CRS est spécifié
@@ -24,13 +29,30 @@ def netcdf_to_geotiff(
     # Définir la valeur nodata
     data_array_rio.rio.write_nodata(np.nan, encoded=True, inplace=True)
     # Sauvegarder en GeoTIFF
-    data_array_rio.rio.to_raster(geotiff_path)
+    with instrumentation.span("rio.to_raster", path=geotiff_path):
+        data_array_rio.rio.to_raster(geotiff_path)
     return
 
 
-def export_monthly_geotiff(ds: xr.Dataset, output_dir: str, variable: str) -> None:
-    """Exporter un dataset mensuel en fichiers GeoTIFF."""
-    months = ds.month.values if "month" in ds.dims else range(1, 13)
+@instrumentation.traced("export_monthly_geotiff", profile=True)
+def export_monthly_geotiff(
+    ds: xr.Dataset,
+    output_dir: str,
+    variable: str,
+    months: Optional[Sequence[int]] = None,
+    on_export: Optional[Callable[[int, str], None]] = None,
+) -> List[str]:
+    """Exporter un dataset mensuel en fichiers GeoTIFF.
+
+    Args:
+        months (list): Mois à exporter (par défaut, tous).
+        on_export (callable): Appelée avec (mois, chemin) une fois chaque fichier écrit.
+    Returns:
+        list: Chemins des fichiers écrits
+    """
+    if months is None:
+        months = ds.month.values if "month" in ds.dims else range(1, 13)
+    paths = []
     for month in months:
         ds_month = ds.sel(month=month)
         filename_template = (
@@ -41,4 +63,7 @@ def export_monthly_geotiff(ds: xr.Dataset, output_dir: str, variable: str) -> No
         filename = filename_template % attrs
         geotiff_path = f"{output_dir}/{filename}_{month:02d}.tif"
         netcdf_to_geotiff(ds_month, geotiff_path, variable)
-    return
+        paths.append(geotiff_path)
+        if on_export is not None:
+            on_export(int(month), geotiff_path)
+    return paths
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, TypedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from minio import Minio
+
+from .. import instrumentation
+from .config import ENDPOINT, SECURE, BUCKET, CACHE_DIR
+
+INVENTORY_PATH = f"{CACHE_DIR}/inventory.json"
+# Listings older than this are fetched again (the bucket is updated a few times a year)
+INVENTORY_TTL = 24 * 3600
+# Minio's default connection pool keeps 10 connections per host
+MAX_LISTING_WORKERS = 8
+
+_clients: Dict[tuple, Minio] = {}
+_clients_lock = threading.Lock()
+
+
+class ObjectInfo(TypedDict):
+    name: str
+    size: int
+    etag: str
+    last_modified: Optional[str]
+
+
+def get_client(endpoint: str = ENDPOINT, secure: bool = SECURE) -> Minio:
+    """
+    One anonymous Minio client per endpoint, reused across listings (its HTTP
+    connection pool is thread safe).
+    """
+    with _clients_lock:
+        key = (endpoint, secure)
+        if key not in _clients:
+            _clients[key] = Minio(endpoint, secure=secure)
+        return _clients[key]
+
+
+def list_prefix(prefix: str, client: Optional[Minio] = None, bucket: str = BUCKET) -> List[ObjectInfo]:
+    """
+    List all objects under a prefix, with their size, ETag and last modification date.
+    Args:
+        prefix (str): Directory prefix in object storage
+        client (Minio): Client to use (default: shared client for ENDPOINT)
+        bucket (str): Bucket name
+    Returns:
+        List[ObjectInfo]: Objects sorted by name
+    """
+    client = client or get_client()
+    with instrumentation.span("list_objects", prefix=prefix):
+        objects = [
+            ObjectInfo(
+                name=obj.object_name,
+                size=obj.size,
+                etag=(obj.etag or "").strip('"'),
+                last_modified=obj.last_modified.isoformat() if obj.last_modified else None,
+            )
+            for obj in client.list_objects(bucket, prefix=prefix, recursive=True)
+        ]
+    instrumentation.count("listings")
+    return sorted(objects, key=lambda obj: obj["name"])
+
+
+def object_url(name: str, endpoint: str = ENDPOINT, secure: bool = SECURE, bucket: str = BUCKET) -> str:
+    return f"{'https' if secure else 'http'}://{endpoint}/{bucket}/{name}"
+
+
+def load_inventory(path: str = INVENTORY_PATH) -> dict:
+    """
+    Persisted listings: {prefix URL: {"listed_at": timestamp, "objects": [ObjectInfo, ...]}},
+    keyed by `object_url` of the prefix so that listings of other endpoints or buckets are
+    never reused.
+    """
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as f:
+            inventory = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable inventory {path}: {e}")
+        return {}
+    # Listings persisted before they were keyed by URL
+    return {key: listing for key, listing in inventory.items() if key.startswith(("http://", "https://"))}
+
+
+def save_inventory(inventory: dict, path: str = INVENTORY_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(inventory, f)
+    os.replace(tmp_path, path)
+
+
+def list_prefixes(
+    prefixes: Iterable[str],
+    ttl: float = INVENTORY_TTL,
+    refresh: bool = False,
+    path: Optional[str] = INVENTORY_PATH,
+    client: Optional[Minio] = None,
+    bucket: str = BUCKET,
+    max_workers: int = MAX_LISTING_WORKERS,
+    endpoint: str = ENDPOINT,
+    secure: bool = SECURE,
+) -> Dict[str, List[ObjectInfo]]:
+    """
+    List several prefixes, reusing the persisted inventory for listings younger than `ttl`
+    seconds and fetching the others concurrently over one client.
+    Args:
+        prefixes: Directory prefixes in object storage
+        ttl (float): Maximum age of a persisted listing, in seconds
+        refresh (bool): Ignore the persisted listings
+        path (str): Inventory file (None to disable persistence)
+        client (Minio): Client to use (default: shared client for `endpoint`)
+        bucket (str): Bucket name
+        max_workers (int): Concurrent listings
+        endpoint (str): Endpoint of the bucket (that of `client` when given)
+        secure (bool): Whether the endpoint is reached over HTTPS
+    Returns:
+        Dict[str, List[ObjectInfo]]: Objects per prefix
+    """
+    prefixes = list(dict.fromkeys(prefixes))
+    keys = {prefix: object_url(prefix, endpoint, secure, bucket) for prefix in prefixes}
+    inventory = load_inventory(path) if path else {}
+    now = time.time()
+    stale = [
+        prefix
+        for prefix in prefixes
+        if refresh or keys[prefix] not in inventory or now - inventory[keys[prefix]]["listed_at"] > ttl
+    ]
+    logging.info(f"Listing {len(stale)} prefixes ({len(prefixes) - len(stale)} from the inventory)")
+    if stale:
+        client = client or get_client(endpoint, secure)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            listings = pool.map(lambda prefix: list_prefix(prefix, client, bucket), stale)
+            for prefix, objects in zip(stale, listings):
+                inventory[keys[prefix]] = {"listed_at": now, "objects": objects}
+        if path:
+            save_inventory(inventory, path)
+    return {prefix: inventory[keys[prefix]]["objects"] for prefix in prefixes}
@@ -0,0 +1,185 @@
+"""
+Decompressed, memory-mapped copies of input files (opt-in).
+
+DRIAS files are zlib-compressed NetCDF4: every pass over `tasAdjust`, `sfcWindAdjust` or
+`rsdsAdjust` decodes the same chunks again, and decompression dominates repeated indicator
+runs. With this cache, each variable is decoded once into an uncompressed `.npy` array
+(the values xarray would return: scaled, NaN-masked), and later opens map it read-only:
+no copy, no decompression, reads served from the page cache.
+
+One entry per input file, keyed on its absolute path, size and modification time:
+
+    data/cache/mmap/{key}/
+        dataset.nc      # coordinates, small variables and attributes (the sidecar)
+        variables.json  # dims, shape, dtype and attrs of the mapped variables
+        {variable}.npy  # decoded values of each variable with a time dimension
+
+The cache is bounded by `MF_TOOLKIT_MMAP_CACHE_GB` (20 GB by default); when an entry is
+added, the least recently opened entries are removed. Removing an entry that another
+process has mapped is safe on POSIX (the mapping keeps the data until it is closed).
+
+    enable_mmap_cache()                    # or MF_TOOLKIT_MMAP_CACHE=1, or `mf-toolkit --mmap-cache`
+    ds = open_cached_dataset("data/.../tasAdjust_...nc")
+"""
+import os
+import json
+import glob
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import Iterable, List, Optional
+
+import numpy as np
+import xarray as xr
+
+from .. import instrumentation
+from .config import CACHE_DIR
+
+MMAP_CACHE_DIR = os.path.join(CACHE_DIR, "mmap")
+MMAP_CACHE_MAX_BYTES = int(float(os.environ.get("MF_TOOLKIT_MMAP_CACHE_GB", 20)) * 2**30)
+SIDECAR = "dataset.nc"
+VARIABLES = "variables.json"
+# Decoded values are copied into the array file by blocks of this size
+COPY_BLOCK_BYTES = 256 * 2**20
+
+_enabled = os.environ.get("MF_TOOLKIT_MMAP_CACHE", "0") != "0"
+
+
+def mmap_cache_enabled() -> bool:
+    return _enabled
+
+
+def enable_mmap_cache(enabled: bool = True) -> None:
+    """Open local input files through the memory-mapped cache (see `open_input`)."""
+    global _enabled
+    _enabled = enabled
+
+
+def entry_key(path: str) -> str:
+    stat = os.stat(path)
+    return hashlib.sha1(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def _json_attrs(attrs: dict) -> dict:
+    return {name: value.tolist() if hasattr(value, "tolist") else value for name, value in attrs.items()}
+
+
+def _mapped_variables(dataset: xr.Dataset) -> List[str]:
+    return [
+        name for name, variable in dataset.data_vars.items()
+        if "time" in variable.dims and variable.ndim > 1 and not name.endswith("_bnds")
+    ]
+
+
+def _copy_variable(variable: xr.DataArray, npy_path: str) -> None:
+    """Decode `variable` into a `.npy` file, time blocks at a time."""
+    array = np.lib.format.open_memmap(npy_path, mode="w+", dtype=variable.dtype, shape=variable.shape)
+    time_axis = variable.dims.index("time")
+    step_bytes = max(1, variable.nbytes // max(1, variable.sizes["time"]))
+    steps = max(1, COPY_BLOCK_BYTES // step_bytes)
+    for start in range(0, variable.sizes["time"], steps):
+        block = variable.isel(time=slice(start, start + steps)).values
+        index = [slice(None)] * variable.ndim
+        index[time_axis] = slice(start, start + block.shape[time_axis])
+        array[tuple(index)] = block
+    array.flush()
+    del array
+
+
+@instrumentation.traced("mmap_cache.build")
+def build_entry(path: str, entry_dir: str, variables: Optional[Iterable[str]] = None) -> None:
+    """Write the cache entry of `path` into a temporary folder, then rename it to `entry_dir`."""
+    parent = os.path.dirname(entry_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        with xr.open_dataset(path) as dataset:
+            names = list(variables) if variables is not None else _mapped_variables(dataset)
+            described = {}
+            for name in names:
+                variable = dataset[name]
+                _copy_variable(variable, os.path.join(tmp_dir, f"{name}.npy"))
+                described[name] = {
+                    "dims": list(variable.dims),
+                    "shape": list(variable.shape),
+                    "dtype": variable.dtype.str,
+                    "attrs": _json_attrs(variable.attrs),
+                }
+                instrumentation.count("mmap_cache_bytes_written", variable.nbytes)
+            dataset.drop_vars(names).to_netcdf(os.path.join(tmp_dir, SIDECAR))
+        with open(os.path.join(tmp_dir, VARIABLES), "w") as f:
+            json.dump(described, f)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Built concurrently by another process: keep theirs
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def _entry_bytes(entry_dir: str) -> int:
+    return sum(os.path.getsize(file) for file in glob.glob(os.path.join(entry_dir, "*")))
+
+
+def evict(cache_dir: str, max_bytes: int, keep: Optional[str] = None) -> int:
+    """Remove the least recently opened entries until the cache fits in `max_bytes`; returns the bytes freed."""
+    entries = []
+    for sidecar in glob.glob(os.path.join(cache_dir, "*", SIDECAR)):
+        entry_dir = os.path.dirname(sidecar)
+        try:
+            entries.append((os.path.getmtime(sidecar), entry_dir, _entry_bytes(entry_dir)))
+        except FileNotFoundError:
+            continue
+    total = sum(size for _, _, size in entries)
+    freed = 0
+    for _, entry_dir, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if entry_dir == keep:
+            continue
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        logging.info(f"Evicted {entry_dir} from the memory-mapped cache ({size / 2**20:.0f} MB)")
+        total -= size
+        freed += size
+    return freed
+
+
+def open_entry(entry_dir: str) -> xr.Dataset:
+    """Dataset of a cache entry: coordinates loaded from the sidecar, variables mapped read-only."""
+    with xr.open_dataset(os.path.join(entry_dir, SIDECAR)) as sidecar:
+        dataset = sidecar.load()
+    with open(os.path.join(entry_dir, VARIABLES)) as f:
+        described = json.load(f)
+    for name, variable in described.items():
+        values = np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode="r")
+        dataset[name] = xr.Variable(variable["dims"], values, variable["attrs"])
+    # Opening refreshes the entry in the LRU order
+    os.utime(os.path.join(entry_dir, SIDECAR))
+    return dataset
+
+
+def open_cached_dataset(
+    path: str,
+    cache_dir: str = MMAP_CACHE_DIR,
+    max_bytes: int = MMAP_CACHE_MAX_BYTES,
+) -> xr.Dataset:
+    """Open a local NetCDF file through the memory-mapped cache, building its entry on first use.
+
+    Files larger than the whole cache are opened directly.
+    """
+    entry_dir = os.path.join(cache_dir, entry_key(path))
+    if not os.path.isfile(os.path.join(entry_dir, VARIABLES)):
+        with xr.open_dataset(path) as dataset:
+            entry_bytes = sum(dataset[name].nbytes for name in _mapped_variables(dataset))
+        if entry_bytes > max_bytes:
+            logging.warning(f"{path} ({entry_bytes / 2**30:.1f} GB) exceeds the memory-mapped cache")
+            return xr.open_dataset(path)
+        logging.info(f"Decompressing {path} into the memory-mapped cache")
+        evict(cache_dir, max_bytes - entry_bytes)
+        build_entry(path, entry_dir)
+    else:
+        instrumentation.count("mmap_cache_hits")
+    return open_entry(entry_dir)
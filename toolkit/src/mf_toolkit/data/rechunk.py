@@ -0,0 +1,341 @@
+"""
+Rechunked copies of input files, for time-series or map access, and a layout selector.
+
+DRIAS files are chunked for maps (a few days x large tiles): reading the series of a few
+sites decompresses every chunk of the file, while a climatology of full fields reads them
+efficiently. `rechunk` writes a copy of a file whose variables are chunked for one of
+`LAYOUTS`:
+
+    'time'   the whole series of small tiles of cells (point / per-site analyses)
+    'space'  whole fields for a few time steps (maps, climatologies of any window)
+
+The copy is made under a memory budget by a streaming, possibly multi-stage algorithm
+(as in the `rechunker` package): each stage copies blocks that cover whole output chunks,
+and when the reads of one stage would decompress each input chunk many times, the chunk
+shape moves from the source to the target shape through uncompressed intermediate files.
+
+`select_layout` estimates the bytes decompressed by an access (a time window and a number
+of sites) for the original file and each available copy, and picks the cheapest;
+`open_for_access` opens it.
+
+    rechunk(path, "time")                                   # data/cache/rechunked/...time.nc
+    ds = open_for_access(path, points=12)                   # series of 12 sites: 'time' copy
+    ds = open_for_access(path, time=slice("2041", "2060"))  # 20 years of maps: original file
+"""
+import os
+import math
+import shutil
+import logging
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import netCDF4
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .. import instrumentation
+from .config import CACHE_DIR
+
+RECHUNK_DIR = os.path.join(CACHE_DIR, "rechunked")
+LAYOUTS = ("time", "space")
+SOURCE = "source"
+RECHUNK_MEMORY_BYTES = int(os.environ.get("MF_TOOLKIT_RECHUNK_MB", 1024)) * 2**20
+# Uncompressed size of an output chunk
+TARGET_CHUNK_BYTES = 4 * 2**20
+MAX_STAGES = 3
+# Attributes applied by the decoding: the copies store decoded values, NaN for missing
+DECODING_ATTRS = {"_FillValue", "missing_value", "scale_factor", "add_offset"}
+
+Chunks = Dict[str, int]
+
+
+def layout_chunks(sizes: Dict[str, int], layout: str, itemsize: int, chunk_bytes: int = TARGET_CHUNK_BYTES) -> Chunks:
+    """Chunk shape of a variable for a layout, about `chunk_bytes` per chunk."""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}', expected one of {LAYOUTS}")
+    spatial = [dim for dim in sizes if dim != "time"]
+    cell_count = math.prod(sizes[dim] for dim in spatial)
+    if layout == "space":
+        steps = max(1, chunk_bytes // (cell_count * itemsize))
+        return {dim: min(steps, size) if dim == "time" else size for dim, size in sizes.items()}
+    # Square tiles of cells holding their whole series
+    cells = max(1, chunk_bytes // (sizes.get("time", 1) * itemsize))
+    side = max(1, int(cells ** (1 / max(1, len(spatial)))))
+    return {dim: size if dim == "time" else min(side, size) for dim, size in sizes.items()}
+
+
+def file_chunks(variable: netCDF4.Variable) -> Chunks:
+    """Chunk shape of a NetCDF variable; a contiguous variable reads any block without amplification."""
+    chunking = variable.chunking()
+    if chunking == "contiguous":
+        return {dim: 1 for dim in variable.dimensions}
+    return dict(zip(variable.dimensions, chunking))
+
+
+def stage_chunks(source: Chunks, target: Chunks, stages: int) -> List[Chunks]:
+    """Chunk shapes after each of `stages` stages, geometrically between `source` and `target`."""
+    result = []
+    for stage in range(1, stages + 1):
+        fraction = stage / stages
+        result.append(
+            {
+                dim: max(1, round(math.exp((1 - fraction) * math.log(source[dim]) + fraction * math.log(target[dim]))))
+                for dim in target
+            }
+        )
+    return result
+
+
+def copy_block(read: Chunks, write: Chunks, sizes: Dict[str, int], itemsize: int, max_bytes: int) -> Chunks:
+    """Block shape of a stage: whole output chunks, grown toward whole input chunks within `max_bytes`."""
+    block = dict(write)
+    if math.prod(block.values()) * itemsize > max_bytes:
+        raise ValueError(f"An output chunk {write} does not fit in {max_bytes / 2**20:.0f} MB")
+    # Dimensions read most partially first
+    for dim in sorted(block, key=lambda d: block[d] / read[d]):
+        if block[dim] >= read[dim]:
+            continue
+        others = math.prod(size for other, size in block.items() if other != dim) * itemsize
+        fitting = max(write[dim], (max_bytes // others) // write[dim] * write[dim])
+        block[dim] = min(sizes[dim], fitting, math.ceil(read[dim] / write[dim]) * write[dim])
+    return block
+
+
+def read_amplification(read: Chunks, block: Chunks) -> float:
+    """How many times each input chunk is decompressed when read by blocks of `block`."""
+    return math.prod(max(1.0, read[dim] / block[dim]) for dim in block)
+
+
+def plan_rechunk(
+    sizes: Dict[str, int], source: Chunks, target: Chunks, itemsize: int, max_bytes: int
+) -> List[Tuple[Chunks, Chunks]]:
+    """(chunks, copy block) of each stage, with the number of stages that reads and writes the least."""
+    best = None
+    for stages in range(1, MAX_STAGES + 1):
+        plan = []
+        read = source
+        for chunks in stage_chunks(source, target, stages)[:-1] + [target]:
+            block = copy_block(read, chunks, sizes, itemsize, max_bytes)
+            plan.append((chunks, block, read_amplification(read, block)))
+            read = chunks
+        # Every stage writes the data once and reads it `amplification` times
+        cost = sum(1 + amplification for _, _, amplification in plan)
+        if best is None or cost < best[0]:
+            best = (cost, plan)
+    return [(chunks, block) for chunks, block, _ in best[1]]
+
+
+def _blocks(sizes: Dict[str, int], block: Chunks):
+    dims = list(sizes)
+    starts = [range(0, sizes[dim], block[dim]) for dim in dims]
+    for origin in np.ndindex(*[len(r) for r in starts]):
+        yield tuple(
+            slice(starts[i][index], min(starts[i][index] + block[dim], sizes[dim]))
+            for i, (dim, index) in enumerate(zip(dims, origin))
+        )
+
+
+def _decoded_dtype(variable: netCDF4.Variable) -> np.dtype:
+    if "scale_factor" in variable.ncattrs() or "add_offset" in variable.ncattrs():
+        return np.result_type(np.float32, getattr(variable, "scale_factor", np.float32(1)))
+    return np.dtype(variable.dtype)
+
+
+def _create_like(src: netCDF4.Dataset, path: str, variables: Sequence[str], chunks: Dict[str, Chunks], compress: bool):
+    """Output file with the dimensions, small variables and attributes of `src`; `variables` chunked by `chunks`."""
+    dst = netCDF4.Dataset(path, "w", format="NETCDF4")
+    dst.setncatts({name: src.getncattr(name) for name in src.ncattrs()})
+    for name, dimension in src.dimensions.items():
+        dst.createDimension(name, len(dimension))
+    for name, variable in src.variables.items():
+        attrs = {attr: variable.getncattr(attr) for attr in variable.ncattrs()}
+        if name in variables:
+            dtype = _decoded_dtype(variable)
+            fill_value = np.nan if dtype.kind == "f" else None
+            out = dst.createVariable(
+                name, dtype, variable.dimensions, zlib=compress, complevel=1, shuffle=compress,
+                chunksizes=[chunks[name][dim] for dim in variable.dimensions], fill_value=fill_value,
+            )
+            out.setncatts({attr: value for attr, value in attrs.items() if attr not in DECODING_ATTRS})
+            continue
+        filters = variable.filters() or {}
+        out = dst.createVariable(
+            name, variable.dtype, variable.dimensions, zlib=bool(filters.get("zlib")),
+            fill_value=attrs.pop("_FillValue", None),
+        )
+        out.setncatts(attrs)
+        variable.set_auto_maskandscale(False)
+        out.set_auto_maskandscale(False)
+        out[...] = variable[...]
+    return dst
+
+
+def _copy_stage(
+    src_path: str, dst_path: str, plans: Dict[str, Tuple[Chunks, Chunks]], compress: bool, cache_bytes: int
+) -> None:
+    with netCDF4.Dataset(src_path) as src:
+        dst = _create_like(src, dst_path, list(plans), {name: chunks for name, (chunks, _) in plans.items()}, compress)
+        try:
+            for name, (_, block) in plans.items():
+                variable = src.variables[name]
+                # Input chunks overlapping a row of blocks stay decompressed in the HDF5 chunk cache
+                variable.set_var_chunk_cache(size=cache_bytes)
+                variable.set_auto_maskandscale(True)
+                sizes = dict(zip(variable.dimensions, variable.shape))
+                for index in _blocks(sizes, block):
+                    with instrumentation.span("rechunk.read", variable=name):
+                        values = variable[index]
+                    if np.ma.isMaskedArray(values):
+                        values = values.filled(np.nan if values.dtype.kind == "f" else values.fill_value)
+                    with instrumentation.span("rechunk.write", variable=name):
+                        dst.variables[name][index] = values
+                    instrumentation.count("rechunk_bytes", values.nbytes)
+        finally:
+            dst.close()
+
+
+def rechunked_path(path: str, layout: str, output_dir: str = RECHUNK_DIR) -> str:
+    name, _ = os.path.splitext(os.path.basename(path))
+    return os.path.join(output_dir, f"{name}.{layout}.nc")
+
+
+def _time_variables(src: netCDF4.Dataset) -> List[str]:
+    return [
+        name for name, variable in src.variables.items()
+        if "time" in variable.dimensions and variable.ndim > 1 and not name.endswith("_bnds")
+    ]
+
+
+@instrumentation.traced("rechunk", profile=True)
+def rechunk(
+    path: str,
+    layout: str,
+    output_path: Optional[str] = None,
+    variables: Optional[Sequence[str]] = None,
+    max_bytes: int = RECHUNK_MEMORY_BYTES,
+    chunk_bytes: int = TARGET_CHUNK_BYTES,
+) -> str:
+    """
+    Write a copy of a NetCDF file whose variables are chunked for `layout` ('time' or 'space').
+
+    Args:
+        path (str): Input NetCDF file.
+        layout (str): One of `LAYOUTS`.
+        output_path (str): Output file (default: `rechunked_path(path, layout)`).
+        variables (list): Variables to rechunk (default: every variable with a time dimension);
+            the other variables are copied as they are.
+        max_bytes (int): Memory budget: a copy block and the HDF5 chunk cache each take at most half.
+        chunk_bytes (int): Uncompressed size of an output chunk.
+    Returns:
+        str: `output_path`
+    """
+    output_path = output_path or rechunked_path(path, layout)
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    with netCDF4.Dataset(path) as src:
+        names = list(variables) if variables is not None else _time_variables(src)
+        plans = {}
+        for name in names:
+            variable = src.variables[name]
+            sizes = dict(zip(variable.dimensions, variable.shape))
+            itemsize = _decoded_dtype(variable).itemsize
+            target = layout_chunks(sizes, layout, itemsize, chunk_bytes)
+            plans[name] = plan_rechunk(sizes, file_chunks(variable), target, itemsize, max_bytes // 2)
+            logging.info(f"Rechunking {name} of {path} in {len(plans[name])} stage(s): {[c for c, _ in plans[name]]}")
+
+    stages = max(len(plan) for plan in plans.values())
+    tmp_dir = tempfile.mkdtemp(dir=output_dir, prefix=".rechunk-")
+    try:
+        src_path = path
+        for stage in range(stages):
+            last = stage == stages - 1
+            dst_path = os.path.join(tmp_dir, f"stage{stage}.nc")
+            # Variables with fewer stages are copied as they are by the extra stages
+            stage_plans = {name: plan[min(stage, len(plan) - 1)] for name, plan in plans.items()}
+            # Intermediate stages are uncompressed: reading them partially costs no decompression
+            _copy_stage(src_path, dst_path, stage_plans, compress=last, cache_bytes=max_bytes // 2)
+            if src_path != path:
+                os.remove(src_path)
+            src_path = dst_path
+        os.replace(src_path, output_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return output_path
+
+
+def _touched(size: int, chunk: int, selection: slice) -> int:
+    start, stop, _ = selection.indices(size)
+    if stop <= start:
+        return 0
+    return (stop - 1) // chunk - start // chunk + 1
+
+
+def read_cost(
+    sizes: Dict[str, int], chunks: Chunks, itemsize: int, time: slice = slice(None), points: Optional[int] = None
+) -> int:
+    """Bytes decompressed to read a time window of all cells, or of `points` scattered cells."""
+    time_chunks = _touched(sizes["time"], chunks["time"], time) if "time" in sizes else 1
+    spatial = [dim for dim in sizes if dim != "time"]
+    spatial_chunks = math.prod(math.ceil(sizes[dim] / chunks[dim]) for dim in spatial)
+    if points is not None:
+        # At worst each point falls in a different tile
+        spatial_chunks = min(points, spatial_chunks)
+    return time_chunks * spatial_chunks * math.prod(chunks.values()) * itemsize
+
+
+def _time_slice(path: str, time: Optional[slice]) -> slice:
+    """Index range of a date window (slice of dates, as for `Dataset.sel`)."""
+    if time is None or (time.start is None and time.stop is None):
+        return slice(None)
+    with xr.open_dataset(path) as dataset:
+        index = dataset.indexes["time"]
+        locations = index.slice_indexer(time.start, time.stop)
+    return slice(locations.start, locations.stop)
+
+
+def select_layout(
+    path: str,
+    variable: Optional[str] = None,
+    time: Optional[slice] = None,
+    points: Optional[int] = None,
+    output_dir: str = RECHUNK_DIR,
+) -> Tuple[str, str]:
+    """
+    (layout, file) reading the least for an access, among the original file ('source') and
+    its rechunked copies in `output_dir` (not older than the original).
+
+    Args:
+        variable (str): Variable read (default: the first with a time dimension).
+        time (slice): Date window (eg. slice("2041", "2060")), by default the whole series.
+        points (int): Number of sites read, by default all cells.
+    """
+    candidates = {SOURCE: path}
+    for layout in LAYOUTS:
+        copy = rechunked_path(path, layout, output_dir)
+        if os.path.isfile(copy) and os.path.getmtime(copy) >= os.path.getmtime(path):
+            candidates[layout] = copy
+    window = _time_slice(path, time)
+    costs = {}
+    for layout, candidate in candidates.items():
+        with netCDF4.Dataset(candidate) as nc:
+            name = variable or _time_variables(nc)[0]
+            nc_variable = nc.variables[name]
+            sizes = dict(zip(nc_variable.dimensions, nc_variable.shape))
+            chunks = file_chunks(nc_variable)
+            costs[layout] = read_cost(sizes, chunks, _decoded_dtype(nc_variable).itemsize, window, points)
+    layout = min(costs, key=costs.get)
+    logging.info(f"Layout '{layout}' for {path}: {pd.Series(costs).div(2**20).round(1).to_dict()} MB read")
+    return layout, candidates[layout]
+
+
+def open_for_access(
+    path: str,
+    variable: Optional[str] = None,
+    time: Optional[slice] = None,
+    points: Optional[int] = None,
+    output_dir: str = RECHUNK_DIR,
+) -> xr.Dataset:
+    """Open the layout of `path` that reads the least for an access (see `select_layout`)."""
+    _, selected = select_layout(path, variable, time, points, output_dir)
+    return xr.open_dataset(selected)
@@ -4,7 +4,12 @@ from typing import Optional
 
 from itertools import product
 
-from .config import RCM_DIRECTORY_TEMPLATE
+from .config import RCM_DIRECTORY_TEMPLATE, CPCRM_DIRECTORY_TEMPLATE
+
+DIRECTORY_TEMPLATES = {
+    "RCM": RCM_DIRECTORY_TEMPLATE,
+    "CPCRCM": CPCRM_DIRECTORY_TEMPLATE,
+}
 
 
 def combinations_from_dict(d):
@@ -26,13 +31,12 @@ def list_files(type: str, root_dir: Optional[str] = None, **params):
     Retourne :
         List[str] : Liste des chemins de fichiers
     """
-    if type == "RCM":
-        template = RCM_DIRECTORY_TEMPLATE
-        if root_dir is not None:
-            template = os.path.join(root_dir, template)
-    else:
+    template = DIRECTORY_TEMPLATES.get(type)
+    if template is None:
         logging.warning("Type de chemin inconnu")
         return []
+    if root_dir is not None:
+        template = os.path.join(root_dir, template)
     directories = [template % param_set for param_set in combinations_from_dict(params)]
     files = []
     for directory in directories:
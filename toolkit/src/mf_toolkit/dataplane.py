@@ -0,0 +1,236 @@
+"""
+Shared-memory data plane for multi-process workers.
+
+Worker processes that all need the same large array (the daily field of an input file,
+a raster warped to Web Mercator) would otherwise each receive a pickled copy, or re-open
+and re-decode the file. Instead, the parent loads the array once into a
+`multiprocessing.shared_memory` segment and sends workers a small picklable handle (segment
+name, shape, dtype, plus the coordinates, attributes or geotransform); workers attach a
+read-only, zero-copy view of the same pages.
+
+    with DataPlane() as plane:                       # parent
+        handle = plane.publish_dataset(dataset)
+        with multiprocessing.Pool(8) as pool:
+            results = pool.map(work, [(handle, name) for name in names])
+    # segments are unlinked when the block exits
+
+    def work(args):                                  # worker
+        handle, name = args
+        dataset = attach_dataset(handle)             # no copy, no decoding
+        ...
+
+Lifetime: the `DataPlane` (in the parent) owns the segments and unlinks them in `close()`,
+on exit of its `with` block, when it is garbage collected and at interpreter exit. If the
+parent is killed, the multiprocessing resource tracker unlinks them. Workers keep their
+mappings until `detach()` or their exit; a segment unlinked by the parent stays readable
+by the workers still attached to it.
+"""
+import os
+import sys
+import atexit
+import secrets
+import weakref
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple, TypedDict
+
+import numpy as np
+import xarray as xr
+
+SEGMENT_PREFIX = "mf_toolkit_"
+# Variables are copied into their segment by blocks of this size along their first dimension
+COPY_BLOCK_BYTES = 256 * 2**20
+
+
+class SharedArray(TypedDict):
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+    # Process of the `DataPlane` that owns the segment
+    owner: int
+
+
+class SharedVariable(TypedDict):
+    dims: Tuple[str, ...]
+    array: SharedArray
+    attrs: dict
+
+
+class SharedDataset(TypedDict):
+    variables: Dict[str, SharedVariable]
+    # Small arrays (coordinates), pickled with the handle
+    coords: Dict[str, Tuple[Tuple[str, ...], np.ndarray, dict]]
+    attrs: dict
+
+
+class SharedRaster(TypedDict):
+    array: SharedArray
+    geotransform: Tuple[float, ...]
+    projection: str
+    nodata: Optional[float]
+
+
+def _release(segments: Dict[str, shared_memory.SharedMemory]) -> None:
+    for segment in segments.values():
+        try:
+            segment.close()
+        except BufferError:
+            # A view of the segment is still alive in this process: unmapped when it is freed
+            pass
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+    segments.clear()
+
+
+class DataPlane:
+    """Owner of shared segments: published arrays live until `close()`."""
+
+    def __init__(self) -> None:
+        self._segments: Dict[str, shared_memory.SharedMemory] = {}
+        # Also run when the plane is garbage collected, and at interpreter exit
+        self._finalizer = weakref.finalize(self, _release, self._segments)
+
+    def __enter__(self) -> "DataPlane":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
+
+    @property
+    def nbytes(self) -> int:
+        return sum(segment.size for segment in self._segments.values())
+
+    def allocate(self, shape: Sequence[int], dtype) -> Tuple[SharedArray, np.ndarray]:
+        """New segment for an array of `shape` and `dtype`: its handle and a writable view."""
+        dtype = np.dtype(dtype)
+        nbytes = max(1, int(np.prod(shape, dtype=np.int64)) * dtype.itemsize)
+        name = f"{SEGMENT_PREFIX}{os.getpid()}_{secrets.token_hex(6)}"
+        segment = shared_memory.SharedMemory(name=name, create=True, size=nbytes)
+        self._segments[segment.name] = segment
+        handle = SharedArray(
+            name=segment.name, shape=tuple(int(size) for size in shape), dtype=dtype.str, owner=os.getpid()
+        )
+        return handle, np.ndarray(handle["shape"], dtype=dtype, buffer=segment.buf)
+
+    def publish_array(self, array: np.ndarray) -> SharedArray:
+        handle, view = self.allocate(array.shape, array.dtype)
+        view[...] = array
+        return handle
+
+    def publish_variable(self, variable: xr.DataArray) -> SharedVariable:
+        """Copy a (possibly lazily loaded) variable into a segment, by blocks along its first dimension."""
+        handle, view = self.allocate(variable.shape, variable.dtype)
+        if variable.ndim == 0:
+            view[...] = variable.values
+        else:
+            first = variable.dims[0]
+            row_bytes = max(1, variable.nbytes // max(1, variable.shape[0]))
+            step = max(1, COPY_BLOCK_BYTES // row_bytes)
+            for start in range(0, variable.shape[0], step):
+                view[start:start + step] = variable.isel({first: slice(start, start + step)}).values
+        return SharedVariable(dims=tuple(variable.dims), array=handle, attrs=dict(variable.attrs))
+
+    def publish_dataset(self, dataset: xr.Dataset, variables: Optional[Sequence[str]] = None) -> SharedDataset:
+        """Publish the data variables of a dataset (default: all); coordinates travel with the handle."""
+        names = list(variables) if variables is not None else list(dataset.data_vars)
+        return SharedDataset(
+            variables={name: self.publish_variable(dataset[name]) for name in names},
+            coords={
+                name: (tuple(coord.dims), coord.values, dict(coord.attrs)) for name, coord in dataset.coords.items()
+            },
+            attrs=dict(dataset.attrs),
+        )
+
+    def publish_raster(self, ds, band: int = 1) -> SharedRaster:
+        """Publish a band of a GDAL dataset, read straight into shared memory, with its georeferencing."""
+        raster_band = ds.GetRasterBand(band)
+        from osgeo import gdal_array
+
+        dtype = gdal_array.GDALTypeCodeToNumericTypeCode(raster_band.DataType)
+        handle, view = self.allocate((ds.RasterYSize, ds.RasterXSize), dtype)
+        raster_band.ReadAsArray(buf_obj=view)
+        return SharedRaster(
+            array=handle,
+            geotransform=tuple(ds.GetGeoTransform()),
+            projection=ds.GetProjection(),
+            nodata=raster_band.GetNoDataValue(),
+        )
+
+    def close(self) -> None:
+        """Unmap and unlink every segment of this plane."""
+        self._finalizer()
+
+
+# Segments attached by this process, kept open while views of them may be alive
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _open_segment(handle: SharedArray) -> shared_memory.SharedMemory:
+    """Attach an existing segment without taking charge of it: only its owner may unlink it."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=handle["name"], track=False)
+    # Before Python 3.13, attaching registers the segment with the resource tracker, which
+    # unlinks what is still registered when it exits. Processes started by the owner (fork,
+    # spawn or forkserver) share its tracker, where the segment is already registered:
+    # unregistering would drop the owner's registration. Any other process has a tracker of
+    # its own, which would unlink the segment under the owner when this process exits.
+    segment = shared_memory.SharedMemory(name=handle["name"])
+    parent = multiprocessing.parent_process()
+    if handle["owner"] not in (os.getpid(), parent.pid if parent else None):
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def attach_array(handle: SharedArray, writeable: bool = False) -> np.ndarray:
+    """View of a published array (no copy), read-only unless `writeable`."""
+    segment = _attached.get(handle["name"])
+    if segment is None:
+        segment = _open_segment(handle)
+        _attached[handle["name"]] = segment
+    view = np.ndarray(handle["shape"], dtype=np.dtype(handle["dtype"]), buffer=segment.buf)
+    view.flags.writeable = writeable
+    return view
+
+
+def attach_dataset(handle: SharedDataset) -> xr.Dataset:
+    """Dataset whose data variables are read-only views of the published segments."""
+    variables = {
+        name: xr.Variable(variable["dims"], attach_array(variable["array"]), variable["attrs"])
+        for name, variable in handle["variables"].items()
+    }
+    coords = {name: xr.Variable(dims, values, attrs) for name, (dims, values, attrs) in handle["coords"].items()}
+    return xr.Dataset(variables, coords=coords, attrs=handle["attrs"])
+
+
+def attach_raster(handle: SharedRaster):
+    """In-memory GDAL dataset over a published raster (no copy), georeferenced like the original."""
+    from osgeo import gdal_array
+
+    # GDAL wraps the buffer of a writeable array; nothing writes to it
+    array = attach_array(handle["array"], writeable=True)
+    ds = gdal_array.OpenArray(array)
+    ds.SetGeoTransform(handle["geotransform"])
+    ds.SetProjection(handle["projection"])
+    if handle["nodata"] is not None:
+        ds.GetRasterBand(1).SetNoDataValue(handle["nodata"])
+    return ds
+
+
+def attached_segments() -> List[str]:
+    return list(_attached)
+
+
+def detach() -> None:
+    """Unmap the segments attached by this process (those still viewed stay mapped until freed)."""
+    for name, segment in list(_attached.items()):
+        try:
+            segment.close()
+        except BufferError:
+            continue
+        del _attached[name]
+
+
+atexit.register(detach)
@@ -0,0 +1,202 @@
+"""
+Lightweight spans and counters for the processing pipeline.
+
+Disabled by default: `span()` then returns a shared no-op context manager and
+`count()` returns immediately, so instrumented hot paths cost one flag check.
+
+    from mf_toolkit import instrumentation
+    instrumentation.enable(profile_dir="profiles")   # profile_dir is optional
+    ...  # run the pipeline
+    instrumentation.write_report("report.json")
+    instrumentation.write_chrome_trace("trace.json")  # open in chrome://tracing or Perfetto
+"""
+import os
+import json
+import time
+import cProfile
+import functools
+import resource
+import threading
+import contextlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+_enabled = False
+_profile_dir: Optional[str] = None
+_profiling = False
+_lock = threading.Lock()
+_events: List[dict] = []
+_counters: Dict[str, float] = defaultdict(float)
+_origin = time.perf_counter()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def enable(profile_dir: Optional[str] = None) -> None:
+    """
+    Start recording spans and counters.
+    Args:
+        profile_dir (str): If set, spans opened with `profile=True` are captured with
+            cProfile and dumped as `{profile_dir}/{name}-{n}.prof`.
+    """
+    global _enabled, _profile_dir
+    _enabled = True
+    _profile_dir = profile_dir
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    global _origin
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _origin = time.perf_counter()
+
+
+def count(name: str, value: float = 1) -> None:
+    """
+    Increment a counter (bytes read, cells processed, tiles written, ...).
+    `value` is evaluated even when instrumentation is disabled: guard costly ones (a stat
+    call, a size computed for the counter) with `is_enabled()`.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += value
+
+
+def span(name: str, profile: bool = False, **attrs):
+    """
+    Time a block of code.
+    Args:
+        name (str): Span name, eg. 'gdal.Warp'
+        profile (bool): Capture this span with cProfile when a profile directory is set
+        **attrs: Extra attributes stored with the span
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _span(name, profile, attrs)
+
+
+@contextlib.contextmanager
+def _span(name: str, profile: bool, attrs: dict):
+    global _profiling
+    profiler = None
+    if profile and _profile_dir and not _profiling:
+        # cProfile does not nest: only the outermost profiled span is captured
+        _profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        if profiler is not None:
+            profiler.disable()
+            _profiling = False
+            with _lock:
+                index = sum(1 for e in _events if e["name"] == name)
+            profiler.dump_stats(os.path.join(_profile_dir, f"{name}-{index}.prof"))
+        event = {
+            "name": name,
+            "start": start - _origin,
+            "duration": end - start,
+            "thread": threading.get_ident(),
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "attrs": attrs,
+        }
+        with _lock:
+            _events.append(event)
+
+
+def traced(name: Optional[str] = None, profile: bool = False):
+    """Decorator wrapping a function call in a span."""
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(span_name, profile=profile):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def report() -> dict:
+    """Aggregated spans (count, total, mean, max seconds), counters and peak memory."""
+    with _lock:
+        events = list(_events)
+        counters = dict(_counters)
+    spans = {}
+    for event in events:
+        stats = spans.setdefault(event["name"], {"count": 0, "total": 0.0, "max": 0.0})
+        stats["count"] += 1
+        stats["total"] += event["duration"]
+        stats["max"] = max(stats["max"], event["duration"])
+    for stats in spans.values():
+        stats["mean"] = stats["total"] / stats["count"]
+
+    rates = {}
+    if "tiles" in counters and "create_tileset" in spans:
+        rates["tiles_per_s"] = counters["tiles"] / spans["create_tileset"]["total"]
+    if "bytes_downloaded" in counters and "download_object" in spans:
+        rates["download_bytes_per_s"] = (
+            counters["bytes_downloaded"] / spans["download_object"]["total"]
+        )
+    return {
+        "spans": spans,
+        "counters": counters,
+        "rates": rates,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def write_report(path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=2)
+
+
+def write_chrome_trace(path: str) -> None:
+    """Write spans in the Chrome trace event format (complete 'X' events, microseconds)."""
+    with _lock:
+        events = list(_events)
+    pid = os.getpid()
+    trace = [
+        {
+            "name": event["name"],
+            "ph": "X",
+            "ts": event["start"] * 1e6,
+            "dur": event["duration"] * 1e6,
+            "pid": pid,
+            "tid": event["thread"],
+            "args": {**event["attrs"], "max_rss_kb": event["max_rss_kb"]},
+        }
+        for event in events
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,26 @@
+"""
+Deferred imports for heavy optional dependencies (GDAL, PIL, ...).
+
+    gdal = lazy_import("osgeo.gdal")   # nothing is imported yet
+    gdal.Warp(...)                     # osgeo.gdal is imported on first attribute access
+
+Combined with `from __future__ import annotations`, modules can keep using
+`gdal.Dataset` in signatures while `--help` and catalog queries stay fast.
+"""
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self.__name__)
+        # Cache the module attributes so next lookups skip __getattr__
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    return LazyModule(name)
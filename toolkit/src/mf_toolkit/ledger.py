@@ -0,0 +1,169 @@
+"""
+Run ledger: completion records of the units of a long run, so that a restarted run resumes.
+
+A ledger is an append-only JSON Lines file. Each line records one unit (a key such as
+`{object}|{indicator}|{level}|{month}`) as done or failed, with the fingerprint of its
+inputs and its output files:
+
+    {"unit": "...|tas|tracc20|07", "status": "done", "fingerprint": "3f2a...",
+     "outputs": ["data/output/.../tas_CNRM_tracc20_07.tif"], "attempts": 1, "time": 1760000000.0}
+
+Lines are written with a single `write` on a file opened in append mode and synced to disk,
+so a crash loses at most the unit in progress; a truncated last line is ignored when the
+ledger is read. The last record of a unit wins. A unit is done when its last record is
+'done', with the same input fingerprint, and all its outputs still exist.
+
+    ledger = RunLedger("data/output/ledger/tas.jsonl")
+    if not ledger.is_done(unit, fingerprint):
+        outputs = call_with_retry(work)
+        ledger.record(unit, "done", fingerprint, outputs)
+"""
+import os
+import json
+import time
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+STATUSES = ("done", "failed")
+# Errors worth retrying in the same run (network reads, full or busy disks); other errors
+# are recorded as failed at once and retried by the next run
+RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = (OSError, TimeoutError)
+
+
+def unit_key(*parts) -> str:
+    return "|".join(str(part) for part in parts)
+
+
+class RunLedger:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.records: Dict[str, dict] = {}
+        # A crash during a write can leave a partial last line: the next record starts a new one
+        self._partial_line = False
+        if os.path.isfile(path):
+            self.records = self._read()
+
+    def _read(self) -> Dict[str, dict]:
+        records = {}
+        with open(self.path, encoding="utf-8") as f:
+            content = f.read()
+        for line_number, line in enumerate(content.splitlines(), 1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"Ignoring unreadable line {line_number} of {self.path}")
+                continue
+            records[record["unit"]] = record
+        self._partial_line = bool(content) and not content.endswith("\n")
+        return records
+
+    def attempts(self, unit: str) -> int:
+        return self.records.get(unit, {}).get("attempts", 0)
+
+    def is_done(self, unit: str, fingerprint: Optional[str] = None) -> bool:
+        """Whether `unit` completed (with inputs of `fingerprint`, if given) and its outputs exist."""
+        record = self.records.get(unit)
+        if record is None or record["status"] != "done":
+            return False
+        if fingerprint is not None and record["fingerprint"] != fingerprint:
+            return False
+        return all(os.path.exists(output) for output in record["outputs"])
+
+    def record(
+        self,
+        unit: str,
+        status: str,
+        fingerprint: Optional[str],
+        outputs: Sequence[str] = (),
+        error: Optional[str] = None,
+        attempts: int = 1,
+    ) -> dict:
+        """Append the record of a unit (one line, synced to disk before returning)."""
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status '{status}', expected one of {STATUSES}")
+        record = {
+            "unit": unit,
+            "status": status,
+            "fingerprint": fingerprint,
+            "outputs": list(outputs),
+            "attempts": self.attempts(unit) + attempts if status == "failed" else attempts,
+            "time": time.time(),
+        }
+        if error is not None:
+            record["error"] = error
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        if self._partial_line:
+            line = "\n" + line
+            self._partial_line = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.records[unit] = record
+        return record
+
+    def report(self, units: Iterable[str]) -> Dict[str, list]:
+        """Units of a run split into 'done', 'failed' (with their last error) and 'pending'."""
+        report = {"done": [], "failed": [], "pending": []}
+        for unit in units:
+            record = self.records.get(unit)
+            if self.is_done(unit):
+                report["done"].append(unit)
+            elif record is not None and record["status"] == "failed":
+                report["failed"].append(
+                    {"unit": unit, "attempts": record["attempts"], "error": record.get("error", "")}
+                )
+            else:
+                report["pending"].append(unit)
+        return report
+
+
+def call_with_retry(
+    func: Callable[[], T],
+    retries: int = 2,
+    backoff: float = 5.0,
+    retry_on: Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS,
+) -> T:
+    """Call `func`, retrying up to `retries` times on `retry_on` errors after `backoff`, 2 x `backoff`, ... seconds."""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except retry_on as error:
+            if attempt == retries:
+                raise
+            delay = backoff * 2**attempt
+            logging.warning(f"{error!r}, retrying in {delay:g}s ({attempt + 1}/{retries})")
+            time.sleep(delay)
+
+
+def _group(units: Sequence[str]) -> Dict[str, List[str]]:
+    # Units sharing all key parts but the last one (eg. the months of a level) on one line
+    groups: Dict[str, List[str]] = {}
+    for unit in units:
+        prefix, _, last = unit.rpartition("|")
+        groups.setdefault(prefix, []).append(last)
+    return groups
+
+
+def format_report(report: Dict[str, list], limit: int = 20) -> str:
+    """Summary of a ledger report, listing failed and pending units (at most `limit` lines of each)."""
+    lines = [f"{len(report['done'])} done, {len(report['failed'])} failed, {len(report['pending'])} pending"]
+    errors: Dict[Tuple[str, int], List[str]] = {}
+    for failure in report["failed"]:
+        errors.setdefault((failure["error"], failure["attempts"]), []).append(failure["unit"])
+    failed = [
+        f"  failed  {prefix}|{','.join(lasts)} ({attempts} attempts): {error}"
+        for (error, attempts), units in errors.items()
+        for prefix, lasts in _group(units).items()
+    ]
+    pending = [f"  pending {prefix}|{','.join(lasts)}" for prefix, lasts in _group(report["pending"]).items()]
+    lines += failed[:limit] + pending[:limit]
+    hidden = max(0, len(failed) - limit) + max(0, len(pending) - limit)
+    if hidden:
+        lines.append(f"  ... and {hidden} more")
+    return "\n".join(lines)
@@ -0,0 +1,542 @@
+"""
+Chaîne de traitement : calcul des indicateurs par niveau TRACC, export GeoTIFF et tuilage.
+"""
+import os
+import glob
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import tqdm
+import xarray as xr
+
+from .data import download, list_files, export_monthly_geotiff
+from .data.downloader import list_remote_files
+from .data.inventory import object_url
+from .climato import (
+    get_indicator,
+    compute_cached,
+    compute_change,
+    reference_climatology,
+    zonal_mean,
+)
+from .climato.indicators import REFERENCE_PERIOD, model_id
+from .climato.indicators.cache import file_fingerprint, result_key
+from .climato.ensemble import EnsembleAccumulator
+from .climato.subdaily import daily_thresholds, hourly_source, hourly_to_daily
+from .ledger import RunLedger, call_with_retry, format_report, unit_key
+
+TRACC = ["tracc20", "tracc27", "tracc40"]
+TRACC_AXIS_VALUES = {
+    "tracc15": 1.5,
+    "tracc20": 2.0,
+    "tracc27": 2.7,
+    "tracc40": 4.0,
+}
+
+
+def compute_reference(
+    name: str,
+    path: str,
+    datetime_start: Optional[str] = REFERENCE_PERIOD[0],
+    datetime_end: Optional[str] = REFERENCE_PERIOD[1],
+    output_dir: Optional[str] = None,
+    change: Optional[str] = None,
+    months: Optional[Sequence[int]] = None,
+    on_export: Optional[Callable[[int, str], None]] = None,
+) -> None:
+    """Calcul de l'indicateur pour la période de référence et exporte le résultat.
+
+    La climatologie de la période de référence est mise en cache par modèle (voir
+    `reference_climatology`) pour les couches de changement des niveaux TRACC.
+    `months` et `on_export` sont passés à `export_monthly_geotiff`.
+    """
+    period = (datetime_start, datetime_end) if datetime_start and datetime_end else None
+    if period == REFERENCE_PERIOD:
+        indicator = reference_climatology(name, path=path)
+    else:
+        indicator = compute_cached(name, path, period)
+    indicator.attrs.update({"tracc_level": "tracc15"})
+    if change:
+        # Changement nul à la référence : premier point de la série des niveaux TRACC
+        indicator = compute_change(indicator, indicator, change)
+
+    output_dir = f"{output_dir}/tracc15" if output_dir else "tracc15"
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    export_monthly_geotiff(indicator, output_dir, get_indicator(name).name, months, on_export)
+    return
+
+
+def _compute_tracc_level(
+    name: str,
+    path: str,
+    level: str,
+    output_dir: Optional[str],
+    change: Optional[str] = None,
+    reference_path: Optional[str] = None,
+    windowed: bool = False,
+    months: Optional[Sequence[int]] = None,
+    on_export: Optional[Callable[[int, str], None]] = None,
+) -> None:
+    """Calcul de l'indicateur pour un niveau TRACC donné et exporte le résultat."""
+    indicator = compute_cached(name, path, level, windowed=windowed)
+    if change:
+        reference = reference_climatology(name, model_id(indicator), reference_path)
+        indicator = compute_change(indicator, reference, change)
+
+    output_dir = f"{output_dir}/{level}" if output_dir else level
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    export_monthly_geotiff(indicator, output_dir, get_indicator(name).name, months, on_export)
+    return
+
+
+def indicator(
+    name: str,
+    path: str,
+    output_dir: str,
+    change: Optional[str] = None,
+    reference_path: Optional[str] = None,
+    windowed: bool = False,
+) -> None:
+    """Calcul d'un indicateur à partir d'un fichier de données et export des résultats.
+
+    Avec `change` ('delta' ou 'ratio'), les niveaux TRACC sont exportés en changement par
+    rapport à la climatologie de référence du même modèle, lue depuis le cache (calculée
+    depuis `reference_path`, le run historique, si elle n'y est pas encore).
+    Avec `windowed`, les niveaux TRACC sont tirés des sommes cumulées annuelles du fichier
+    (une seule passe sur les données journalières, voir `climato.windows`).
+    """
+    if "historical" in path:
+        logging.info(f"Processing historical")
+        compute_reference(name, path, output_dir=output_dir, change=change)
+    else:
+        for level in tqdm.tqdm(TRACC, desc="Processing TRACC levels"):
+            _compute_tracc_level(name, path, level, output_dir, change, reference_path, windowed)
+
+
+def zonal_indicator(
+    name: str,
+    path: str,
+    output_path: str,
+    regions_path: Optional[str] = None,
+    weights_path: Optional[str] = None,
+    windowed: bool = False,
+) -> None:
+    """Calcul d'un indicateur moyenné par région/masque pour tous les niveaux TRACC, exporté en CSV.
+
+    `regions_path` et `weights_path` (par ex. une fraction de terre) doivent être sur la grille
+    du fichier `path` : le masque `fracLand_METROPOLE_SAFRAN.nc`, sur la grille SAFRAN, ne
+    convient qu'aux données SAFRAN.
+    """
+    regions = xr.open_dataarray(regions_path) if regions_path else None
+    weights = xr.open_dataarray(weights_path) if weights_path else None
+    levels = []
+    for level in tqdm.tqdm(TRACC, desc="Processing TRACC levels"):
+        levels.append(compute_cached(name, path, level, windowed=windowed))
+    indicators = xr.concat(levels, dim="tracc_level").assign_coords(tracc_level=TRACC)
+    table = zonal_mean(indicators, regions, weights)
+    table.to_csv(output_path, index=False)
+
+
+PACKINGS = ("levels", "all")
+
+
+def tile_indicator(
+    name: str,
+    input_dir: str,
+    output_dir: str,
+    maxzoom: int = 6,
+    change: Optional[str] = None,
+    auto_encoding: bool = False,
+    precision: Optional[float] = None,
+    raster_format: str = "webp",
+    pack: Optional[str] = None,
+    workers: int = 1,
+) -> None:
+    """Tuilage des GeoTIFF mensuels d'un indicateur, avec l'encodage déclaré dans le registre.
+
+    Avec `change`, les tuiles sont celles des couches de changement (`{short_name}_{change}_{mois}`).
+    Avec `auto_encoding`, l'origine et le nombre de canaux sont choisis par tileset à partir des
+    valeurs de tous ses membres, au pas `precision` (par défaut celui du registre).
+    Avec `pack`, les membres de la série sont regroupés dans chaque tuile (voir `tiling.packed`) :
+    'levels' donne un tileset `{short_name}_packed_{mois}` des niveaux TRACC, 'all' un seul
+    tileset `{short_name}_packed` des 12 mois x niveaux TRACC.
+    Avec `workers` > 1, les tuiles de chaque GeoTIFF sont découpées par autant de processus, qui
+    partagent le raster reprojeté (voir `tiling.to_web_mercator.export_tiles_parallel`).
+    Le catalogue `catalog.json` du dossier du modèle est ensuite reconstruit (voir `tiling.catalog`).
+    """
+    from .tiling import create_tileset, create_packed_tileset, write_catalog
+
+    if pack is not None and pack not in PACKINGS:
+        raise ValueError(f"Unknown packing '{pack}', expected one of {PACKINGS}")
+    spec = get_indicator(name)
+    encoding = spec.change_encoding(change) if change else spec.encoding
+    units = spec.change_units(change) if change else spec.units
+    prefix = f"{spec.short_name}_{change}" if change else spec.short_name
+
+    def choose(paths):
+        if not auto_encoding:
+            return encoding, None
+        from .tiling.encoding import auto_encoding as choose_encoding
+
+        return choose_encoding(paths, precision or encoding["value_step"])
+
+    def pack_series(identifier, series):
+        tileset_encoding, encoding_metadata = choose([path for _, _, _, path in series])
+        create_packed_tileset(
+            members=[
+                {"input": path, "series_axis_value": axis_value, "metadata": {"month": month, "tracc_level": level}}
+                for month, level, axis_value, path in series
+            ],
+            output=output_dir,
+            identifier=identifier,
+            minzoom=0,
+            maxzoom=maxzoom,
+            lowest_value=tileset_encoding["lowest_value"],
+            value_step=tileset_encoding["value_step"],
+            channels=tileset_encoding["channels"],
+            meta_name=identifier,
+            meta_description=spec.description,
+            meta_attribution="Meteo France",
+            meta_pixel_unit=units,
+            meta_series_axis_name="TRACC °C",
+            meta_series_axis_unit="°C",
+            raster_format=raster_format,
+            encoding_metadata=encoding_metadata,
+        )
+
+    all_series = []
+    for month in range(1, 13):
+        identifier = f"{prefix}_{month:02d}"
+        series = [
+            (month, level, axis_value, input_filepath)
+            for level, axis_value in TRACC_AXIS_VALUES.items()
+            for input_filepath in glob.glob(f"{input_dir}/{level}/{spec.name}_*_{level}_{month:02d}.tif")
+        ]
+        if not series:
+            continue
+        all_series += series
+        if pack == "levels":
+            pack_series(f"{prefix}_packed_{month:02d}", series)
+            continue
+        if pack == "all":
+            continue
+        month_encoding, encoding_metadata = choose([path for _, _, _, path in series])
+        for _, level, axis_value, input_filepath in series:
+            create_tileset(
+                input=input_filepath,
+                output=output_dir,
+                identifier=identifier,
+                minzoom=0,
+                maxzoom=maxzoom,
+                lowest_value=month_encoding["lowest_value"],
+                value_step=month_encoding["value_step"],
+                channels=month_encoding["channels"],
+                keep_raw_tiles=False,
+                meta_name=f"{identifier}_{level[-2:]}",
+                meta_description=spec.description,
+                meta_attribution="Meteo France",
+                meta_pixel_unit=units,
+                meta_series_axis_name="TRACC °C",
+                meta_series_axis_unit="°C",
+                meta_series_axis_value=axis_value,
+                raster_format=raster_format,
+                encoding_metadata=encoding_metadata,
+                workers=workers,
+            )
+    if pack == "all" and all_series:
+        pack_series(f"{prefix}_packed", all_series)
+    write_catalog(output_dir)
+
+
+def _ensemble_member(object_name: str) -> str:
+    """Couple GCM/membre/RCM d'un fichier (commun aux runs historique et scénario)."""
+    parts = object_name.split("/")
+    return "_".join(parts[4:7])
+
+
+def _is_hourly(query: dict) -> bool:
+    return query.get("type") == "CPCRCM" and query.get("timestep") != "day"
+
+
+def _query_variables(variables: Sequence[str], query: dict) -> List[str]:
+    """Variables à lire : pour les données horaires CPCRCM, celles dont les variables journalières sont tirées."""
+    if not _is_hourly(query):
+        return list(variables)
+    return sorted({hourly_source(variable)[0] for variable in variables})
+
+
+def daily_file(
+    path: str, object_name: str, data_dir: str, thresholds: Optional[Dict[str, Sequence[float]]] = None
+) -> str:
+    """
+    Fichier journalier (moyenne, max, min et heures au-dessus des `thresholds`) d'un fichier horaire,
+    calculé une fois sous `{data_dir}/daily`.
+
+    Son nom porte la clé (empreinte du fichier horaire, seuils, précision) : un fichier horaire
+    modifié ou d'autres seuils le recalculent, et les versions précédentes sont supprimées.
+    """
+    timestep = object_name.split("/")[8]
+    daily_name = object_name.replace(f"/{timestep}/", "/day/").replace(f"_{timestep}_", "_day_")
+    stem = os.path.splitext(os.path.join(data_dir, "daily", daily_name))[0]
+    thresholds = {variable: sorted(values) for variable, values in sorted((thresholds or {}).items())}
+    key = result_key(path, "daily", {"thresholds": thresholds}, None)[:16]
+    output_path = f"{stem}_{key}.nc"
+    if not os.path.isfile(output_path):
+        logging.info(f"Aggregating {object_name} to daily values")
+        hourly_to_daily(path, output_path, thresholds=thresholds)
+        for previous in glob.glob(f"{glob.escape(stem)}_{'[0-9a-f]' * 16}.nc"):
+            if previous != output_path:
+                os.remove(previous)
+    return output_path
+
+
+def _input_files(
+    query: dict,
+    data_dir: str,
+    fetch: bool,
+    remote: bool,
+    thresholds: Optional[Dict[str, Sequence[float]]] = None,
+) -> List[Tuple[str, str]]:
+    """(chemin ou URL, nom de l'objet dans le bucket) des fichiers d'une requête catalogue.
+
+    Les fichiers horaires (CPCRCM) sont remplacés par leur agrégation journalière, avec les
+    heures au-dessus des `thresholds` (voir `daily_file`).
+    """
+    if remote:
+        files = [(object_url(object_name), object_name) for object_name in list_remote_files(**query)]
+    else:
+        # Télécharger les données climatiques
+        if fetch:
+            download(root_dir=data_dir, **query)
+        paths = list_files(root_dir=data_dir, **query)
+        files = [(path, os.path.relpath(path, data_dir).replace(os.sep, "/")) for path in paths]
+    if _is_hourly(query):
+        files = [(daily_file(path, object_name, data_dir, thresholds), object_name) for path, object_name in files]
+    return files
+
+
+LEDGER_DIR = "ledger"
+MONTHS = range(1, 13)
+
+
+def ledger_path(data_dir: str, folder: str) -> str:
+    """Journal d'exécution (voir `ledger`) des exports d'un dossier d'indicateur."""
+    return os.path.join(data_dir, "output", LEDGER_DIR, f"{folder}.jsonl")
+
+
+def _file_levels(object_name: str) -> List[str]:
+    return ["tracc15"] if "/historical/" in object_name else TRACC
+
+
+def _input_fingerprint(path: str, reference_path: Optional[str]) -> str:
+    """Empreinte des entrées d'un fichier : le fichier et, en changement, le run historique de référence."""
+    if reference_path is None:
+        return file_fingerprint(path)
+    return f"{file_fingerprint(path)}:{file_fingerprint(reference_path)}"
+
+
+def compute_files(
+    name: str,
+    query: dict,
+    data_dir: str = "data",
+    fetch: bool = False,
+    remote: bool = False,
+    change: Optional[str] = None,
+    windowed: bool = False,
+    ledger: bool = True,
+    force: bool = False,
+    retries: int = 2,
+    backoff: float = 5.0,
+) -> Optional[Dict[str, list]]:
+    """
+    Calcul d'un indicateur pour tous les fichiers d'une requête catalogue et export GeoTIFF.
+    Avec `remote`, les fichiers sont lus à distance (requêtes partielles) au lieu d'être téléchargés.
+    Avec `change` ('delta' ou 'ratio'), les couches exportées dans `{indicateur}_{change}` sont
+    les changements par rapport à la référence de chaque modèle.
+    Avec `windowed`, tous les niveaux TRACC d'un fichier viennent d'une seule passe (voir `indicator`).
+
+    Avec `ledger`, chaque export (fichier, indicateur, niveau, mois) est consigné dès qu'il est
+    écrit dans `ledger_path(data_dir, dossier)`, avec l'empreinte des entrées : une relance
+    saute les exports faits (sauf `force`) et reprend les autres. Un niveau en échec est
+    consigné et n'interrompt pas le run ; les erreurs d'entrée/sortie sont retentées `retries`
+    fois, après `backoff`, 2 x `backoff`... secondes.
+    Returns:
+        dict: Le bilan du journal ('done', 'failed', 'pending'), None sans journal
+    """
+    spec = get_indicator(name)
+    query = {**query, "variable": _query_variables(spec.variables, query)}
+    # Runs historiques d'abord : leur climatologie de référence sert aux couches de changement
+    files = _input_files(query, data_dir, fetch, remote, daily_thresholds(spec.variables))
+    files = sorted(files, key=lambda f: "/historical/" not in f[1])
+    historical = {_ensemble_member(object_name): path for path, object_name in files if "/historical/" in object_name}
+    folder = f"{spec.name}_{change}" if change else spec.name
+    run_ledger = RunLedger(ledger_path(data_dir, folder)) if ledger else None
+    units = []
+    # Calcul de l'indicateur et exportation
+    for path, object_name in tqdm.tqdm(files, desc="Processing files"):
+        model = object_name.split("/")[4]
+        logging.info(f"Processing file: {path}")
+        output_dir = f"{data_dir}/output/{model}/{folder}"
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        reference_path = historical.get(_ensemble_member(object_name))
+        fingerprint = None
+        if run_ledger is not None:
+            fingerprint = _input_fingerprint(path, reference_path if change else None)
+
+        for level in _file_levels(object_name):
+            month_units = {month: unit_key(object_name, folder, level, f"{month:02d}") for month in MONTHS}
+            units += month_units.values()
+            pending = [
+                month for month, unit in month_units.items()
+                if run_ledger is None or force or not run_ledger.is_done(unit, fingerprint)
+            ]
+            if not pending:
+                logging.info(f"Skipping {level} of {object_name}: already exported")
+                continue
+            exported = set()
+
+            def on_export(month: int, output_path: str) -> None:
+                exported.add(month)
+                if run_ledger is not None:
+                    run_ledger.record(month_units[month], "done", fingerprint, [output_path])
+
+            if level == "tracc15":
+                work = lambda: compute_reference(
+                    spec.name, path, output_dir=output_dir, change=change, months=pending, on_export=on_export
+                )
+            else:
+                work = lambda: _compute_tracc_level(
+                    spec.name, path, level, output_dir, change, reference_path, windowed, pending, on_export
+                )
+            try:
+                call_with_retry(work, retries, backoff)
+            except Exception as error:
+                if run_ledger is None:
+                    raise
+                logging.exception(f"Failed {level} of {object_name}")
+                for month in pending:
+                    if month not in exported:
+                        run_ledger.record(month_units[month], "failed", fingerprint, error=repr(error))
+
+    if run_ledger is None:
+        return None
+    report = run_ledger.report(units)
+    logging.info(f"{folder}: {format_report(report)}")
+    return report
+
+
+def ledger_report(
+    name: str,
+    query: dict,
+    data_dir: str = "data",
+    remote: bool = False,
+    change: Optional[str] = None,
+) -> Dict[str, list]:
+    """Bilan du journal d'un indicateur pour les fichiers d'une requête, sans rien calculer.
+
+    Les empreintes ne sont pas vérifiées : un fichier d'entrée modifié n'apparaît en attente
+    qu'au prochain run.
+    """
+    spec = get_indicator(name)
+    query = {**query, "variable": _query_variables(spec.variables, query)}
+    folder = f"{spec.name}_{change}" if change else spec.name
+    if remote:
+        object_names = list_remote_files(**query)
+    else:
+        object_names = [
+            os.path.relpath(path, data_dir).replace(os.sep, "/") for path in list_files(root_dir=data_dir, **query)
+        ]
+    units = [
+        unit_key(object_name, folder, level, f"{month:02d}")
+        for object_name in object_names
+        for level in _file_levels(object_name)
+        for month in MONTHS
+    ]
+    return RunLedger(ledger_path(data_dir, folder)).report(units)
+
+
+ENSEMBLE_LAYERS = ("mean", "median", "std", "agreement")
+
+
+def export_ensemble(
+    stats: xr.Dataset,
+    variable: str,
+    level: str,
+    output_root: str,
+    layers: Sequence[str] = ENSEMBLE_LAYERS,
+) -> None:
+    """
+    Export des couches d'ensemble en GeoTIFF mensuels, un dossier de « modèle » par statistique
+    (`{output_root}/ENSEMBLE-MEAN/{variable}/{level}/...`), tuilables avec `tile_indicator`.
+    L'accord des modèles est exporté en pourcentage.
+    """
+    for layer in layers:
+        data = stats[layer] * 100 if layer == "agreement" else stats[layer]
+        dataset = data.to_dataset(name=variable)
+        dataset.attrs = {**stats.attrs, "input_driving_institution_id": "ensemble", "tracc_level": level}
+        output_dir = f"{output_root}/ENSEMBLE-{layer.upper()}/{variable}/{level}"
+        os.makedirs(output_dir, exist_ok=True)
+        export_monthly_geotiff(dataset, output_dir, variable)
+
+
+def ensemble_files(
+    name: str,
+    query: dict,
+    data_dir: str = "data",
+    fetch: bool = False,
+    remote: bool = False,
+    layers: Sequence[str] = ENSEMBLE_LAYERS,
+) -> Dict[str, xr.Dataset]:
+    """
+    Statistiques d'ensemble (moyenne, médiane, écart-type, accord) d'un indicateur sur tous les
+    couples GCM x RCM d'une requête, pour la référence et chaque niveau TRACC.
+
+    Les membres sont ajoutés un par un à un `EnsembleAccumulator` : chacun est lu depuis le
+    cache des indicateurs (ou calculé), jamais tous en mémoire, puis relu du cache pour la
+    seconde passe de la médiane. L'accord porte sur le signe du
+    changement de chaque membre par rapport à sa propre climatologie de référence.
+    """
+    spec = get_indicator(name)
+    query = {**query, "variable": _query_variables(spec.variables, query)}
+    files = _input_files(query, data_dir, fetch, remote, daily_thresholds(spec.variables))
+    historical = {_ensemble_member(object_name): path for path, object_name in files if "/historical/" in object_name}
+    scenario = [(_ensemble_member(object_name), path) for path, object_name in files if "/historical/" not in object_name]
+    output_root = f"{data_dir}/output"
+
+    results = {}
+    for level in tqdm.tqdm(["tracc15"] + TRACC, desc="Ensemble TRACC levels"):
+        ensemble = EnsembleAccumulator()
+        members = historical.items() if level == "tracc15" else scenario
+        period = REFERENCE_PERIOD if level == "tracc15" else level
+        for member, path in members:
+            if level == "tracc15":
+                ensemble.add(compute_cached(name, path, period)[spec.name], name=member)
+                continue
+            reference = None
+            if member in historical:
+                reference = compute_cached(name, historical[member], REFERENCE_PERIOD)[spec.name]
+            else:
+                logging.warning(f"No historical run for {member}, agreement is computed on absolute values")
+            ensemble.add(compute_cached(name, path, period)[spec.name], reference=reference, name=member)
+        if not ensemble.members:
+            logging.warning(f"No ensemble member for {level}")
+            continue
+        # Seconde passe pour la médiane, sur les résultats en cache de la première
+        for member, path in members:
+            ensemble.add_median(compute_cached(name, path, period)[spec.name])
+        stats = ensemble.result()
+        stats.attrs["tracc_level"] = level
+        results[level] = stats
+
+        netcdf_dir = f"{output_root}/ensemble/{spec.name}"
+        os.makedirs(netcdf_dir, exist_ok=True)
+        stats.to_netcdf(f"{netcdf_dir}/{spec.name}_ensemble_{level}.nc")
+        # Pas de changement pour la référence : pas de couche d'accord
+        level_layers = [layer for layer in layers if not (level == "tracc15" and layer == "agreement")]
+        export_ensemble(stats, spec.name, level, output_root, level_layers)
+    return results
@@ -0,0 +1,52 @@
+"""
+Floating point precision policy shared by indicator computation and export.
+
+float32 by default (override with the MF_TOOLKIT_DTYPE environment variable or
+`set_compute_dtype`): daily fields, every intermediate and the exported rasters
+stay in this type, which halves memory traffic compared to float64.
+"""
+import os
+import contextlib
+from typing import Union
+
+import numpy as np
+import xarray as xr
+
+_compute_dtype = np.dtype(os.environ.get("MF_TOOLKIT_DTYPE", "float32"))
+
+
+def get_compute_dtype() -> np.dtype:
+    return _compute_dtype
+
+
+def set_compute_dtype(dtype: Union[str, np.dtype]) -> None:
+    """Set the compute precision ('float32' or 'float64')."""
+    global _compute_dtype
+    dtype = np.dtype(dtype)
+    if dtype.kind != "f":
+        raise ValueError(f"Compute dtype must be a float type, got {dtype}")
+    _compute_dtype = dtype
+
+
+@contextlib.contextmanager
+def compute_precision(dtype: Union[str, np.dtype]):
+    """Temporarily change the compute precision."""
+    previous = get_compute_dtype()
+    set_compute_dtype(dtype)
+    try:
+        yield
+    finally:
+        set_compute_dtype(previous)
+
+
+def as_compute_dtype(obj: Union[xr.DataArray, xr.Dataset]):
+    """Cast floating point variables to the compute precision (no copy when already there)."""
+    dtype = get_compute_dtype()
+    if isinstance(obj, xr.Dataset):
+        return obj.map(
+            lambda da: da.astype(dtype, copy=False) if da.dtype.kind == "f" else da,
+            keep_attrs=True,
+        )
+    if obj.dtype.kind == "f" and obj.dtype != dtype:
+        return obj.astype(dtype, copy=False)
+    return obj
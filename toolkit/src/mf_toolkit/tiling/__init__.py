@@ -1,5 +1,10 @@
-from to_web_mercator import create_tileset
+from .to_web_mercator import create_tileset
+from .packed import create_packed_tileset
+from .catalog import merge_index, write_catalog
 
 __all__ = [
     "create_tileset",
-]
\ No newline at end of file
+    "create_packed_tileset",
+    "merge_index",
+    "write_catalog",
+]
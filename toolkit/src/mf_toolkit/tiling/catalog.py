@@ -0,0 +1,206 @@
+"""
+Tileset indexes and the root catalog of a model.
+
+Every tileset has an `index.json` (shadertiledlayer specification) listing its series. Writes
+go through `merge_index`: under a lock (see `file_lock`), the series are merged with the
+existing ones (an entry with the same tile URL pattern and frame replaces the previous one,
+so re-runs do not duplicate it) and the result is written to a temporary file then renamed,
+so readers never see a partial index.
+
+`write_catalog` gathers the indexes of a model folder into one compact `catalog.json`, so the
+frontend starts from a single request:
+
+    {"version": 1, "model": "CMCC",
+     "indicators": {"tas": {"months": ["01", ...], "levels": [2.0, 2.7, 4.0],
+                            "tilesets": ["tas_01", ...], "valueRange": [-12.4, 31.0]}},
+     "tilesets": {"tas_01": {"indicator": "tas", "month": "01", "change": null,
+                             "packed": false, "url": "tas_01/", "valueRange": [-8.1, 14.2],
+                             "index": {...}}}}
+
+`valueRange` spans the statistics of the series (see `stats`): over all the months and
+TRACC levels of an indicator (change layers excepted), so that the frontend can keep one
+colour scale across them. It is null for tilesets tiled without statistics.
+"""
+import os
+import re
+import json
+import glob
+import hashlib
+import tempfile
+import contextlib
+from typing import Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Lock files, outside the served tileset folders (see `file_lock`)
+LOCK_DIR = os.environ.get("MF_TOOLKIT_LOCK_DIR", os.path.join(tempfile.gettempdir(), "mf_toolkit_locks"))
+CATALOG_FILENAME = "catalog.json"
+CATALOG_VERSION = 1
+# {indicator}[_{delta|ratio}][_packed][_{MM}], as written by `pipeline.tile_indicator`
+IDENTIFIER_PATTERN = re.compile(
+    r"^(?P<indicator>.+?)(?:_(?P<change>delta|ratio))?(?:_(?P<packed>packed))?(?:_(?P<month>\d{2}))?$"
+)
+
+
+@contextlib.contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive lock on `path`, held across processes until the block exits. The lock file is
+    in `LOCK_DIR`, named after the real path of `path`, so nothing is left in the served tree.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    key = hashlib.sha1(os.path.realpath(path).encode()).hexdigest()
+    with open(os.path.join(LOCK_DIR, f"{key}.lock"), "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_json_atomic(path: str, payload: dict, indent: Optional[int] = 2) -> None:
+    """Write JSON to a temporary file then rename it over `path`."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    separators = None if indent else (",", ":")
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f, indent=indent, separators=separators, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _series_key(entry: dict) -> tuple:
+    return entry.get("tileUrlPattern"), entry.get("frame")
+
+
+def merge_series(existing: List[dict], added: List[dict]) -> List[dict]:
+    """Series of both lists, `added` replacing entries of the same tile URL pattern and frame."""
+    merged = {_series_key(entry): entry for entry in existing}
+    for entry in added:
+        merged[_series_key(entry)] = entry
+    return sorted(merged.values(), key=lambda s: (s.get("seriesAxisValue", float("-inf")), s.get("frame", 0)))
+
+
+def read_index(path: str) -> Optional[dict]:
+    """Tileset index at `path`, None if there is none yet."""
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_encoding(path: str, index: dict) -> None:
+    """Raise a RuntimeError if the tileset index at `path` exists with another `rasterEncoding`."""
+    existing = read_index(path)
+    if existing is None:
+        return
+    if existing["rasterEncoding"] != index["rasterEncoding"]:
+        raise RuntimeError(
+            f"{path} uses {existing['rasterEncoding']}, "
+            f"cannot add a series encoded with {index['rasterEncoding']}."
+        )
+
+
+def merge_index(path: str, index: dict) -> dict:
+    """
+    Add the series of `index` to the tileset index at `path` (created if missing).
+    All the series of a tileset are decoded with the encoding of its index: a different
+    `rasterEncoding` raises a RuntimeError.
+    Returns:
+        dict: The merged index
+    """
+    with file_lock(path):
+        check_encoding(path, index)
+        if os.path.isfile(path):
+            with open(path) as f:
+                merged = json.load(f)
+            merged["series"] = merge_series(merged["series"], index["series"])
+        else:
+            merged = dict(index, series=merge_series([], index["series"]))
+        write_json_atomic(path, merged)
+    return merged
+
+
+def value_range(indexes: List[dict]) -> Optional[List[float]]:
+    """[min, max] over the series statistics recorded in tileset indexes (see `stats`), None without any."""
+    stats = [
+        series["metadata"]["stats"]
+        for index in indexes
+        for series in index.get("series", [])
+        if (series.get("metadata") or {}).get("stats", {}).get("count")
+    ]
+    if not stats:
+        return None
+    return [min(s["min"] for s in stats), max(s["max"] for s in stats)]
+
+
+def parse_tileset_identifier(identifier: str) -> dict:
+    """Indicator, change mode, packing and month of a tileset folder name."""
+    match = IDENTIFIER_PATTERN.match(identifier)
+    return {
+        "indicator": match["indicator"],
+        "change": match["change"],
+        "packed": match["packed"] is not None,
+        "month": match["month"],
+    }
+
+
+def build_catalog(model_dir: str) -> dict:
+    """Catalog of every `{model_dir}/*/index.json`."""
+    tilesets = {}
+    indicators = {}
+    for index_path in sorted(glob.glob(os.path.join(model_dir, "*", "index.json"))):
+        identifier = os.path.basename(os.path.dirname(index_path))
+        with open(index_path) as f:
+            index = json.load(f)
+        entry = parse_tileset_identifier(identifier)
+        tilesets[identifier] = {**entry, "url": f"{identifier}/", "valueRange": value_range([index]), "index": index}
+
+        summary = indicators.setdefault(
+            entry["indicator"], {"months": set(), "levels": set(), "tilesets": [], "indexes": []}
+        )
+        if entry["month"]:
+            summary["months"].add(entry["month"])
+        summary["levels"].update(
+            s["seriesAxisValue"] for s in index.get("series", []) if s.get("seriesAxisValue") is not None
+        )
+        summary["tilesets"].append(identifier)
+        # Change layers have their own scale
+        if entry["change"] is None:
+            summary["indexes"].append(index)
+
+    return {
+        "version": CATALOG_VERSION,
+        "model": os.path.basename(os.path.normpath(model_dir)),
+        "indicators": {
+            name: {
+                "months": sorted(summary["months"]),
+                "levels": sorted(summary["levels"]),
+                "tilesets": summary["tilesets"],
+                "valueRange": value_range(summary["indexes"]),
+            }
+            for name, summary in sorted(indicators.items())
+        },
+        "tilesets": tilesets,
+    }
+
+
+def write_catalog(model_dir: str) -> dict:
+    """Rebuild `{model_dir}/catalog.json` (compact JSON) from the tileset indexes."""
+    path = os.path.join(model_dir, CATALOG_FILENAME)
+    with file_lock(path):
+        catalog = build_catalog(model_dir)
+        write_json_atomic(path, catalog, indent=None)
+    return catalog
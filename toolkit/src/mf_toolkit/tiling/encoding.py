@@ -0,0 +1,161 @@
+"""
+Tile value encoding chosen from the data.
+
+Tiles store `code = round((value - offset) / step)` on 1 to 3 byte channels. Instead of a
+hand-set offset, step and channel count, `auto_encoding` runs one histogram pass over the
+rasters of a tileset (every series member shares the encoding of its `index.json`) and picks
+the smallest channel count that covers the value range at the requested precision.
+"""
+from __future__ import annotations
+
+import math
+from typing import Iterable, List, Optional, TypedDict
+
+import numpy as np
+
+from mf_toolkit import instrumentation
+from mf_toolkit.lazy import lazy_import
+
+gdal = lazy_import("osgeo.gdal")
+
+CHANNEL_ORDER = "rgb"
+HISTOGRAM_BINS = 256
+# Partial histograms kept before they are merged into one (bounds the memory of many tiles)
+MAX_PARTIALS = 64
+
+
+# Same fields as the indicator registry encoding, without importing the climato package
+class TileEncoding(TypedDict):
+    lowest_value: float
+    value_step: float
+    channels: str
+
+
+class ValueHistogram:
+    """Streaming min/max and coarse histogram of the valid values of several rasters."""
+
+    def __init__(self) -> None:
+        self.min = math.inf
+        self.max = -math.inf
+        self.count = 0
+        self.sum = 0.0
+        self._partials: List[np.ndarray] = []
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def add(self, values: np.ndarray, nodata_value: Optional[float] = None) -> None:
+        values = np.asarray(values).ravel()
+        if values.dtype.kind != "f":
+            values = values.astype(np.float64)
+        valid = np.isfinite(values)
+        if nodata_value is not None and not np.isnan(nodata_value):
+            valid &= values != nodata_value
+        values = values[valid]
+        if values.size == 0:
+            return
+        lowest, highest = float(values.min()), float(values.max())
+        self.min = min(self.min, lowest)
+        self.max = max(self.max, highest)
+        self.count += values.size
+        self.sum += float(values.sum(dtype=np.float64))
+        # Only a coarse histogram per raster is kept, not the values
+        counts, edges = np.histogram(values, bins=HISTOGRAM_BINS, range=(lowest, highest))
+        self._append(np.stack([counts, edges[:-1], edges[1:]]))
+
+    def merge(self, other: "ValueHistogram") -> None:
+        """Add the values counted by `other` (eg. the histogram of one tile into its zoom level)."""
+        if other.count == 0:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.sum += other.sum
+        for partial in other._partials:
+            self._append(partial)
+
+    def _append(self, partial: np.ndarray) -> None:
+        self._partials.append(partial)
+        if len(self._partials) > MAX_PARTIALS:
+            edges = np.linspace(self.min, self.max, HISTOGRAM_BINS + 1)
+            counts = np.asarray(self.histogram(HISTOGRAM_BINS)["counts"])
+            self._partials = [np.stack([counts, edges[:-1], edges[1:]])]
+
+    def histogram(self, bins: int = HISTOGRAM_BINS) -> dict:
+        """Counts over [min, max], merged from the per-raster histograms (bin centers)."""
+        if self.count == 0:
+            return {"min": None, "max": None, "counts": []}
+        edges = np.linspace(self.min, self.max, bins + 1)
+        counts = np.zeros(bins, dtype=np.int64)
+        for raster_counts, lower, upper in self._partials:
+            centers = (lower + upper) / 2
+            index = np.clip(np.searchsorted(edges, centers, side="right") - 1, 0, bins - 1)
+            np.add.at(counts, index, raster_counts.astype(np.int64))
+        return {"min": self.min, "max": self.max, "counts": counts.tolist()}
+
+
+def encoding_for_range(
+    lowest: float,
+    highest: float,
+    precision: float,
+    channel_order: str = CHANNEL_ORDER,
+) -> TileEncoding:
+    """
+    Smallest encoding of [lowest, highest] with a step of `precision`: the offset is aligned
+    on the step (round values in the frontend) and channels are taken in `channel_order`.
+    """
+    if precision <= 0:
+        raise ValueError("precision must be positive")
+    offset = math.floor(lowest / precision) * precision
+    codes = math.floor((highest - offset) / precision + 0.5) + 1
+    channel_count = 1
+    while 256**channel_count < codes:
+        channel_count += 1
+    if channel_count > len(channel_order):
+        raise ValueError(
+            f"Range [{lowest}, {highest}] needs {codes} codes at precision {precision}, "
+            f"more than {len(channel_order)} channels can hold"
+        )
+    # Decimal noise of the float offset would end up in index.json
+    digits = max(0, -math.floor(math.log10(precision))) + 2
+    return {
+        "lowest_value": round(offset, digits),
+        "value_step": precision,
+        "channels": channel_order[:channel_count],
+    }
+
+
+def raster_histogram(paths: Iterable[str], histogram: Optional[ValueHistogram] = None) -> ValueHistogram:
+    """One pass over the first band of each raster (the value range is preserved by warping)."""
+    histogram = histogram or ValueHistogram()
+    for path in paths:
+        with instrumentation.span("raster_histogram", path=str(path)):
+            dataset = gdal.Open(str(path))
+            band = dataset.GetRasterBand(1)
+            histogram.add(band.ReadAsArray(), band.GetNoDataValue())
+            dataset = None
+    return histogram
+
+
+def auto_encoding(
+    paths: Iterable[str],
+    precision: float,
+    channel_order: str = CHANNEL_ORDER,
+) -> tuple[TileEncoding, dict]:
+    """
+    Encoding of a tileset chosen from the values of all its rasters.
+    Returns:
+        (TileEncoding, dict): The encoding and a description to record in index.json
+    """
+    histogram = raster_histogram(paths)
+    if histogram.count == 0:
+        raise ValueError("No valid value in the rasters, cannot choose an encoding")
+    encoding = encoding_for_range(histogram.min, histogram.max, precision, channel_order)
+    description = {
+        "mode": "auto",
+        "precision": precision,
+        "valueRange": [histogram.min, histogram.max],
+        "histogram": histogram.histogram(32)["counts"],
+    }
+    return encoding, description
@@ -0,0 +1,233 @@
+"""
+Series-packed tilesets.
+
+A regular tileset has one `{z}/{x}/{y}.webp` tree per series member, so scrubbing through
+the TRACC levels (and months) of a view downloads one tile per member. A packed tileset
+stores every member of a tile in a single image, as a texture atlas of `TILE_SIZE` frames
+laid out row by row:
+
+    frame i -> column i % columns, row i // columns
+
+All frames share the value encoding of the index, and `rasterEncoding.packing` describes
+the layout. Each series entry points to the same tile URL with its `frame` index:
+
+    "rasterEncoding": {..., "packing": {"layout": "atlas", "frameWidth": 512,
+                       "frameHeight": 512, "columns": 2, "rows": 2, "frameCount": 4}}
+    "series": [{"tileUrlPattern": "packed/{z}/{x}/{y}.webp", "seriesAxisValue": 1.5,
+                "frame": 0, "metadata": {}}, ...]
+"""
+from __future__ import annotations
+
+import os
+import math
+import pathlib
+from typing import List, Optional, Sequence, Tuple, TypedDict
+
+import numpy as np
+
+from mf_toolkit import instrumentation
+from .catalog import file_lock, write_json_atomic
+from .encoding import ValueHistogram
+from .stats import STATS_FILENAME, SeriesStats, merge_stats
+from .to_web_mercator import (
+    RASTER_SAVE_OPTIONS,
+    TILE_SIZE,
+    WARP_MEMORY_MB,
+    Image,
+    close_warped,
+    dataset_tile_range,
+    encode_tile,
+    gdal,
+    get_bounds_mercator,
+    tile_translate_options,
+    tileset_index,
+    warp_to_web_mercator,
+)
+
+PACKED_FOLDER = "packed"
+# WebP images are limited to 16383 pixels per side
+MAX_ATLAS_SIZE = 16383
+
+
+class PackedMember(TypedDict):
+    input: str
+    series_axis_value: float
+    metadata: dict
+
+
+class PackingLayout(TypedDict):
+    layout: str
+    frameWidth: int
+    frameHeight: int
+    columns: int
+    rows: int
+    frameCount: int
+
+
+def atlas_layout(frame_count: int, frame_size: int = TILE_SIZE) -> PackingLayout:
+    """Near-square grid of `frame_count` frames."""
+    if frame_count < 1:
+        raise ValueError("A packed tileset needs at least one series member")
+    columns = math.ceil(math.sqrt(frame_count))
+    rows = math.ceil(frame_count / columns)
+    if max(columns, rows) * frame_size > MAX_ATLAS_SIZE:
+        raise ValueError(f"{frame_count} frames of {frame_size} pixels do not fit in one tile image")
+    return {
+        "layout": "atlas",
+        "frameWidth": frame_size,
+        "frameHeight": frame_size,
+        "columns": columns,
+        "rows": rows,
+        "frameCount": frame_count,
+    }
+
+
+def pack_frames(frames: Sequence[Optional[np.ndarray]], layout: PackingLayout) -> np.ndarray:
+    """RGBA atlas of encoded frames; missing frames (outside a member's extent) stay transparent."""
+    width, height = layout["frameWidth"], layout["frameHeight"]
+    atlas = np.zeros((layout["rows"] * height, layout["columns"] * width, 4), dtype=np.uint8)
+    for index, frame in enumerate(frames):
+        if frame is None:
+            continue
+        row, column = divmod(index, layout["columns"])
+        atlas[row * height:(row + 1) * height, column * width:(column + 1) * width] = frame
+    return atlas
+
+
+def packed_series(members: Sequence[PackedMember], raster_format: str = "webp") -> List[dict]:
+    return [
+        {
+            "tileUrlPattern": f"{PACKED_FOLDER}/{{z}}/{{x}}/{{y}}.{raster_format}",
+            "seriesAxisValue": member["series_axis_value"],
+            "frame": frame,
+            "metadata": dict(member.get("metadata", {})),
+        }
+        for frame, member in enumerate(members)
+    ]
+
+
+def _tile_range(datasets: list, z: int) -> Tuple[int, int, int, int]:
+    ranges = [dataset_tile_range(ds, z) for ds in datasets]
+    return (
+        min(r[0] for r in ranges),
+        max(r[1] for r in ranges),
+        min(r[2] for r in ranges),
+        max(r[3] for r in ranges),
+    )
+
+
+@instrumentation.traced("create_packed_tileset", profile=True)
+def create_packed_tileset(
+        members: Sequence[PackedMember],
+        output: str,
+        identifier: str,
+        minzoom: int,
+        maxzoom: int,
+        lowest_value: float,
+        value_step: float,
+        channels: str,
+        meta_name: str,
+        meta_description: str,
+        meta_attribution: str,
+        meta_pixel_unit: str,
+        meta_series_axis_name: str,
+        meta_series_axis_unit: str,
+        raster_format: str = "webp",
+        encoding_metadata: Optional[dict] = None,
+        warp_mode: str = "auto",
+        warp_memory_mb: int = WARP_MEMORY_MB,
+        ) -> dict:
+    """
+    Tile several GeoTIFFs (the series members, in frame order) into one packed tileset
+    `{output}/{identifier}/`. Every member is warped once, then each tile is cut from all
+    members, encoded with the shared encoding and written as one atlas image. The value
+    statistics of each member are recorded as by `create_tileset` (see `stats`).
+    Returns:
+        dict: The index.json payload
+    """
+    if minzoom < 0 or maxzoom < minzoom:
+        raise RuntimeError("minzoom must be 0 or greater and lower than maxzoom.")
+
+    layout = atlas_layout(len(members))
+    output_folder = os.path.join(output, identifier) if identifier else output
+    tile_output_folder = os.path.join(output_folder, PACKED_FOLDER)
+    # Every member stays open while tiles are cut: with large rasters, 'auto' keeps each on disk
+    datasets = []
+    try:
+        for member in members:
+            datasets.append(
+                warp_to_web_mercator(member["input"], output_folder, warp_mode, warp_memory_mb // len(members))
+            )
+
+        index = tileset_index(
+            name=meta_name,
+            description=meta_description,
+            attribution=meta_attribution,
+            bounds=get_bounds_mercator(datasets[0]),
+            minzoom=minzoom,
+            maxzoom=maxzoom,
+            channels=channels,
+            polynomial_slope=value_step,
+            polynomial_offset=lowest_value,
+            pixel_unit=meta_pixel_unit,
+            series_axis_name=meta_series_axis_name,
+            series_axis_unit=meta_series_axis_unit,
+            series=packed_series(members, raster_format),
+            raster_format=raster_format,
+            metadata={"encoding": encoding_metadata} if encoding_metadata else None,
+        )
+        index["rasterEncoding"]["packing"] = layout
+        stats = [SeriesStats(value_step) for _ in members]
+
+        for z in range(minzoom, maxzoom + 1):
+            x_min, x_max, y_min, y_max = _tile_range(datasets, z)
+            for x in range(x_min, x_max + 1):
+                for y in range(y_min, y_max + 1):
+                    frames = []
+                    for ds, member_stats in zip(datasets, stats):
+                        ds_x_min, ds_x_max, ds_y_min, ds_y_max = dataset_tile_range(ds, z)
+                        if not (ds_x_min <= x <= ds_x_max and ds_y_min <= y <= ds_y_max):
+                            frames.append(None)
+                            continue
+                        with instrumentation.span("gdal.Translate"):
+                            tile_ds = gdal.Translate(
+                                destName="", srcDS=ds, options=tile_translate_options(z, x, y, format="MEM")
+                            )
+                        band = tile_ds.GetRasterBand(1)
+                        values, nodata_value = band.ReadAsArray(), band.GetNoDataValue()
+                        histogram = ValueHistogram()
+                        with instrumentation.span("tile_stats"):
+                            histogram.add(values, nodata_value)
+                        member_stats.add_tile(z, x, y, histogram)
+                        with instrumentation.span("encode_tile"):
+                            frames.append(encode_tile(values, nodata_value, channels, value_step, lowest_value))
+                        tile_ds = None
+
+                    tile_path = os.path.join(tile_output_folder, f"{z}/{x}/{y}.{raster_format}")
+                    pathlib.Path(os.path.dirname(tile_path)).mkdir(parents=True, exist_ok=True)
+                    with instrumentation.span("Image.save"):
+                        Image.fromarray(pack_frames(frames, layout)).save(
+                            tile_path, format=raster_format, **RASTER_SAVE_OPTIONS[raster_format]
+                        )
+                    instrumentation.count("tiles")
+                    if instrumentation.is_enabled():
+                        instrumentation.count("tile_bytes", os.path.getsize(tile_path))
+    finally:
+        # On-disk intermediates are in the tileset folder: never left behind, even on errors
+        for ds in datasets:
+            close_warped(ds)
+        datasets = None
+
+    for series, member_stats in zip(index["series"], stats):
+        series["metadata"]["stats"] = member_stats.summary()
+    merge_stats(
+        os.path.join(output_folder, STATS_FILENAME),
+        [member_stats.to_json(series) for series, member_stats in zip(index["series"], stats)],
+        replace=True,
+    )
+
+    # Written last, and replaced as a whole: the tiles it describes are all there
+    index_path = os.path.join(output_folder, "index.json")
+    with file_lock(index_path):
+        write_json_atomic(index_path, index)
+    return index
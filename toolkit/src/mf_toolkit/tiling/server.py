@@ -0,0 +1,457 @@
+"""
+On-demand tile server.
+
+Renders `{model}/{identifier}/{axis}/{z}/{x}/{y}.webp` tiles when they are requested,
+straight from the monthly GeoTIFFs written by `export_monthly_geotiff`, instead of
+pre-rendering every tileset with `create_tileset`. The URLs and `index.json` payloads
+are the ones of the static tilesets, so the frontend can point at this server as is:
+
+    mf-toolkit serve --input data/output --port 8080
+
+    GET /tilesets/CMCC-CM2-SR5/tas_07/index.json
+    GET /tilesets/CMCC-CM2-SR5/tas_07/2-7/4/8/5.webp
+    GET /tilesets/CMCC-CM2-SR5/tas_delta_07/index.json   (change layers, `compute --change`)
+
+Rendered tiles are kept in a bounded in-memory LRU backed by a bounded on-disk LRU
+(keyed by the source file fingerprint and encoding, so a rebuilt GeoTIFF is never
+served stale). Warped sources are kept in a small LRU of GDAL datasets; concurrent
+requests for a source being warped wait for that warp. The GeoTIFFs behind an
+identifier are looked up once per `MF_TOOLKIT_SERIES_TTL` seconds (30 by default), so
+newly exported TRACC levels appear within that delay.
+"""
+from __future__ import annotations
+
+import io
+import os
+import re
+import json
+import glob
+import hashlib
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .. import instrumentation
+from ..lazy import lazy_import
+from ..data.config import CACHE_DIR
+from ..climato.indicators import CHANGE_MODES, Indicator, get_indicator
+from ..climato.indicators.registry import TileEncoding
+from ..pipeline import TRACC_AXIS_VALUES
+from .to_web_mercator import (
+    dataset_tile_range,
+    RASTER_SAVE_OPTIONS,
+    encode_tile,
+    get_bounds_mercator,
+    series_entry,
+    tile_translate_options,
+    tileset_index,
+    warp_to_web_mercator,
+    close_warped,
+)
+
+gdal = lazy_import("osgeo.gdal")
+Image = lazy_import("PIL.Image")
+
+TILE_CACHE_DIR = f"{CACHE_DIR}/tiles"
+# Seconds during which the GeoTIFFs found for a tileset identifier are reused
+SERIES_TTL = float(os.environ.get("MF_TOOLKIT_SERIES_TTL", 30))
+MAX_SERIES_ENTRIES = 1024
+
+TILE_PATH = re.compile(r"^/(?:tilesets/)?([^/]+)/([^/]+)/(?:([^/]+)/)?(\d+)/(\d+)/(\d+)\.webp$")
+INDEX_PATH = re.compile(r"^/(?:tilesets/)?([^/]+)/([^/]+)/index\.json$")
+
+
+class TileCache:
+    """Two level LRU: `max_memory_bytes` of tiles in memory, `max_disk_bytes` in `cache_dir`."""
+
+    def __init__(self, max_memory_bytes: int, cache_dir: Optional[str], max_disk_bytes: int) -> None:
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = cache_dir
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Resume the disk LRU from the previous run, least recently used first
+            paths = glob.glob(os.path.join(cache_dir, "*", "*.webp"))
+            for path in sorted(paths, key=os.path.getmtime):
+                size = os.path.getsize(path)
+                self._disk[os.path.basename(path)[:-5]] = size
+                self._disk_bytes += size
+            self._evict_disk()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.webp")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                instrumentation.count("tile_cache_memory_hits")
+                return self._memory[key]
+            on_disk = self.cache_dir is not None and key in self._disk
+            if on_disk:
+                self._disk.move_to_end(key)
+        if not on_disk:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        instrumentation.count("tile_cache_disk_hits")
+        self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._put_memory(key, data)
+        if self.cache_dir is None or len(data) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            self._evict_disk()
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_memory_bytes:
+            return
+        with self._lock:
+            self._memory_bytes += len(data) - len(self._memory.pop(key, b""))
+            self._memory[key] = data
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self) -> None:
+        # Called with the lock held
+        while self._disk_bytes > self.max_disk_bytes:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_tiles": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_tiles": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+class _Source:
+    """A GeoTIFF warped to Web Mercator once, then cut into tiles under a lock (GDAL datasets are not thread safe)."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.dataset = warp_to_web_mercator(path, None)
+        band = self.dataset.GetRasterBand(1)
+        self.nodata_value = band.GetNoDataValue()
+
+    def close(self) -> None:
+        """Close the warped dataset (once a running tile is done), removing its on-disk intermediate."""
+        with self.lock:
+            if self.dataset is not None:
+                close_warped(self.dataset)
+                self.dataset = None
+
+
+class Layer(NamedTuple):
+    spec: Indicator
+    folder: str
+    encoding: TileEncoding
+    units: str
+
+
+def parse_identifier(identifier: str) -> Tuple[Optional[Layer], Optional[int]]:
+    """Layer and month of a `{short name}[_{change}]_{MM}` tileset identifier."""
+    name, _, month = identifier.rpartition("_")
+    base, _, change = name.rpartition("_")
+    if change not in CHANGE_MODES:
+        base, change = name, None
+    if not base or not month.isdigit():
+        return None, None
+    try:
+        spec = get_indicator(base)
+    except ValueError:
+        return None, None
+    if change:
+        layer = Layer(spec, f"{spec.name}_{change}", spec.change_encoding(change), spec.change_units(change))
+    else:
+        layer = Layer(spec, spec.name, spec.encoding, spec.units)
+    return layer, int(month)
+
+
+class TileServer:
+    """
+    Tiles rendered on request from `{input_dir}/{model}/{indicator}/{tracc level}/*.tif`.
+    Identifiers are `{indicator short name}_{MM}` as in the static tilesets, and the
+    encoding (channels, slope, offset) comes from the indicator registry. Change layers
+    (`{short name}_delta_{MM}`) are read from `{indicator}_delta` with the change encoding.
+    """
+
+    def __init__(
+        self,
+        input_dir: str = "data/output",
+        minzoom: int = 0,
+        maxzoom: int = 6,
+        cache_dir: Optional[str] = TILE_CACHE_DIR,
+        max_memory_bytes: int = 256 * 2**20,
+        max_disk_bytes: int = 2 * 2**30,
+        max_sources: int = 16,
+        attribution: str = "Meteo France",
+    ) -> None:
+        self.input_dir = input_dir
+        self.minzoom = minzoom
+        self.maxzoom = maxzoom
+        self.attribution = attribution
+        self.cache = TileCache(max_memory_bytes, cache_dir, max_disk_bytes)
+        self.max_sources = max_sources
+        self._sources: "OrderedDict[str, _Source]" = OrderedDict()
+        # Sources being warped, awaited by the other requests for them
+        self._warming: Dict[str, Future] = {}
+        self._sources_lock = threading.Lock()
+        # (model, identifier) -> (lookup time, layer, series), least recently used first
+        self._series: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._series_lock = threading.Lock()
+
+    def _model_dir(self, model: str) -> Optional[str]:
+        # The frontend asks for short upper-cased names ('CMCC'), the pipeline writes the
+        # catalog GCM name ('CMCC-CM2-SR5'): exact match first, then a unique prefix
+        names = [name for name in os.listdir(self.input_dir) if os.path.isdir(os.path.join(self.input_dir, name))]
+        exact = [name for name in names if name.lower() == model.lower()]
+        prefixed = [name for name in names if name.lower().startswith(model.lower() + "-")]
+        matches = exact or prefixed
+        return os.path.join(self.input_dir, matches[0]) if len(matches) == 1 else None
+
+    def series_files(self, model: str, identifier: str) -> Tuple[Optional[Layer], List[Tuple[float, str]]]:
+        """Layer and (series axis value, GeoTIFF path) pairs behind a tileset identifier (see `SERIES_TTL`)."""
+        key = (model, identifier)
+        now = time.monotonic()
+        with self._series_lock:
+            cached = self._series.get(key)
+            if cached is not None and now - cached[0] < SERIES_TTL:
+                self._series.move_to_end(key)
+                return cached[1], cached[2]
+        layer, series = self._find_series_files(model, identifier)
+        with self._series_lock:
+            self._series[key] = (now, layer, series)
+            self._series.move_to_end(key)
+            while len(self._series) > MAX_SERIES_ENTRIES:
+                self._series.popitem(last=False)
+        return layer, series
+
+    def forget_series(self, model: str, identifier: str) -> None:
+        with self._series_lock:
+            self._series.pop((model, identifier), None)
+
+    def _find_series_files(self, model: str, identifier: str) -> Tuple[Optional[Layer], List[Tuple[float, str]]]:
+        layer, month = parse_identifier(identifier)
+        model_dir = self._model_dir(model)
+        if model_dir is None or layer is None:
+            return None, []
+        name = layer.spec.name
+        series = []
+        for level, axis_value in TRACC_AXIS_VALUES.items():
+            pattern = os.path.join(model_dir, layer.folder, level, f"{name}_*_{level}_{month:02d}.tif")
+            paths = sorted(glob.glob(pattern))
+            if paths:
+                series.append((axis_value, paths[0]))
+        return layer, series
+
+    def source(self, path: str) -> _Source:
+        """Warped source of `path`, warped once even when several requests ask for it at the same time."""
+        with self._sources_lock:
+            if path in self._sources:
+                self._sources.move_to_end(path)
+                return self._sources[path]
+            warming = self._warming.get(path)
+            if warming is None:
+                warming = self._warming[path] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return warming.result()
+        try:
+            with instrumentation.span("warp_source"):
+                source = _Source(path)
+        except BaseException as error:
+            with self._sources_lock:
+                del self._warming[path]
+            warming.set_exception(error)
+            raise
+        evicted = []
+        with self._sources_lock:
+            self._sources[path] = source
+            del self._warming[path]
+            while len(self._sources) > self.max_sources:
+                evicted.append(self._sources.popitem(last=False)[1])
+        warming.set_result(source)
+        for old in evicted:
+            old.close()
+        return source
+
+    def close(self) -> None:
+        """Close every warped source."""
+        with self._sources_lock:
+            sources = list(self._sources.values())
+            self._sources.clear()
+        for source in sources:
+            source.close()
+
+    def index(self, model: str, identifier: str) -> Optional[dict]:
+        layer, series = self.series_files(model, identifier)
+        if not series:
+            return None
+        return tileset_index(
+            name=identifier,
+            description=layer.spec.description,
+            attribution=self.attribution,
+            bounds=get_bounds_mercator(self.source(series[0][1]).dataset),
+            minzoom=self.minzoom,
+            maxzoom=self.maxzoom,
+            channels=layer.encoding["channels"],
+            polynomial_slope=layer.encoding["value_step"],
+            polynomial_offset=layer.encoding["lowest_value"],
+            pixel_unit=layer.units,
+            series_axis_name="TRACC °C",
+            series_axis_unit="°C",
+            series=[series_entry(axis_value, str(axis_value).replace(".", "-")) for axis_value, _ in series],
+        )
+
+    def tile(self, model: str, identifier: str, axis: Optional[str], z: int, x: int, y: int) -> Optional[bytes]:
+        """WebP bytes of a tile, or None when it is outside the tileset."""
+        if not self.minzoom <= z <= self.maxzoom:
+            return None
+        layer, series = self.series_files(model, identifier)
+        paths = {str(axis_value).replace(".", "-"): path for axis_value, path in series}
+        path = paths.get(axis or "")
+        if path is None:
+            return None
+
+        encoding = layer.encoding
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Removed or renamed since the series lookup: look the series up again
+            self.forget_series(model, identifier)
+            layer, series = self.series_files(model, identifier)
+            path = {str(axis_value).replace(".", "-"): path for axis_value, path in series}.get(axis or "")
+            if path is None:
+                return None
+            stat = os.stat(path)
+        key = hashlib.sha1(
+            json.dumps([os.path.abspath(path), stat.st_size, stat.st_mtime_ns, encoding, z, x, y]).encode()
+        ).hexdigest()
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        while True:
+            source = self.source(path)
+            with source.lock:
+                if source.dataset is None:
+                    # Evicted and closed meanwhile: warped again
+                    continue
+                x_min, x_max, y_min, y_max = dataset_tile_range(source.dataset, z)
+                if not (x_min <= x <= x_max and y_min <= y <= y_max):
+                    return None
+                with instrumentation.span("gdal.Translate"):
+                    tile_ds = gdal.Translate(
+                        destName="", srcDS=source.dataset, options=tile_translate_options(z, x, y, format="MEM")
+                    )
+                    tile_data_arr = tile_ds.GetRasterBand(1).ReadAsArray()
+            break
+        with instrumentation.span("encode_tile"):
+            rgba_arr = encode_tile(
+                tile_data_arr,
+                source.nodata_value,
+                encoding["channels"],
+                encoding["value_step"],
+                encoding["lowest_value"],
+            )
+        buffer = io.BytesIO()
+        with instrumentation.span("Image.save"):
+            Image.fromarray(rgba_arr).save(buffer, format="webp", **RASTER_SAVE_OPTIONS["webp"])
+        data = buffer.getvalue()
+        instrumentation.count("tiles")
+        self.cache.put(key, data)
+        return data
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    tile_server: TileServer = None
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0]
+        try:
+            match = TILE_PATH.match(path)
+            if match:
+                model, identifier, axis, z, x, y = match.groups()
+                body = self.tile_server.tile(model, identifier, axis, int(z), int(x), int(y))
+                return self._send(body, "image/webp")
+            match = INDEX_PATH.match(path)
+            if match:
+                index = self.tile_server.index(*match.groups())
+                body = json.dumps(index, ensure_ascii=False).encode() if index else None
+                return self._send(body, "application/json")
+            if path == "/stats":
+                return self._send(json.dumps(self.tile_server.cache.stats()).encode(), "application/json")
+        except Exception:
+            logging.exception(f"Failed to serve {path}")
+            self.send_error(500)
+            return
+        self.send_error(404)
+
+    def _send(self, body: Optional[bytes], content_type: str) -> None:
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        logging.debug(format % args)
+
+
+def make_server(tile_server: TileServer, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    handler = type("BoundTileRequestHandler", (TileRequestHandler,), {"tile_server": tile_server})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(tile_server: TileServer, host: str = "127.0.0.1", port: int = 8080) -> None:
+    httpd = make_server(tile_server, host, port)
+    logging.info(f"Serving tiles from {tile_server.input_dir} on http://{host}:{httpd.server_port}/tilesets/")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        tile_server.close()
@@ -0,0 +1,106 @@
+"""
+Value statistics of tilesets, counted while the tiles are encoded.
+
+The tiler already holds the float values of every tile before encoding it: each tile is
+counted on the way (no extra read) into a `ValueHistogram`, merged into the statistics of
+its zoom level. Every zoom level covers the whole member at another resolution, so the
+statistics of the member are those of its highest zoom level (the finest, closest to the
+raster). Its summary (count, min, max, mean) is recorded in the `metadata.stats` of its
+series entry in index.json, and therefore in the catalog of the model. The details go to a compact `stats.json` next to index.json:
+
+    {"version": 1, "series": [
+      {"tileUrlPattern": "2-0/{z}/{x}/{y}.webp", "seriesAxisValue": 2.0,
+       "stats": {"count": 52814, "min": -3.2, "max": 27.9, "mean": 12.1, "histogram": [12, 40, ...]},
+       "zooms": {"0": {...}, "1": {...}},
+       "tiles": {"fields": ["z", "x", "y", "count", "min", "max", "mean", "histogram"],
+                 "rows": [[0, 0, 0, 1234, -3.2, 27.9, 12.1, [3, 9, ...]], ...]}}]}
+
+Histograms are counts over [min, max] of what they describe: `HISTOGRAM_BINS` bins for a
+member or a zoom level, `TILE_HISTOGRAM_BINS` for a tile. Tiles without any valid value
+have no row. Values are rounded to a tenth of the encoding step.
+"""
+from __future__ import annotations
+
+import os
+import json
+import math
+from typing import Dict, List, Tuple
+
+from .catalog import file_lock, merge_series, write_json_atomic
+from .encoding import ValueHistogram
+
+STATS_FILENAME = "stats.json"
+STATS_VERSION = 1
+HISTOGRAM_BINS = 32
+TILE_HISTOGRAM_BINS = 8
+TILE_FIELDS = ["z", "x", "y", "count", "min", "max", "mean", "histogram"]
+
+
+def summarize(histogram: ValueHistogram, bins: int, value_step: float) -> dict:
+    """Count, min, max, mean and histogram of `bins` counts, rounded to a tenth of `value_step`."""
+    if histogram.count == 0:
+        return {"count": 0, "min": None, "max": None, "mean": None, "histogram": []}
+    digits = max(0, -math.floor(math.log10(value_step))) + 1
+    return {
+        "count": histogram.count,
+        "min": round(histogram.min, digits),
+        "max": round(histogram.max, digits),
+        "mean": round(histogram.mean, digits),
+        "histogram": histogram.histogram(bins)["counts"],
+    }
+
+
+class SeriesStats:
+    """Statistics of one series member of a tileset, accumulated tile by tile."""
+
+    def __init__(self, value_step: float) -> None:
+        self.value_step = value_step
+        self.zooms: Dict[int, ValueHistogram] = {}
+        self.tiles: Dict[Tuple[int, int, int], list] = {}
+
+    def add_tile(self, z: int, x: int, y: int, histogram: ValueHistogram) -> None:
+        """Count a tile, from the histogram of its values (see `export_web_raster_tile`)."""
+        if histogram.count == 0:
+            return
+        summary = summarize(histogram, TILE_HISTOGRAM_BINS, self.value_step)
+        self.tiles[(z, x, y)] = [z, x, y] + [summary[field] for field in TILE_FIELDS[3:]]
+        self.zooms.setdefault(z, ValueHistogram()).merge(histogram)
+
+    @property
+    def series(self) -> ValueHistogram:
+        """Histogram of the member: that of its highest zoom level, merging all would count each value once per zoom."""
+        return self.zooms[max(self.zooms)] if self.zooms else ValueHistogram()
+
+    def summary(self) -> dict:
+        """Count, min, max and mean of the member, as recorded in its index.json series entry."""
+        summary = summarize(self.series, HISTOGRAM_BINS, self.value_step)
+        del summary["histogram"]
+        return summary
+
+    def to_json(self, series_entry: dict) -> dict:
+        """Entry of the member in stats.json, identified like its index.json series entry."""
+        entry = {key: series_entry[key] for key in ("tileUrlPattern", "frame", "seriesAxisValue") if key in series_entry}
+        entry["stats"] = summarize(self.series, HISTOGRAM_BINS, self.value_step)
+        entry["zooms"] = {
+            str(z): summarize(histogram, HISTOGRAM_BINS, self.value_step) for z, histogram in sorted(self.zooms.items())
+        }
+        entry["tiles"] = {"fields": TILE_FIELDS, "rows": [self.tiles[tile] for tile in sorted(self.tiles)]}
+        return entry
+
+
+def merge_stats(path: str, series: List[dict], replace: bool = False) -> dict:
+    """
+    Add the members of `series` (see `SeriesStats.to_json`) to the stats.json at `path`,
+    replacing those of the same tile URL pattern and frame, or all of them with `replace`.
+    Returns:
+        dict: The merged statistics
+    """
+    with file_lock(path):
+        existing = []
+        if not replace and os.path.isfile(path):
+            with open(path) as f:
+                existing = json.load(f)["series"]
+        payload = {"version": STATS_VERSION, "series": merge_series(existing, series)}
+        write_json_atomic(path, payload, indent=None)
+    return payload
+
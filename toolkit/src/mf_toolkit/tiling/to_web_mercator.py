@@ -1,14 +1,24 @@
+from __future__ import annotations
 
-import json
-from osgeo import gdal
 import sys
 import os
+import logging
 import argparse
 import pathlib
 import math
+import tempfile
 import numpy as np
-from PIL import Image
-from typing import TypedDict, List
+from typing import TypedDict, List, Optional
+
+from mf_toolkit import instrumentation
+from mf_toolkit.lazy import lazy_import
+from mf_toolkit.tiling.catalog import check_encoding, merge_index, read_index
+from mf_toolkit.tiling.encoding import ValueHistogram
+from mf_toolkit.tiling.stats import STATS_FILENAME, SeriesStats, merge_stats
+
+# GDAL and PIL are only imported when a tile is actually produced
+gdal = lazy_import("osgeo.gdal")
+Image = lazy_import("PIL.Image")
 
 MERCATOR_CRS = "EPSG:3857"
 WEBM_HALF = 20037508.342789244  # Web Mercator half-extent (meters)
@@ -18,6 +28,24 @@ CHANNEL_INDICES = {
     "g": 1,
     "b": 2
 }
+# Pillow save options per tile format (see `python -m benchmarks.run -filter raster_format`)
+RASTER_SAVE_OPTIONS = {
+    "webp": {"lossless": True, "method": 4},
+    "png": {"compress_level": 6},
+}
+
+# Warped intermediates: in memory up to this size, tiled on-disk GeoTIFF above (see `warp_to_web_mercator`)
+WARP_MEMORY_MB = int(os.environ.get("MF_TOOLKIT_WARP_MEMORY_MB", 512))
+WARP_MODES = ("auto", "mem", "gtiff", "vrt")
+WARP_SUFFIX = ".3857.tif"
+WARP_CREATION_OPTIONS = [
+    "TILED=YES",
+    "BLOCKXSIZE=512",
+    "BLOCKYSIZE=512",
+    "COMPRESS=DEFLATE",
+    "PREDICTOR=3",
+    "BIGTIFF=IF_SAFER",
+]
 
 # 
 class TilesetMetadata(TypedDict):
@@ -96,24 +124,49 @@ def parse_args(args):
     parser.add_argument(
         "-lowest-value",
         type=float,
-        required=True,
+        required=False,
         help="Lowest value a tile can encode, in real world unit"
     )
 
     parser.add_argument(
         "-value-step",
         type=float,
-        required=True,
+        required=False,
         help="Encoding step between successive values, in real world unit"
     )
 
     parser.add_argument(
         "-channels",
         type=str,
-        required=True,
+        required=False,
         help="Channels on which to encode the data. Can be 'rgb', 'rg' or 'gb', 'r', 'g' or 'b'",
     )
 
+    parser.add_argument(
+        "-precision",
+        type=float,
+        required=False,
+        help="Choose the lowest value and channels from the data for this encoding step, instead of -lowest-value, -value-step and -channels",
+    )
+
+    parser.add_argument(
+        "-encoding-inputs",
+        type=str,
+        nargs="+",
+        required=False,
+        help="GeoTIFFs of every series member of the tileset, whose values -precision covers "
+        "(default: the encoding of the existing index.json, else the values of -input)",
+    )
+
+    parser.add_argument(
+        "-raster-format",
+        type=str,
+        required=False,
+        default="webp",
+        choices=sorted(RASTER_SAVE_OPTIONS),
+        help="Tile image format (lossless)",
+    )
+
     parser.add_argument(
         "-keep-raw-tiles",
         action="store_true",
@@ -150,7 +203,7 @@ def parse_args(args):
         type=str,
         required=False,
         default="unknown",
-        help="Real world unit used in pixel, as part of the JSON metadata payload (eg. '°C', 'millibar', '%', etc.)",
+        help="Real world unit used in pixel, as part of the JSON metadata payload (eg. '°C', 'millibar', '%%', etc.)",
     )
 
     parser.add_argument(
@@ -185,6 +238,27 @@ def parse_args(args):
         help="Identifier of this tileset. Will use this as an intermediate folder between the index file and the tile zoom level",
     )
 
+    parser.add_argument(
+        "-warp-mode",
+        choices=WARP_MODES,
+        default="auto",
+        help="Reprojection intermediate: in memory, tiled GeoTIFF on disk or VRT ('auto': memory if it fits in -warp-memory-mb)",
+    )
+
+    parser.add_argument(
+        "-warp-memory-mb",
+        type=int,
+        default=WARP_MEMORY_MB,
+        help="Memory budget of the reprojection, in MB",
+    )
+
+    parser.add_argument(
+        "-workers",
+        type=int,
+        default=1,
+        help="Number of tiling processes, sharing the warped raster",
+    )
+
     return parser.parse_args(args)
 
 
@@ -274,6 +348,21 @@ def dataset_tile_range(ds, z):
 
 
 
+def tile_translate_options(z: int, x: int, y: int, **kwargs) -> gdal.TranslateOptions:
+    # Define the projection window (bounding box)
+    proj_win = tile_bounds(z, x, y)  # left, top, right, bottom
+    return gdal.TranslateOptions(
+        width=TILE_SIZE,
+        height=TILE_SIZE,
+        projWin=proj_win,
+        projWinSRS='EPSG:3857',
+        outputType=gdal.GDT_Float32,
+        resampleAlg='bilinear',
+        noData=None,
+        **kwargs
+    )
+
+
 def export_raw_raster_tile(z: int, x: int, y: int, src_ds_3857:gdal.Dataset, output_folder: str, keep: bool):
     output_raw_tile_filepath = os.path.join(output_folder, f"{str(z)}/{str(x)}/{str(y)}.tif")
     output_raw_tile_dir = os.path.dirname(output_raw_tile_filepath)
@@ -285,36 +374,16 @@ def export_raw_raster_tile(z: int, x: int, y: int, src_ds_3857:gdal.Dataset, out
     # Creating the output dir for raw tile
     pathlib.Path(output_raw_tile_dir).mkdir(parents=True, exist_ok=True)
 
-    # Define the projection window (bounding box)
-    proj_win = tile_bounds(z, x, y)  # left, top, right, bottom
-
     # Exporting the raw float32 tile as tiff
-    translate_opts = gdal.TranslateOptions(
-        width=TILE_SIZE,
-        height=TILE_SIZE,
-        projWin=proj_win,
-        projWinSRS='EPSG:3857',
-        outputType=gdal.GDT_Float32,
-        resampleAlg='bilinear',
-        noData=None
-    )
+    translate_opts = tile_translate_options(z, x, y)
     dest_name = output_raw_tile_filepath
 
     if not keep:
-        translate_opts = gdal.TranslateOptions(
-            format="MEM", 
-            width=TILE_SIZE,
-            height=TILE_SIZE,
-            projWin=proj_win,
-            projWinSRS='EPSG:3857',
-            outputType=gdal.GDT_Float32,
-            resampleAlg='bilinear',
-            noData=None
-        )
+        translate_opts = tile_translate_options(z, x, y, format="MEM")
         dest_name = ""
 
-
-    out_ds = gdal.Translate(destName=dest_name, srcDS=src_ds_3857, options=translate_opts)
+    with instrumentation.span("gdal.Translate"):
+        out_ds = gdal.Translate(destName=dest_name, srcDS=src_ds_3857, options=translate_opts)
 
     if out_ds is None:
         raise RuntimeError(f"gdal.Translate failed for z={z} x={x} y={y}")
@@ -326,43 +395,76 @@ def export_raw_raster_tile(z: int, x: int, y: int, src_ds_3857:gdal.Dataset, out
     return out_ds
 
 
-def warp_to_web_mercator(input_file, output_folder:str):
+def warp_to_web_mercator(input_file, output_folder:Optional[str], mode:str = "auto", memory_mb:int = WARP_MEMORY_MB):
+    """
+    Reproject a raster to Web Mercator (bilinear).
+    Modes:
+        'mem': the whole warped raster in a MEM dataset.
+        'gtiff': warped chunk by chunk into a tiled, compressed GeoTIFF in `output_folder`
+            (or the temp folder); tiles then read only the blocks they cover.
+        'vrt': nothing is warped upfront, each read reprojects its window from the input.
+        'auto': 'mem' when the warped raster fits in `memory_mb`, 'gtiff' otherwise.
+    Release on-disk intermediates with `close_warped`.
+    """
+    if mode not in WARP_MODES:
+        raise ValueError(f"Unknown warp mode '{mode}', expected one of {WARP_MODES}")
     gdal.UseExceptions()
     gdal.SetConfigOption("GDAL_NUM_THREADS", "ALL_CPUS")
     gdal.PushErrorHandler('CPLQuietErrorHandler')
-    # Optional: gdal.SetConfigOption("GDAL_CACHEMAX", "2048")  # MB
-
-    # warp_opts = gdal.WarpOptions(
-    #     format="GTiff",                 # output GeoTIFF
-    #     # srcSRS="EPSG:4326",
-    #     dstSRS="EPSG:3857",
-    #     resampleAlg="bilinear",            # same as -r cubic
-    #     # same extent flags as your CLI:
-    #     # outputBounds=(-WEBM_HALF, -WEBM_HALF, WEBM_HALF, WEBM_HALF),
-    #     multithread=True,
-    #     warpOptions=["NUM_THREADS=ALL_CPUS"],
-    #     # GTiff creation options (don’t change resolution):
-    #     creationOptions=[
-    #         "TILED=YES",
-    #         "COMPRESS=DEFLATE",
-    #         "BIGTIFF=IF_SAFER",
-    #         "BLOCKXSIZE=512",
-    #         "BLOCKYSIZE=512",
-    #         "COMPRESS=DEFLATE",
-    #     ],
-    # )
-    # ds = gdal.Warp(os.path.join(output_folder, "out.tif"), input_file, options=warp_opts)
-
-    warp_opts = gdal.WarpOptions(
-        format="MEM",                 # not writing it to file
-        # srcSRS="EPSG:4326",
-        # srcSRS="EPSG:3857",
+
+    common_opts = dict(
         dstSRS="EPSG:3857",
         resampleAlg="bilinear",
-        multithread=True,
-        warpOptions=["NUM_THREADS=ALL_CPUS"],
     )
-    ds = gdal.Warp("", input_file, options=warp_opts)
+
+    if mode in ("auto", "vrt"):
+        # A warped VRT only computes the output grid: its size decides the mode
+        vrt_ds = gdal.Warp("", input_file, options=gdal.WarpOptions(format="VRT", **common_opts))
+        if vrt_ds is None:
+            raise RuntimeError("Gdal warp failed.")
+        if mode == "vrt":
+            return vrt_ds
+        band = vrt_ds.GetRasterBand(1)
+        warped_bytes = vrt_ds.RasterXSize * vrt_ds.RasterYSize * vrt_ds.RasterCount * gdal.GetDataTypeSize(band.DataType) // 8
+        mode = "mem" if warped_bytes <= memory_mb * 2**20 else "gtiff"
+        vrt_ds = None
+
+    if mode == "mem":
+        warp_opts = gdal.WarpOptions(
+            format="MEM",                 # not writing it to file
+            multithread=True,
+            warpOptions=["NUM_THREADS=ALL_CPUS"],
+            **common_opts,
+        )
+        with instrumentation.span("gdal.Warp", input=str(input_file)):
+            ds = gdal.Warp("", input_file, options=warp_opts)
+    else:
+        if output_folder:
+            pathlib.Path(output_folder).mkdir(parents=True, exist_ok=True)
+        stem = pathlib.Path(str(input_file)).stem
+        fd, warped_path = tempfile.mkstemp(prefix=f".{stem}.", suffix=WARP_SUFFIX, dir=output_folder or None)
+        os.close(fd)
+        warp_opts = gdal.WarpOptions(
+            format="GTiff",
+            multithread=True,
+            warpOptions=["NUM_THREADS=ALL_CPUS"],
+            # The warper processes the output in chunks of at most this working buffer
+            warpMemoryLimit=memory_mb,
+            creationOptions=WARP_CREATION_OPTIONS,
+            **common_opts,
+        )
+        # The block cache would otherwise hold written blocks up to GDAL's default (5% of RAM).
+        # GDAL_CACHEMAX is only read when the cache is first used, its size is set directly.
+        previous_cache = gdal.GetCacheMax()
+        gdal.SetCacheMax(memory_mb * 2**20)
+        ds = None
+        try:
+            with instrumentation.span("gdal.Warp", input=str(input_file), mode="gtiff"):
+                ds = gdal.Warp(warped_path, input_file, options=warp_opts)
+        finally:
+            gdal.SetCacheMax(previous_cache)
+            if ds is None and os.path.isfile(warped_path):
+                os.remove(warped_path)
 
     if ds is None:
         raise RuntimeError("Gdal warp failed.")
@@ -370,28 +472,16 @@ def warp_to_web_mercator(input_file, output_folder:str):
     return ds
 
 
+def close_warped(ds) -> None:
+    """Close a dataset from `warp_to_web_mercator`, removing its on-disk intermediate if any."""
+    path = ds.GetDescription()
+    ds = None
+    if path.endswith(WARP_SUFFIX) and os.path.isfile(path):
+        os.remove(path)
 
-def export_web_raster_tile(z: int, x: int, y: int, ds: gdal.Dataset, output_folder: str, channels: str, polynomial_slope: float, polynomial_offset: float):
-    band = ds.GetRasterBand(1)
-    tile_data_arr = band.ReadAsArray()
-    nodata_value = band.GetNoDataValue()
-
-    # Clamping the data on the lower end to avoid looping to high values of uint
-    # (Meteo France sometimes has very small negative percent values)
-    tile_data_arr[tile_data_arr < polynomial_offset] = polynomial_offset
-
-    output_web_tile_filepath = os.path.join(output_folder, f"{str(z)}/{str(x)}/{str(y)}.webp")
-    output_web_tile_dir = os.path.dirname(output_web_tile_filepath)
 
-    # print(output_web_tile_filepath)
-
-    # If already existing, we remove it so that we can overwrite it
-    if os.path.isfile(output_web_tile_filepath):
-        os.remove(output_web_tile_filepath)
-
-    # Creating the output dir for raw tile
-    pathlib.Path(output_web_tile_dir).mkdir(parents=True, exist_ok=True)
 
+def encode_tile(tile_data_arr: np.ndarray, nodata_value, channels: str, polynomial_slope: float, polynomial_offset: float) -> np.ndarray:
     channel_list = list(channels)
     nb_channels = len(channels)
 
@@ -407,7 +497,14 @@ def export_web_raster_tile(z: int, x: int, y: int, ds: gdal.Dataset, output_fold
         channel_index = CHANNEL_INDICES[channel]
         processed_channel_arrs.append(all_channel_arrs[channel_index])
 
-    x = ((tile_data_arr - polynomial_offset) / polynomial_slope).astype(np.uint32)
+    # Clamping the codes to what the channels can hold, on both ends, to avoid wrapping around
+    # in the uint conversion (Meteo France sometimes has very small negative percent values).
+    # The input array is left untouched.
+    x = (tile_data_arr - polynomial_offset) / polynomial_slope
+    np.rint(x, out=x)
+    np.clip(x, 0, 256 ** nb_channels - 1, out=x)
+    x[np.isnan(x)] = 0
+    x = x.astype(np.uint32)
 
     if nb_channels == 1:
         np.copyto(processed_channel_arrs[0], x.astype(np.uint8))
@@ -445,21 +542,212 @@ def export_web_raster_tile(z: int, x: int, y: int, ds: gdal.Dataset, output_fold
     output_b[mask] = 0
     output_a[~mask] = 255
 
-    rgba_arr = np.stack([output_r, output_g, output_b, output_a], axis=-1)
+    return np.stack([output_r, output_g, output_b, output_a], axis=-1)
+
+
+
+def export_web_raster_tile(z: int, x: int, y: int, ds: gdal.Dataset, output_folder: str, channels: str, polynomial_slope: float, polynomial_offset: float, raster_format: str = "webp") -> ValueHistogram:
+    """Encode and save a tile. Returns the histogram of its values, counted while they are in memory (see `stats`)."""
+    band = ds.GetRasterBand(1)
+    tile_data_arr = band.ReadAsArray()
+    nodata_value = band.GetNoDataValue()
+
+    histogram = ValueHistogram()
+    with instrumentation.span("tile_stats"):
+        histogram.add(tile_data_arr, nodata_value)
+
+    output_web_tile_filepath = os.path.join(output_folder, f"{str(z)}/{str(x)}/{str(y)}.{raster_format}")
+    output_web_tile_dir = os.path.dirname(output_web_tile_filepath)
+
+    # print(output_web_tile_filepath)
+
+    # If already existing, we remove it so that we can overwrite it
+    if os.path.isfile(output_web_tile_filepath):
+        os.remove(output_web_tile_filepath)
+
+    # Creating the output dir for raw tile
+    pathlib.Path(output_web_tile_dir).mkdir(parents=True, exist_ok=True)
+
+    with instrumentation.span("encode_tile"):
+        rgba_arr = encode_tile(tile_data_arr, nodata_value, channels, polynomial_slope, polynomial_offset)
     web_tile_image = Image.fromarray(rgba_arr)
-    web_tile_image.save(output_web_tile_filepath, lossless=True)
+    with instrumentation.span("Image.save"):
+        web_tile_image.save(output_web_tile_filepath, format=raster_format, **RASTER_SAVE_OPTIONS[raster_format])
+    instrumentation.count("tiles")
+    if instrumentation.is_enabled():
+        instrumentation.count("tile_bytes", os.path.getsize(output_web_tile_filepath))
+    return histogram
+
+
+
+def series_entry(series_axis_value: float, relative_axis_tile_path: str, raster_format: str = "webp") -> dict:
+    return {
+        "tileUrlPattern": os.path.join(relative_axis_tile_path, f"{{z}}/{{x}}/{{y}}.{raster_format}"),
+        "seriesAxisValue": series_axis_value,
+        "metadata": {}
+    }
+
+
+def tileset_index(
+        name: str,
+        description: str,
+        attribution: str,
+        bounds: List[float],
+        minzoom: int,
+        maxzoom: int,
+        channels: str,
+        polynomial_slope: float,
+        polynomial_offset: float,
+        pixel_unit: str,
+        series_axis_name: str,
+        series_axis_unit: str,
+        series: List[dict],
+        raster_format: str = "webp",
+        metadata: Optional[dict] = None,
+        ) -> dict:
+    """Content of the index.json read by the frontend (shadertiledlayer specification)."""
+    return {
+        "name": name,
+        "description": description,
+        "attribution": [attribution],
+        "crs": MERCATOR_CRS,
+        "bounds": bounds,
+        "tileSize": TILE_SIZE,
+        "rasterFormat": raster_format,
+        "minZoom": minzoom,
+        "maxZoom": maxzoom,
+        "metadata": metadata or {},
+        "rasterEncoding": {
+            "channels": channels,
+            "vectorDimension": 1,
+            "polynomialSlope": polynomial_slope,
+            "polynomialOffset": polynomial_offset
+        },
+        "pixelUnit": pixel_unit,
+        "seriesAxisName": series_axis_name,
+        "seriesAxisUnit": series_axis_unit,
+        "series": series
+    }
+
+
+class TileOptions(TypedDict):
+    output_folder: str
+    keep_raw_tiles: bool
+    channels: str
+    value_step: float
+    lowest_value: float
+    raster_format: str
+
+
+def export_tile(z: int, x: int, y: int, src_ds_3857: gdal.Dataset, options: TileOptions) -> ValueHistogram:
+    tile_ds = export_raw_raster_tile(z=z, x=x, y=y, src_ds_3857=src_ds_3857, output_folder=options["output_folder"], keep=options["keep_raw_tiles"])
+    return export_web_raster_tile(z=z, x=x, y=y, ds=tile_ds, output_folder=options["output_folder"], channels=options["channels"], polynomial_slope=options["value_step"], polynomial_offset=options["lowest_value"], raster_format=options["raster_format"])
+
+
+# State of a tiling worker process, set once by `_init_tile_worker`
+_tile_worker = {}
+
+
+def _init_tile_worker(source, options: TileOptions, cache_bytes: int):
+    """`source` is the path or VRT XML of the warped raster, or its `dataplane.SharedRaster`."""
+    if isinstance(source, str):
+        gdal.UseExceptions()
+        # The workers together stay within the memory budget of the warp
+        gdal.SetCacheMax(cache_bytes)
+        _tile_worker["ds"] = gdal.Open(source)
+    else:
+        from mf_toolkit.dataplane import attach_raster
+
+        _tile_worker["ds"] = attach_raster(source)
+    _tile_worker["options"] = options
+
+
+def _export_tile_in_worker(tile):
+    (z, x, y) = tile
+    return tile, export_tile(z, x, y, _tile_worker["ds"], _tile_worker["options"])
+
 
+def _worker_source(src_ds_3857: gdal.Dataset, plane):
+    """What tiling workers open, keeping the memory bound of the warp mode (see `warp_to_web_mercator`)."""
+    if src_ds_3857.GetDriver().ShortName == "VRT":
+        # Each worker reprojects the windows of its tiles from the input
+        return src_ds_3857.GetMetadata("xml:VRT")[0]
+    path = src_ds_3857.GetDescription()
+    if path.endswith(WARP_SUFFIX):
+        # Each worker reads the blocks of its tiles from the on-disk GeoTIFF
+        src_ds_3857.FlushCache()
+        return path
+    return plane.publish_raster(src_ds_3857)
 
 
+def export_tiles_parallel(
+        src_ds_3857: gdal.Dataset,
+        tiles: List[tuple],
+        options: TileOptions,
+        workers: int,
+        stats: SeriesStats,
+        memory_mb: int = WARP_MEMORY_MB,
+        ):
+    """
+    Export `tiles` ((z, x, y) tuples) with a pool of `workers` processes, counting them in `stats`.
+    A raster warped in memory is read once into shared memory: each worker wraps the same pages
+    in an in-memory GDAL dataset instead of re-opening or re-warping the input (see `dataplane`).
+    A raster warped to disk or to a VRT is opened by each worker instead, with a block cache of
+    `memory_mb` / `workers`, so that parallel tiling keeps the memory bound of the warp mode.
+    """
+    import multiprocessing
+    from mf_toolkit.dataplane import DataPlane
+
+    with DataPlane() as plane:
+        source = _worker_source(src_ds_3857, plane)
+        initargs = (source, options, memory_mb * 2**20 // workers)
+        with multiprocessing.Pool(workers, initializer=_init_tile_worker, initargs=initargs) as pool:
+            chunksize = max(1, len(tiles) // (workers * 4))
+            for (z, x, y), histogram in pool.imap_unordered(_export_tile_in_worker, tiles, chunksize=chunksize):
+                print(f"Tile {z}/{x}/{y} ...")
+                stats.add_tile(z, x, y, histogram)
+
+
+def series_encoding(input: str, index_path: str, precision: float, encoding_inputs: Optional[List[str]] = None) -> tuple:
+    """
+    Encoding of a series member at `precision`, the same for every member of a tileset:
+    chosen from the values of `encoding_inputs` (all the members) when given, else that of the
+    tileset index at `index_path` if it exists, else chosen from the values of `input` alone.
+    Returns:
+        (TileEncoding, dict): The encoding and its description in index.json (or None)
+    """
+    from .encoding import auto_encoding, raster_histogram
+
+    existing = None if encoding_inputs else read_index(index_path)
+    if existing is None:
+        return auto_encoding(list(dict.fromkeys([input, *(encoding_inputs or [])])), precision)
+
+    raster_encoding = existing["rasterEncoding"]
+    encoding = {
+        "lowest_value": raster_encoding["polynomialOffset"],
+        "value_step": raster_encoding["polynomialSlope"],
+        "channels": raster_encoding["channels"],
+    }
+    highest_value = encoding["lowest_value"] + encoding["value_step"] * (256 ** len(encoding["channels"]) - 1)
+    histogram = raster_histogram([input])
+    if histogram.count and (histogram.min < encoding["lowest_value"] or histogram.max > highest_value):
+        logging.warning(
+            f"Values of {input} in [{histogram.min}, {histogram.max}] are clipped to the encoding of "
+            f"{index_path}, [{encoding['lowest_value']}, {highest_value}]. Pass every member with -encoding-inputs."
+        )
+    return encoding, (existing.get("metadata") or {}).get("encoding")
+
+
+@instrumentation.traced("create_tileset", profile=True)
 def create_tileset(
         input:str, 
         output:str,
         identifier:str,
         minzoom:int,
         maxzoom:int,
-        lowest_value:float,
-        value_step: float,
-        channels:str,
+        lowest_value:Optional[float],
+        value_step:Optional[float],
+        channels:Optional[str],
         keep_raw_tiles:bool,
         meta_name:str,
         meta_description:str,
@@ -468,7 +756,26 @@ def create_tileset(
         meta_series_axis_name:str,
         meta_series_axis_unit: str,
         meta_series_axis_value:float,
+        precision:Optional[float] = None,
+        raster_format:str = "webp",
+        encoding_metadata:Optional[dict] = None,
+        warp_mode:str = "auto",
+        warp_memory_mb:int = WARP_MEMORY_MB,
+        workers:int = 1,
+        encoding_inputs:Optional[List[str]] = None,
         ):
+    """
+    Tile a GeoTIFF and add it to the series of `{output}/{identifier}/index.json`.
+    With `precision` instead of `lowest_value`/`value_step`/`channels`, the encoding is that of
+    the tileset (see `series_encoding`): chosen from the values of `encoding_inputs`, every
+    member of the series, or taken from the existing index.json. `encoding_metadata` is
+    recorded in the index metadata, under "encoding".
+    `warp_mode` and `warp_memory_mb` bound the memory of the reprojection (see `warp_to_web_mercator`).
+    With `workers` > 1, tiles are cut by that many processes sharing the warped raster, within the
+    same memory bound (see `export_tiles_parallel`).
+    Value statistics of the tiles are counted on the way: their summary is recorded in the series
+    entry (`metadata.stats`), the per-zoom and per-tile details in `{output}/{identifier}/stats.json` (see `stats`).
+    """
 
     if minzoom < 0 or maxzoom < 0:
         raise RuntimeError("minzoom and maxzoom must be 0 or greater.")
@@ -488,194 +795,104 @@ def create_tileset(
         relative_axis_tile_path = str(meta_series_axis_value).replace('.', '-')
         tile_output_folder = os.path.join(tile_output_folder, relative_axis_tile_path)
 
-    mercator_ds = warp_to_web_mercator(input, output_folder)
-
-    tileset_metadata: TilesetMetadata = {
-        "name": meta_name,
-        "description": meta_description,
-        "attribution": [meta_attribution],
-        "crs": "EPSG:3857",
-        "bounds": get_bounds_mercator(mercator_ds),
-        "tileSize": TILE_SIZE,
-        "rasterFormat": "webp",
-        "minZoom": minzoom,
-        "maxZoom": maxzoom,
-        "metadata": {},
-        "rasterEncoding": {
-            "channels": channels,
-            "vectorDimension": 1,
-            "polynomialSlope": value_step,
-            "polynomialOffset": lowest_value
-        },
-        "pixelUnit": meta_pixel_unit,
-        "seriesAxisName": meta_series_axis_name,
-        "seriesAxisUnit": meta_series_axis_unit,
-        "series": [
-            {
-                "tileUrlPattern": os.path.join(relative_axis_tile_path, "{z}/{x}/{y}.webp"),
-                "seriesAxisValue": meta_series_axis_value,
-                "metadata": {}
-            }
-        ]
-    }
-    
     metadata_file_path = os.path.join(output_folder, "index.json")
 
-    # If the index file already exists, we merge the "series" part with the existing
-    if os.path.isfile(metadata_file_path):
-        with open(metadata_file_path, 'r') as f:
-            json_payload = json.load(f)
-
-        # Merge the new series entry into the existing metadata
-        json_payload["series"].append(tileset_metadata["series"][0])
-        json_payload["series"].sort(key=lambda s: s.get("seriesAxisValue", float('-inf')))
-
-        with open(metadata_file_path, 'w') as f:
-            json.dump(json_payload, f, indent=2, ensure_ascii=False)
-        f.close()
+    if lowest_value is None or value_step is None or not channels:
+        if precision is None:
+            raise RuntimeError("Either precision or lowest_value, value_step and channels are required.")
+        encoding, encoding_metadata = series_encoding(input, metadata_file_path, precision, encoding_inputs)
+        lowest_value, value_step, channels = encoding["lowest_value"], encoding["value_step"], encoding["channels"]
+
+    mercator_ds = warp_to_web_mercator(input, output_folder, warp_mode, warp_memory_mb)
+
+    try:
+        tileset_metadata = tileset_index(
+            name=meta_name,
+            description=meta_description,
+            attribution=meta_attribution,
+            bounds=get_bounds_mercator(mercator_ds),
+            minzoom=minzoom,
+            maxzoom=maxzoom,
+            channels=channels,
+            polynomial_slope=value_step,
+            polynomial_offset=lowest_value,
+            pixel_unit=meta_pixel_unit,
+            series_axis_name=meta_series_axis_name,
+            series_axis_unit=meta_series_axis_unit,
+            series=[series_entry(meta_series_axis_value, relative_axis_tile_path, raster_format)],
+            raster_format=raster_format,
+            metadata={"encoding": encoding_metadata} if encoding_metadata else None,
+        )
 
-    # If the file does not exist, it's created
-    else:
-        pathlib.Path(os.path.dirname(metadata_file_path)).mkdir(parents=True, exist_ok=True)
-        f = open(metadata_file_path,'w')
-        json.dump(tileset_metadata, f, indent=2, ensure_ascii=False)
-        f.close()
+        # Checked before any tile is overwritten with another encoding
+        check_encoding(metadata_file_path, tileset_metadata)
 
+        tiles = [
+            (z, x, y)
+            for z in range(minzoom, maxzoom + 1)
+            for (x_min, x_max, y_min, y_max) in [dataset_tile_range(ds=mercator_ds, z=z)]
+            for x in range(x_min, x_max + 1)
+            for y in range(y_min, y_max + 1)
+        ]
+        tile_options = TileOptions(
+            output_folder=tile_output_folder,
+            keep_raw_tiles=keep_raw_tiles,
+            channels=channels,
+            value_step=value_step,
+            lowest_value=lowest_value,
+            raster_format=raster_format,
+        )
 
-    for z in range(minzoom, maxzoom + 1):
-        (x_min, x_max, y_min, y_max) = dataset_tile_range(ds=mercator_ds, z=z)
-        for x in range(x_min, x_max + 1):
-            for y in range(y_min, y_max + 1):
+        stats = SeriesStats(value_step)
+        if workers > 1 and len(tiles) > 1:
+            export_tiles_parallel(mercator_ds, tiles, tile_options, workers, stats, warp_memory_mb)
+        else:
+            for (z, x, y) in tiles:
                 print(f"Tile {z}/{x}/{y} ...")
-                tile_ds = export_raw_raster_tile(z=z, x=x, y=y, src_ds_3857=mercator_ds, output_folder=tile_output_folder, keep=keep_raw_tiles)
-                export_web_raster_tile(z=z, x=x, y=y, ds=tile_ds, output_folder=tile_output_folder, channels=channels, polynomial_slope=value_step, polynomial_offset=lowest_value)
+                stats.add_tile(z, x, y, export_tile(z, x, y, mercator_ds, tile_options))
+    finally:
+        # On-disk intermediates are in the tileset folder: never left behind, even on errors
+        close_warped(mercator_ds)
+        mercator_ds = None
 
-    
+    series = tileset_metadata["series"][0]
+    series["metadata"]["stats"] = stats.summary()
+    merge_stats(os.path.join(output_folder, STATS_FILENAME), [stats.to_json(series)])
 
-# if __name__ == "__main__":
-#     argz = parse_args(sys.argv[1:])
-
-#     create_tileset(
-#         argz.input, 
-#         argz.output,
-#         argz.identifier,
-#         argz.minzoom,
-#         argz.maxzoom,
-#         argz.lowest_value,
-#         argz.value_step,
-#         argz.channels,
-#         argz.keep_raw_tiles,
-#         argz.meta_name,
-#         argz.meta_description,
-#         argz.meta_attribution,
-#         argz.meta_pixel_unit,
-#         argz.meta_series_axis_name,
-#         argz.meta_series_axis_unit,
-#         argz.meta_series_axis_value,
-#         )
-    
-if __name__ == "__main__":
-    all_models = [
-        "CMCC"
-    ]
-    all_indicators = [
-        # "dju",
-        # "tas",
-        "tasmin0",
-        # "rsds",
-        # "ws"
-    ]
-    all_tracc_values = [
-        "15",
-        "20",
-        "27",
-        "40",
-    ]
-    all_months = ["01", "02", "03", "04", "05", "06", "07", "08", "09", "10", "11", "12"]
-
-    tracc_axis_values = {
-        "15": 1.5,
-        "20": 2.0,
-        "27": 2.7,
-        "40": 4.0,
-    }
+    # Merged last, under a lock and replaced as a whole: parallel runs and re-runs of the
+    # same series value leave one entry per series, whose tiles are all there
+    merge_index(metadata_file_path, tileset_metadata)
 
-    lowest_values = {
-        "dju": 0,
-        "tas": -20,
-        "tasmin0": 0,
-        "rsds": 0,
-        "ws": 0,
-    }
-
-    value_steps = {
-        "dju": 1,
-        "tas": 0.01,
-        "tasmin0": 1,
-        "rsds": 0.1,
-        "ws": 0.1,
-    }
-
-    axis_name = {
-        "dju": "TRACC Degree",
-        "tas": "TRACC Degree",
-        "tasmin0": "TRACC Degree",
-        "rsds": "TRACC Degree",
-        "ws": "TRACC Degree",
-    }
+    
 
-    axis_unit = {
-        "dju": "°C",
-        "tas": "°C",
-        "tasmin0": "°C",
-        "rsds": "°C",
-        "ws": "°C",
-    }
+def main(args=None):
+    argz = parse_args(sys.argv[1:] if args is None else args)
+
+    create_tileset(
+        argz.input, 
+        argz.output,
+        argz.identifier,
+        argz.minzoom,
+        argz.maxzoom,
+        argz.lowest_value,
+        argz.value_step,
+        argz.channels,
+        argz.keep_raw_tiles,
+        argz.meta_name,
+        argz.meta_description,
+        argz.meta_attribution,
+        argz.meta_pixel_unit,
+        argz.meta_series_axis_name,
+        argz.meta_series_axis_unit,
+        argz.meta_series_axis_value,
+        precision=argz.precision,
+        raster_format=argz.raster_format,
+        warp_mode=argz.warp_mode,
+        warp_memory_mb=argz.warp_memory_mb,
+        workers=argz.workers,
+        encoding_inputs=argz.encoding_inputs,
+        )
 
-    pixel_unit = {
-        "dju": "°C.day",
-        "tas": "°C",
-        "tasmin0": "jour(s)",
-        "rsds": "W/m²",
-        "ws": "m/s",
-    }
 
-    file_pattern = '/home/jlurie/Downloads/tasmin0_cmcc/{indicator}_{model}_tracc{tracc_value}_{month}.tif'
-
-    # file_pattern = "/home/jlurie/Downloads/rsds/{indicator}_{model}_tracc{tracc_value}_{month}.tif"
-    # file_pattern = "/home/jlurie/Downloads/ws/{indicator}_{model}_tracc{tracc_value}_{month}.tif"
-
-    output_folder = "../frontend/public/tilesets"
-
-    for model in all_models:
-        model_folder = os.path.join(output_folder, model)
-
-        if os.path.isfile(model_folder):
-            os.remove(model_folder)
-
-        for indicator in all_indicators:
-
-            for month in all_months:
-                identifier = f"{indicator}_{month}"
-
-                for tracc_value in all_tracc_values:
-                    input_filepath = file_pattern.replace("{indicator}", indicator).replace("{model}", model).replace("{tracc_value}", tracc_value).replace("{month}", month)
-
-                    create_tileset(
-                        input=input_filepath, 
-                        output=model_folder,
-                        identifier=identifier,
-                        minzoom=0,
-                        maxzoom=6,
-                        lowest_value=lowest_values[indicator],
-                        value_step=value_steps[indicator],
-                        channels="rg",
-                        keep_raw_tiles=False,
-                        meta_name=f"{identifier}_{tracc_value}",
-                        meta_description="",
-                        meta_attribution="Meteo France",
-                        meta_pixel_unit=pixel_unit[indicator],
-                        meta_series_axis_name="TRACC °C",
-                        meta_series_axis_unit=axis_unit[indicator],
-                        meta_series_axis_value=tracc_axis_values[tracc_value],
-                    )
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Lifetime of the shared-memory segments published to worker processes."""
+import os
+import sys
+import subprocess
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from mf_toolkit.dataplane import SEGMENT_PREFIX, DataPlane, attach_array
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="POSIX shared memory in /dev/shm")
+
+
+def _segments():
+    """Segments published by this process still in /dev/shm."""
+    return [name for name in os.listdir("/dev/shm") if name.startswith(f"{SEGMENT_PREFIX}{os.getpid()}_")]
+
+
+def _sum(handle):
+    return float(attach_array(handle).sum())
+
+
+def _fail(handle):
+    attach_array(handle)
+    raise ValueError("worker failure")
+
+
+def test_segments_unlinked_after_workers(capfd):
+    array = np.arange(1000, dtype=np.float32)
+    with DataPlane() as plane:
+        handle = plane.publish_array(array)
+        with multiprocessing.Pool(2) as pool:
+            results = pool.map(_sum, [handle] * 4)
+        # Still there for the owner once the workers exited
+        assert _segments() == [handle["name"]]
+        assert attach_array(handle).sum() == array.sum()
+    assert results == [float(array.sum())] * 4
+    assert _segments() == []
+    # The resource tracker, shared with the workers, saw consistent registrations
+    assert "Traceback" not in capfd.readouterr().err
+
+
+def test_segments_unlinked_after_worker_exception():
+    with pytest.raises(ValueError, match="worker failure"):
+        with DataPlane() as plane:
+            plane.publish_array(np.ones(100))
+            with multiprocessing.Pool(2) as pool:
+                pool.map(_fail, [plane.publish_array(np.zeros(10))] * 2)
+    assert _segments() == []
+
+
+def test_unrelated_process_does_not_unlink():
+    with DataPlane() as plane:
+        handle = plane.publish_array(np.arange(10.0))
+        code = (
+            "import sys; from mf_toolkit.dataplane import attach_array; "
+            f"sys.exit(0 if attach_array({handle!r}).sum() == 45 else 1)"
+        )
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.run([sys.executable, "-c", code], env=env, check=True)
+        assert _segments() == [handle["name"]]
+    assert _segments() == []
@@ -0,0 +1,58 @@
+"""Ensemble statistics accumulated member by member, against their in-memory counterparts."""
+import numpy as np
+import pytest
+import xarray as xr
+
+from mf_toolkit.climato import EnsembleAccumulator
+
+
+def _members(count, seed=0):
+    rng = np.random.default_rng(seed)
+    # A first member far from the others must not bound the median
+    members = [np.ones((12, 3, 4))] + [rng.uniform(100, 400, (12, 3, 4)) for _ in range(count - 1)]
+    members[1][0, 0, 0] = np.nan
+    members[2][:, 2, 3] = members[0][:, 2, 3]
+    return members
+
+
+def _ensemble(members, median=True):
+    ensemble = EnsembleAccumulator()
+    for values in members:
+        ensemble.add(xr.DataArray(values, dims=("month", "y", "x")))
+    if median:
+        for values in members:
+            ensemble.add_median(xr.DataArray(values, dims=("month", "y", "x")))
+    return ensemble.result()
+
+
+def test_statistics_match_stacked_members():
+    members = _members(5)
+    result = _ensemble(members)
+
+    stacked = np.stack(members)
+    np.testing.assert_allclose(result["mean"].values, np.nanmean(stacked, axis=0), rtol=1e-6)
+    np.testing.assert_allclose(result["std"].values, np.nanstd(stacked, axis=0, ddof=1), rtol=1e-5)
+    np.testing.assert_array_equal(result["count"].values, (~np.isnan(stacked)).sum(axis=0))
+
+
+@pytest.mark.parametrize("count", [3, 4, 30])
+def test_median_within_one_bin(count):
+    members = _members(count, seed=count)
+    result = _ensemble(members)
+
+    stacked = np.stack(members)
+    bin_width = (np.nanmax(stacked, axis=0) - np.nanmin(stacked, axis=0)) / 64
+    error = np.abs(result["median"].values - np.nanmedian(stacked, axis=0))
+    # Plus the rounding of float32 results
+    assert np.all(error <= bin_width + 1e-4)
+
+
+def test_median_needs_every_member():
+    members = _members(3)
+    assert "median" not in _ensemble(members, median=False)
+    ensemble = EnsembleAccumulator()
+    for values in members:
+        ensemble.add(xr.DataArray(values, dims=("month", "y", "x")))
+    ensemble.add_median(xr.DataArray(members[0], dims=("month", "y", "x")))
+    with pytest.raises(ValueError, match="median pass"):
+        ensemble.result()
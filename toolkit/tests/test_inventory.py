@@ -0,0 +1,62 @@
+"""Persisted bucket listings, against a local S3 stand-in."""
+import io
+import logging
+
+import pytest
+
+moto_server = pytest.importorskip("moto.server")
+from minio import Minio  # noqa: E402
+
+from mf_toolkit.data.inventory import list_prefixes  # noqa: E402
+
+PREFIX = "CORDEX/CMIP6/DD/EUR-12"
+
+
+class CountingClient:
+    """Minio client counting its listings."""
+
+    def __init__(self, client: Minio) -> None:
+        self.client = client
+        self.listings = 0
+
+    def list_objects(self, *args, **kwargs):
+        self.listings += 1
+        return self.client.list_objects(*args, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def s3():
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    client = Minio(f"{host}:{port}", access_key="test", secret_key="test", secure=False)
+    for bucket, names in {"first": ["a.nc"], "second": ["b.nc", "c.nc"]}.items():
+        client.make_bucket(bucket)
+        for name in names:
+            client.put_object(bucket, f"{PREFIX}/{name}", io.BytesIO(b"x"), 1)
+    yield host, port
+    server.stop()
+
+
+def _list(endpoint, bucket, path):
+    client = CountingClient(Minio(endpoint, access_key="test", secret_key="test", secure=False))
+    listing = list_prefixes([PREFIX], path=path, client=client, bucket=bucket, endpoint=endpoint, secure=False)
+    return [obj["name"].rsplit("/", 1)[-1] for obj in listing[PREFIX]], client.listings
+
+
+def test_listing_reused_from_inventory(s3, tmp_path):
+    endpoint = "%s:%d" % s3
+    path = str(tmp_path / "inventory.json")
+    assert _list(endpoint, "first", path) == (["a.nc"], 1)
+    assert _list(endpoint, "first", path) == (["a.nc"], 0)
+
+
+def test_inventory_keyed_by_endpoint_and_bucket(s3, tmp_path):
+    host, port = s3
+    path = str(tmp_path / "inventory.json")
+    assert _list(f"{host}:{port}", "first", path) == (["a.nc"], 1)
+    # Same prefix in another bucket, then through another endpoint name of the same server
+    assert _list(f"{host}:{port}", "second", path) == (["b.nc", "c.nc"], 1)
+    assert _list(f"localhost:{port}", "first", path) == (["a.nc"], 1)
+    assert _list(f"{host}:{port}", "second", path) == (["b.nc", "c.nc"], 0)
@@ -0,0 +1,160 @@
+"""Run ledger records, and the exports a restarted `compute_files` run skips or retries."""
+import os
+
+import pytest
+
+from mf_toolkit import ledger, pipeline
+from mf_toolkit.ledger import RunLedger, call_with_retry
+
+UNIT = "object|tas|tracc20|07"
+
+
+def _touch(path):
+    with open(path, "w") as f:
+        f.write("x")
+    return path
+
+
+def test_truncated_last_line_ignored(tmp_path):
+    path = str(tmp_path / "ledger.jsonl")
+    output = _touch(str(tmp_path / "out.tif"))
+    RunLedger(path).record(UNIT, "done", "f1", [output])
+    # A crash in the middle of the next write
+    with open(path, "a") as f:
+        f.write('{"unit": "object|tas|tracc20|08", "status": "do')
+
+    run_ledger = RunLedger(path)
+    assert run_ledger.is_done(UNIT, "f1")
+    assert not run_ledger.is_done("object|tas|tracc20|08")
+    # The next record starts on its own line and reads back
+    run_ledger.record("object|tas|tracc20|08", "done", "f1", [output])
+    assert RunLedger(path).is_done("object|tas|tracc20|08", "f1")
+
+
+def test_done_needs_fingerprint_and_outputs(tmp_path):
+    output = _touch(str(tmp_path / "out.tif"))
+    run_ledger = RunLedger(str(tmp_path / "ledger.jsonl"))
+    run_ledger.record(UNIT, "done", "f1", [output])
+    assert run_ledger.is_done(UNIT, "f1")
+    assert not run_ledger.is_done(UNIT, "f2")
+    os.remove(output)
+    assert not run_ledger.is_done(UNIT, "f1")
+
+
+def test_failed_then_done(tmp_path):
+    path = str(tmp_path / "ledger.jsonl")
+    output = _touch(str(tmp_path / "out.tif"))
+    run_ledger = RunLedger(path)
+    run_ledger.record(UNIT, "failed", "f1", error="OSError()")
+    run_ledger.record(UNIT, "failed", "f1", error="OSError()")
+    assert run_ledger.report([UNIT])["failed"] == [{"unit": UNIT, "attempts": 2, "error": "OSError()"}]
+
+    run_ledger.record(UNIT, "done", "f1", [output])
+    report = RunLedger(path).report([UNIT, "object|tas|tracc20|08"])
+    assert report == {"done": [UNIT], "failed": [], "pending": ["object|tas|tracc20|08"]}
+
+
+def test_retry_backoff(monkeypatch):
+    delays = []
+    monkeypatch.setattr(ledger.time, "sleep", delays.append)
+    calls = []
+
+    def flaky():
+        calls.append(None)
+        if len(calls) < 3:
+            raise OSError("read error")
+        return "ok"
+
+    assert call_with_retry(flaky, retries=2, backoff=1.5) == "ok"
+    assert delays == [1.5, 3.0]
+
+    def down():
+        raise OSError("down")
+
+    delays.clear()
+    with pytest.raises(OSError, match="down"):
+        call_with_retry(down, retries=3, backoff=1)
+    assert delays == [1, 2, 4]
+
+    # Other errors are not retried
+    delays.clear()
+    with pytest.raises(ValueError):
+        call_with_retry(lambda: int("x"), retries=3, backoff=1)
+    assert delays == []
+
+
+class FakeLevels:
+    """Stand-in for the computation of a TRACC level, exporting one file per pending month."""
+
+    def __init__(self, failures=0):
+        self.calls = []
+        self.failures = failures
+
+    def __call__(self, name, path, level, output_dir, change, reference_path, windowed, months, on_export):
+        self.calls.append((level, list(months)))
+        if self.failures:
+            self.failures -= 1
+            raise OSError("read error")
+        for month in months:
+            on_export(month, _touch(os.path.join(output_dir, f"{name}_{level}_{month:02d}.tif")))
+
+
+@pytest.fixture
+def compute(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / "data")
+    input_path = _touch(str(tmp_path / "input.nc"))
+    object_name = "SocleM/RCM/EURO-CORDEX/EUR-12/GCM/r1i1p1f1/RCM/ssp370/day/tasAdjust/v/tasAdjust.nc"
+    monkeypatch.setattr(pipeline, "_input_files", lambda *args: [(input_path, object_name)])
+    monkeypatch.setattr(ledger.time, "sleep", lambda delay: None)
+
+    def compute(levels, **kwargs):
+        monkeypatch.setattr(pipeline, "_compute_tracc_level", levels)
+        return pipeline.compute_files("tasmean", {"type": "RCM"}, data_dir=data_dir, backoff=0, **kwargs)
+
+    compute.input_path = input_path
+    compute.output_dir = os.path.join(data_dir, "output", "GCM", "tasmean")
+    return compute
+
+
+def test_compute_files_skips_done_units(compute):
+    levels = FakeLevels()
+    report = compute(levels)
+    assert len(report["done"]) == 36 and not report["failed"] and not report["pending"]
+    assert [level for level, _ in levels.calls] == pipeline.TRACC
+
+    levels = FakeLevels()
+    assert compute(levels)["done"] == report["done"]
+    assert levels.calls == []
+
+
+def test_compute_files_reruns_changed_inputs(compute):
+    compute(FakeLevels())
+    with open(compute.input_path, "a") as f:
+        f.write("changed")
+    levels = FakeLevels()
+    compute(levels)
+    assert [level for level, _ in levels.calls] == pipeline.TRACC
+
+
+def test_compute_files_reruns_missing_outputs(compute):
+    compute(FakeLevels())
+    os.remove(os.path.join(compute.output_dir, "tasmean_tracc27_03.tif"))
+    levels = FakeLevels()
+    compute(levels)
+    assert levels.calls == [("tracc27", [3])]
+
+
+def test_compute_files_retries_then_records_failures(compute):
+    # One I/O error per level is retried within the run
+    levels = FakeLevels(failures=1)
+    assert len(compute(levels, retries=1)["done"]) == 36
+    assert len(levels.calls) == 4
+
+    # Errors past the retries are recorded, and the next run resumes them
+    with open(compute.input_path, "a") as f:
+        f.write("changed")
+    report = compute(FakeLevels(failures=3), retries=0)
+    assert len(report["failed"]) == 36
+    assert {failure["error"] for failure in report["failed"]} == {"OSError('read error')"}
+    report = compute(FakeLevels())
+    assert len(report["done"]) == 36 and not report["failed"]
@@ -0,0 +1,43 @@
+"""Point extraction from the nearest grid cells."""
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from mf_toolkit.climato import xarray_accesor  # noqa: F401  (registers the accessor)
+
+
+def _dataset(shape=(30, 40), days=20):
+    # Rotated lon/lat grid, with a NaN corner
+    yy, xx = np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), indexing="ij")
+    values = np.random.default_rng(0).uniform(260, 300, (days,) + shape).astype(np.float32)
+    values[:, :5, :5] = np.nan
+    return xr.Dataset(
+        {"tasAdjust": (("time", "y", "x"), values)},
+        coords={
+            "time": pd.date_range("2000-01-01", periods=days),
+            "y": np.arange(shape[0]),
+            "x": np.arange(shape[1]),
+            "lon": (("y", "x"), -5.5 + xx * 0.155 + yy * 0.004),
+            "lat": (("y", "x"), 51.5 - yy * 0.108 + xx * 0.002),
+        },
+    )
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_values_of_nearest_cells(tmp_path, lazy):
+    dataset = _dataset()
+    if lazy:
+        path = str(tmp_path / "tasAdjust.nc")
+        dataset.to_netcdf(path)
+        dataset = xr.open_dataset(path)
+    # Sites sharing a row, a column or a cell
+    rows = np.array([12, 3, 12, 25, 3, 12, 2])
+    columns = np.array([5, 30, 5, 17, 8, 39, 2])
+    lon = dataset.lon.values[rows, columns] + 0.01
+    lat = dataset.lat.values[rows, columns] - 0.01
+
+    table = dataset.climato.extract_points(lon, lat, site=list("abcdefg"))
+    for name, row, column in zip("abcdefg", rows, columns):
+        values = table.loc[table["site"] == name, "tasAdjust"].to_numpy()
+        np.testing.assert_array_equal(values, dataset.tasAdjust.isel(y=row, x=column).values)
@@ -0,0 +1,86 @@
+"""float32 indicators against the float64 reference, within half of their tile encoding step."""
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from mf_toolkit.climato import (
+    compute_cached,
+    compute_indicator,
+    compute_precision,
+    list_indicators,
+    reference_climatology,
+)
+from mf_toolkit.climato.indicators.cache import prefix_sums
+from mf_toolkit.tiling.to_web_mercator import CHANNEL_INDICES, encode_tile
+
+SHAPE = (24, 30)
+YEARS = 3
+
+INDICATORS = [
+    spec
+    for spec in list_indicators()
+    if len(spec.variables) == 1 and spec.variables[0] in synthetic.VARIABLE_RANGES
+]
+
+
+def _compute(spec, dtype):
+    dataset = synthetic.daily_dataset(spec.variables[0], years=YEARS, shape=SHAPE)
+    with compute_precision(dtype):
+        return compute_indicator(spec.func, dataset, spec.variables[0])[spec.name].values
+
+
+def _codes(values, encoding):
+    # Code of each pixel, the first channel holding the most significant byte
+    tile = encode_tile(
+        values.astype(np.float32), np.nan, encoding["channels"], encoding["value_step"], encoding["lowest_value"]
+    ).astype(np.int64)
+    codes = np.zeros(tile.shape[:-1], dtype=np.int64)
+    for channel in encoding["channels"]:
+        codes = codes * 256 + tile[..., CHANNEL_INDICES[channel]]
+    return codes
+
+
+@pytest.mark.parametrize("spec", INDICATORS, ids=lambda spec: spec.name)
+def test_float32_within_half_encoding_step(spec):
+    reference = _compute(spec, "float64")
+    result = _compute(spec, "float32")
+
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(np.isnan(result), np.isnan(reference))
+    # A difference below half a step cannot move a value by more than one encoded code
+    atol = spec.encoding["value_step"] / 2
+    np.testing.assert_allclose(result, reference, rtol=0, atol=atol, equal_nan=True)
+
+
+@pytest.mark.parametrize("spec", INDICATORS, ids=lambda spec: spec.name)
+def test_float32_tiles_within_one_code(spec):
+    reference = _compute(spec, "float64")
+    result = _compute(spec, "float32")
+
+    for month in range(reference.shape[0]):
+        difference = np.abs(_codes(result[month], spec.encoding) - _codes(reference[month], spec.encoding))
+        assert difference.max() <= 1
+
+
+def test_cached_results_keyed_by_precision(tmp_path, monkeypatch):
+    # Intermediate results in the default cache directories, under the working directory
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "tasAdjust.nc")
+    synthetic.daily_dataset("tasAdjust", years=YEARS, shape=SHAPE).to_netcdf(path)
+    cache_dir = str(tmp_path / "cache")
+
+    def compute():
+        prefix_sums("dju", path, cache_dir=cache_dir)
+        return [
+            compute_cached("dju", path, cache_dir=cache_dir)["dju"],
+            reference_climatology("dju", "model", path, None, cache_dir=cache_dir)["dju"],
+        ]
+
+    # Cache warmed in float32, then read again in float64
+    for dtype in ["float32", "float64", "float32"]:
+        with compute_precision(dtype):
+            assert [result.dtype for result in compute()] == [np.dtype(dtype)] * 2
+    # Prefix sums are kept in float64, but from series computed in either precision
+    assert len([name for name in os.listdir(cache_dir) if name.startswith("dju_prefix_")]) == 2
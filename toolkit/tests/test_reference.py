@@ -0,0 +1,41 @@
+"""Reference climatologies cached per model, against changes of the historical run."""
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from mf_toolkit.climato import reference_climatology
+
+
+def _write(path, offset, mtime):
+    # Written aside then moved in place, like a new download of the file
+    dataset = synthetic.daily_dataset("tasAdjust", years=2, shape=(10, 12))
+    dataset["tasAdjust"] = dataset.tasAdjust + offset
+    dataset.to_netcdf(f"{path}.tmp")
+    os.utime(f"{path}.tmp", (mtime, mtime))
+    os.replace(f"{path}.tmp", path)
+
+
+def test_reference_recomputed_when_historical_run_changes(tmp_path, monkeypatch):
+    # Indicators in the default cache directory, under the working directory
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "historical.nc")
+    cache_dir = str(tmp_path / "climatologies")
+
+    def reference(path=path):
+        return reference_climatology("tasmean", "model", path, None, cache_dir=cache_dir)["tasmean"].values
+
+    _write(path, 0, 1_700_000_000)
+    first = reference()
+    np.testing.assert_array_equal(reference(None), first)
+
+    _write(path, 5, 1_700_000_100)
+    np.testing.assert_allclose(reference(), first + 5, rtol=1e-6)
+    # Without the file, the latest reference is read back
+    np.testing.assert_allclose(reference(None), first + 5, rtol=1e-6)
+
+
+def test_reference_without_historical_run(tmp_path):
+    with pytest.raises(FileNotFoundError, match="historical run"):
+        reference_climatology("tasmean", "model", cache_dir=str(tmp_path))
@@ -0,0 +1,47 @@
+"""Partial reads of a NetCDF4 file served over HTTP, when the file changes on the server."""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("h5py")
+
+from benchmarks import synthetic  # noqa: E402
+from mf_toolkit.data.remote import open_remote_dataset  # noqa: E402
+
+# Larger than INLINE_BYTES, so that the variable is read by chunks
+ENCODING = {"tasAdjust": {"zlib": True, "shuffle": True, "chunksizes": (30, 40, 50)}}
+
+
+def _write(path, offset, mtime):
+    dataset = synthetic.daily_dataset("tasAdjust", years=2, shape=(40, 50))
+    dataset["tasAdjust"] = dataset.tasAdjust + offset
+    dataset.to_netcdf(path, encoding=ENCODING)
+    # Rewrites within one second keep the same size and Last-Modified otherwise
+    os.utime(path, (mtime, mtime))
+    return dataset.tasAdjust.values
+
+
+def test_changed_object_not_read_from_stale_chunks(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    path = str(served / "tasAdjust.nc")
+    reference_dir = str(tmp_path / "references")
+    chunk_dir = str(tmp_path / "chunks")
+
+    with synthetic.http_stub(str(served)) as base_url:
+        url = f"{base_url}/tasAdjust.nc"
+
+        def read():
+            return open_remote_dataset(url, reference_dir, chunk_dir).tasAdjust.values
+
+        expected = _write(path, 0, 1_700_000_000)
+        np.testing.assert_array_equal(read(), expected)
+        np.testing.assert_array_equal(read(), expected)
+
+        expected = _write(path, 10, 1_700_000_100)
+        np.testing.assert_array_equal(read(), expected)
+
+    # Only the chunks of the current version are kept
+    (object_dir,) = os.listdir(chunk_dir)
+    assert len(os.listdir(os.path.join(chunk_dir, object_dir))) == 1
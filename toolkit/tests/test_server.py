@@ -0,0 +1,144 @@
+"""Tile cache of the on-demand tile server, and warps shared by concurrent requests."""
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from mf_toolkit.tiling import server
+from mf_toolkit.tiling.server import TileCache, TileServer
+
+
+def _tile(size, fill=b"x"):
+    return fill * size
+
+
+def test_memory_lru_bound_and_order():
+    cache = TileCache(max_memory_bytes=300, cache_dir=None, max_disk_bytes=0)
+    for key in "abc":
+        cache.put(key, _tile(100))
+    cache.get("a")  # "b" is now the least recently used
+    cache.put("d", _tile(100))
+    assert [cache.get(key) is not None for key in "abcd"] == [True, False, True, True]
+    assert cache.stats()["memory_bytes"] == 300
+    # Larger than the whole cache: not kept
+    cache.put("e", _tile(301))
+    assert cache.get("e") is None
+    assert cache.stats()["memory_tiles"] == 3
+
+
+def test_disk_lru_bound_and_reload(tmp_path):
+    cache_dir = str(tmp_path / "tiles")
+    cache = TileCache(max_memory_bytes=100, cache_dir=cache_dir, max_disk_bytes=300)
+    for key in ["aa1", "bb2", "cc3"]:
+        cache.put(key, _tile(100, key[0].encode()))
+    # Memory holds the last tile only, the others come back from disk
+    assert cache.stats() == {"memory_tiles": 1, "memory_bytes": 100, "disk_tiles": 3, "disk_bytes": 300}
+    assert cache.get("aa1") == _tile(100, b"a")
+    cache.put("dd4", _tile(100, b"d"))
+    assert cache.get("bb2") is None
+    assert not os.path.exists(os.path.join(cache_dir, "bb", "bb2.webp"))
+
+    # A new cache resumes the disk LRU from the file times, least recently used first
+    for age, key in enumerate(["dd4", "aa1", "cc3"]):
+        os.utime(os.path.join(cache_dir, key[:2], f"{key}.webp"), (1_700_000_000 + age, 1_700_000_000 + age))
+    reloaded = TileCache(max_memory_bytes=100, cache_dir=cache_dir, max_disk_bytes=200)
+    assert reloaded.stats()["disk_tiles"] == 2
+    assert reloaded.get("dd4") is None
+    assert reloaded.get("aa1") == _tile(100, b"a")
+    assert reloaded.get("cc3") == _tile(100, b"c")
+
+
+class FakeSource:
+    """Stand-in for a warped GeoTIFF, waiting for `release` before its warp completes."""
+
+    release = threading.Event()
+    created = []
+    fail = False
+
+    def __init__(self, path):
+        FakeSource.created.append(path)
+        assert FakeSource.release.wait(5)
+        if FakeSource.fail:
+            raise OSError(f"cannot warp {path}")
+        self.path = path
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class WaitedFuture(Future):
+    """Future counting the requests waiting on it."""
+
+    waiting = 0
+
+    def result(self, timeout=None):
+        WaitedFuture.waiting += 1
+        return super().result(timeout)
+
+
+@pytest.fixture
+def tile_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_Source", FakeSource)
+    monkeypatch.setattr(server, "Future", WaitedFuture)
+    WaitedFuture.waiting = 0
+    FakeSource.release.clear()
+    FakeSource.created = []
+    FakeSource.fail = False
+    return TileServer(input_dir=str(tmp_path), cache_dir=None, max_sources=2)
+
+
+def _concurrent_sources(tile_server, path, requests=4):
+    results = [None] * requests
+
+    def request(index):
+        try:
+            results[index] = tile_server.source(path)
+        except OSError as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=request, args=(index,)) for index in range(requests)]
+    for thread in threads:
+        thread.start()
+    # One request warps, the others wait for it
+    while WaitedFuture.waiting < requests - 1:
+        time.sleep(0.001)
+    FakeSource.release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_requests_share_one_warp(tile_server):
+    results = _concurrent_sources(tile_server, "a.tif")
+    assert FakeSource.created == ["a.tif"]
+    assert all(result is results[0] for result in results)
+    assert tile_server.source("a.tif") is results[0]
+    assert tile_server._warming == {}
+
+
+def test_failed_warp_raised_to_every_request_then_retried(tile_server):
+    FakeSource.fail = True
+    results = _concurrent_sources(tile_server, "a.tif")
+    assert FakeSource.created == ["a.tif"]
+    assert all(isinstance(result, OSError) for result in results)
+    assert tile_server._warming == {}
+
+    FakeSource.fail = False
+    assert tile_server.source("a.tif").path == "a.tif"
+    assert FakeSource.created == ["a.tif", "a.tif"]
+
+
+def test_least_recently_used_source_closed(tile_server):
+    FakeSource.release.set()
+    first = tile_server.source("a.tif")
+    tile_server.source("b.tif")
+    tile_server.source("a.tif")
+    tile_server.source("c.tif")
+    second = tile_server.source("a.tif")
+    assert second is first and not first.closed
+    assert FakeSource.created == ["a.tif", "b.tif", "c.tif"]
+    tile_server.close()
+    assert first.closed
@@ -0,0 +1,24 @@
+"""Tileset statistics counted tile by tile."""
+import numpy as np
+
+from mf_toolkit.tiling.encoding import ValueHistogram
+from mf_toolkit.tiling.stats import SeriesStats
+
+
+def _histogram(values):
+    histogram = ValueHistogram()
+    histogram.add(np.asarray(values, dtype=np.float32), None)
+    return histogram
+
+
+def test_summary_from_highest_zoom():
+    stats = SeriesStats(value_step=0.1)
+    # The same member at two zoom levels: one tile at z0, four at z1
+    stats.add_tile(0, 0, 0, _histogram([[1.0, 4.0]]))
+    for x, y, values in [(0, 0, [1.0]), (1, 0, [2.0]), (0, 1, [3.0]), (1, 1, [4.0])]:
+        stats.add_tile(1, x, y, _histogram([values]))
+    assert stats.summary() == {"count": 4, "min": 1.0, "max": 4.0, "mean": 2.5}
+    entry = stats.to_json({"tileUrlPattern": "2-0/{z}/{x}/{y}.webp", "seriesAxisValue": 2.0})
+    assert entry["stats"]["count"] == 4
+    assert sum(entry["stats"]["histogram"]) == 4
+    assert entry["zooms"]["0"]["count"] == 2
@@ -0,0 +1,67 @@
+"""Daily files aggregated from hourly (CPCRCM) inputs, and reused while these do not change."""
+import os
+
+import numpy as np
+import xarray as xr
+
+from benchmarks import synthetic
+from mf_toolkit.climato import compute_indicator, get_indicator
+from mf_toolkit.climato.subdaily import daily_thresholds
+from mf_toolkit.pipeline import daily_file
+
+OBJECT_NAME = (
+    "SocleM-Climat-2025/CPCRCM/EURO-CORDEX/ALP-3/GCM/r1i1p1f1/RCM/ssp370/1hr/tasAdjust/version-hackathon-102025/"
+    "tasAdjust_ALP-3_GCM_ssp370_r1i1p1f1_INST_RCM_v1-r1_ADJ_1hr_20000101-20000229.nc"
+)
+
+
+def _write(path, offset, mtime):
+    # Written aside then moved in place, like a new download of the file
+    dataset = synthetic.hourly_dataset("tasAdjust", days=31, shape=(12, 14))
+    dataset["tasAdjust"] = dataset.tasAdjust + offset
+    dataset.to_netcdf(f"{path}.tmp")
+    os.utime(f"{path}.tmp", (mtime, mtime))
+    os.replace(f"{path}.tmp", path)
+    return dataset.tasAdjust
+
+
+def _daily_files(data_dir):
+    return [name for _, _, names in os.walk(os.path.join(data_dir, "daily")) for name in names]
+
+
+def test_hours_above_threshold_indicator(tmp_path):
+    path = str(tmp_path / "hourly.nc")
+    data_dir = str(tmp_path / "data")
+    hourly = _write(path, 10, 1_700_000_000)
+    spec = get_indicator("tas30h")
+
+    daily_path = daily_file(path, OBJECT_NAME, data_dir, daily_thresholds(spec.variables))
+    with xr.open_dataset(daily_path) as daily:
+        hours = daily[spec.variables[0]].values
+        result = compute_indicator(spec.func, daily, spec.variables[0])["tas30h"]
+    expected = (hourly.values > 303.15).reshape(31, 24, 12, 14).sum(axis=1)
+    np.testing.assert_array_equal(hours[:, 10:, 10:], expected[:, 10:, 10:])
+    assert np.isnan(hours[:, :10, :10]).all()
+    np.testing.assert_allclose(result.values[0, 10:, 10:], expected[:, 10:, 10:].mean(axis=0), rtol=1e-6)
+
+
+def test_daily_file_keyed_by_input_and_thresholds(tmp_path):
+    path = str(tmp_path / "hourly.nc")
+    data_dir = str(tmp_path / "data")
+    _write(path, 0, 1_700_000_000)
+
+    first = daily_file(path, OBJECT_NAME, data_dir)
+    mtime = os.stat(first).st_mtime_ns
+    assert daily_file(path, OBJECT_NAME, data_dir) == first
+    assert os.stat(first).st_mtime_ns == mtime
+
+    with_hours = daily_file(path, OBJECT_NAME, data_dir, {"tasAdjust": [303.15]})
+    assert with_hours != first
+    with xr.open_dataset(with_hours) as daily:
+        assert "tasAdjust_hours_above_303.15" in daily
+
+    _write(path, 5, 1_700_000_100)
+    changed = daily_file(path, OBJECT_NAME, data_dir, {"tasAdjust": [303.15]})
+    assert changed != with_hours
+    # Only the current version is kept
+    assert _daily_files(data_dir) == [os.path.basename(changed)]
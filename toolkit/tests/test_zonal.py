@@ -0,0 +1,29 @@
+"""Zonal means through the sparse cell-to-region matrix."""
+import numpy as np
+import pytest
+import xarray as xr
+
+from mf_toolkit.climato.zonal import build_zonal_weights
+
+
+def _grid(shape, offset=0.0):
+    ny, nx = shape
+    return {"y": np.arange(ny) + offset, "x": np.arange(nx) + offset}
+
+
+def test_means_per_region(tmp_path):
+    regions = xr.DataArray(np.repeat([[0], [1]], 5, axis=1).repeat(2, axis=0), dims=("y", "x"), coords=_grid((4, 5)))
+    data = xr.DataArray(np.arange(20.0).reshape(4, 5), dims=("y", "x"), coords=_grid((4, 5)), name="tas")
+    data[0, 0] = np.nan
+    for _ in range(2):  # computed, then read from the cache
+        table = build_zonal_weights(regions, cache_dir=str(tmp_path)).apply(data)
+        np.testing.assert_allclose(table["tas"], [np.nanmean(data.values[:2]), data.values[2:].mean()])
+
+
+@pytest.mark.parametrize("shape, offset", [((5, 10), 0.0), ((20, 5), 0.0), ((10, 10), 0.5)])
+def test_other_grid_refused(tmp_path, shape, offset):
+    weights = xr.DataArray(np.ones((10, 10)), dims=("y", "x"), coords=_grid((10, 10)))
+    zonal = build_zonal_weights(weights=weights, cache_dir=str(tmp_path))
+    data = xr.DataArray(np.ones(shape), dims=("y", "x"), coords=_grid(shape, offset), name="tas")
+    with pytest.raises(ValueError, match="grid|coordinates"):
+        zonal.apply(data)